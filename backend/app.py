@@ -1,110 +1,300 @@
+import asyncio
+import logging
 import os
 import time
+from typing import Any, Dict, List, Optional
 from dotenv import load_dotenv
 from convex_client import ConvexClient
-from anomaly_detector import AnomalyDetector
+from circuit_breaker import CircuitBreaker
+from detector_registry import DetectorRegistry
+from leases import LeaseManager
+from threshold_config import ThresholdConfig
+from processing import LocalScorer, ResultCache, Scorer, prefetch, split_handled
+from reading_archive import ReadingArchive, default_archive_dir
+from write_behind import WriteBehind
+from rollups import RollupAggregator
+from sharded import ShardedScorer
+from async_pipeline import AsyncPipeline
+from scheduler import AdaptivePollScheduler
+from profiling import PROFILER
+from metrics import (
+    LOOP_ERRORS, PENDING_RECORDS, POLL_FOUND_RECORDS, RECORDS, REGISTRY,
+    configure_logging, observe_scoring, record_write_statuses, start_metrics_server
+)
 
 # Load environment variables
 load_dotenv()
 
 CONVEX_URL = os.getenv("CONVEX_URL_CLOUD", "https://your-deployment.convex.cloud")
-POLL_INTERVAL = int(os.getenv("POLL_INTERVAL", "5"))  # seconds
+# Adaptive polling: immediate re-poll while there is a backlog, backoff between these when idle/failing
+POLL_MIN_INTERVAL = float(os.getenv("POLL_MIN_INTERVAL", "1"))  # seconds
+POLL_MAX_INTERVAL = float(os.getenv("POLL_MAX_INTERVAL", os.getenv("POLL_INTERVAL", "30")))  # seconds
+WINDOW_SIZE = int(os.getenv("WINDOW_SIZE", "20"))  # readings per device
+MAX_DETECTORS = int(os.getenv("MAX_DETECTORS", "1000"))  # resident devices before LRU eviction
+WRITE_BATCH_SIZE = int(os.getenv("WRITE_BATCH_SIZE", "100"))  # results per Convex mutation
+PAGE_SIZE = int(os.getenv("PAGE_SIZE", "200"))  # unprocessed records fetched per page
+PROCESSING_MODE = os.getenv("PROCESSING_MODE", "sync")  # "sync" or "async"
+WRITE_CONCURRENCY = int(os.getenv("WRITE_CONCURRENCY", "4"))  # async mode: parallel write lanes
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "4"))  # async mode: batches buffered per stage
+SCORING_WORKERS = int(os.getenv("SCORING_WORKERS", "1"))  # >1 shards devices across worker processes
+DATA_DIR = os.getenv("DATA_DIR", "")  # default home of the snapshot, archive and write-behind log; empty leaves all three off
+STATE_SNAPSHOT_PATH = os.getenv("STATE_SNAPSHOT_PATH", os.path.join(DATA_DIR, "detector_state.npy") if DATA_DIR else "")  # empty disables snapshots
+SNAPSHOT_INTERVAL = float(os.getenv("SNAPSHOT_INTERVAL", "30"))  # seconds between detector snapshots
+ARCHIVE_DIR = default_archive_dir()  # local per-device/day archive of saved results (ARCHIVE_DIR, else DATA_DIR/archive); empty disables
+WRITE_BEHIND_PATH = os.getenv("WRITE_BEHIND_PATH", os.path.join(DATA_DIR, "write_behind.log") if DATA_DIR else "")  # results/marks queued on disk while Convex is down; empty disables
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", "5"))  # consecutive outage errors before Convex calls fail fast
+BREAKER_RESET = float(os.getenv("BREAKER_RESET", "10"))  # seconds before a trial call is let through again
+ROLLUP_INTERVAL = float(os.getenv("ROLLUP_INTERVAL", "0"))  # >0: seconds between minute/hour/day rollup flushes to Convex (0 disables rollups)
+ROLLUP_MAX_PENDING = int(os.getenv("ROLLUP_MAX_PENDING", "100000"))  # rollup rows held while Convex is unreachable; oldest dropped beyond it
+ROLLUP_MAX_GAP = float(os.getenv("ROLLUP_MAX_GAP", "300"))  # longest reading gap (seconds) counted toward time in a riskState
+DEDUPE_CACHE_SIZE = int(os.getenv("DEDUPE_CACHE_SIZE", "100000"))  # handled sensorData ids remembered so they are never scored twice; 0 disables
+LEASE_TTL = float(os.getenv("LEASE_TTL", "0"))  # seconds; >0 claims device partitions so several pollers can run, 0 processes everything
+POLLER_ID = os.getenv("POLLER_ID", "")  # lease owner id; empty uses hostname-pid-random
+THRESHOLDS_FILE = os.getenv("THRESHOLDS_FILE", "")  # JSON per-site/per-device threshold overrides; empty uses defaults
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))  # Prometheus /metrics endpoint; 0 disables
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")  # Interface to bind; 0.0.0.0 exposes it on every interface
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")  # DEBUG adds one line per scored record
+LOG_RATE_LIMIT = int(os.getenv("LOG_RATE_LIMIT", "10"))  # max repeats of one message per 10s; 0 disables
+
+logger = logging.getLogger("app")
+
+def process_records(convex: ConvexClient, scorer: Scorer, records: List[Dict[str, Any]],
+                    archive: Optional[ReadingArchive] = None, lease_owner: Optional[str] = None,
+                    cache: Optional[ResultCache] = None, outbox: Optional[WriteBehind] = None,
+                    rollups: Optional[RollupAggregator] = None) -> int:
+    """
+    Score a page of records per device and save (and archive) the results; returns how many were saved.
+    With `lease_owner`, results for partitions whose lease was lost meanwhile are rejected by Convex.
+    With `cache`, records this poller already handled are not scored again.
+    With `outbox`, writes Convex cannot take now are queued on disk (and archived once written).
+    With `rollups`, saved results are folded into the per-device time-bucket rollups.
+    """
+    with PROFILER.stage("process_page"):
+        PENDING_RECORDS.set(len(records))
+        writer = outbox or convex
+        if outbox:
+            records = outbox.unqueued(records)
+        resend: List[Dict[str, Any]] = []
+        if cache:
+            records, _, resend = split_handled(cache, writer, records)
+        start = time.perf_counter()
+        with PROFILER.stage("score"):
+            pending, failed_ids = scorer(records)
+        observe_scoring(len(records), time.perf_counter() - start)
+        RECORDS.inc(len(failed_ids), outcome="score_failed")
+        if cache:
+            cache.scored(pending)
+        pending = resend + pending
+    
+        if logger.isEnabledFor(logging.DEBUG):
+            for result_data in pending:
+                threshold_status = result_data["thresholdStatus"]
+                logger.debug(
+                    "%s -> Risk: %s (%s%%) | Z: rain=%.2f soil=%.2f tilt=%.2f | Thresholds: rain=%s soil=%s tilt=%s",
+                    result_data['sensorDataId'], result_data['riskState'], result_data['riskScore'],
+                    result_data['zScoreRain'], result_data['zScoreSoil'], result_data['zScoreTilt'],
+                    threshold_status['rain']['level'], threshold_status['soil']['level'], threshold_status['tilt']['level']
+                )
+    
+        # Save results and mark as processed in batched requests
+        with PROFILER.stage("write"):
+            statuses = writer.add_anomaly_results_batch(pending, batch_size=WRITE_BATCH_SIZE, lease_owner=lease_owner)
+        for status in statuses:
+            if not status.get("ok") and not status.get("queued"):
+                logger.warning("✗ Failed to save result for %s: %s", status.get('sensorDataId'), status.get('error'))
+        if cache:
+            cache.record_statuses(statuses)
+        # Only saved results: failed ones are fetched and scored again
+        saved = [r for r, status in zip(pending, statuses) if status.get("ok")]
+        if archive:
+            with PROFILER.stage("archive"):
+                archive.append(saved)
+        if rollups:
+            with PROFILER.stage("rollups"):
+                rollups.add(saved)
+        PENDING_RECORDS.set(0)
+        return record_write_statuses(statuses)
 
 def main():
     """Main processing loop"""
     
+    configure_logging(LOG_LEVEL, LOG_RATE_LIMIT)
+    # Opt-in stage profiling: PROFILE=1 at startup, or `kill -USR1 <pid>` while running
+    PROFILER.report = logger.info
+    PROFILER.configure_from_env()
+    
     if not CONVEX_URL:
-        print("Error: CONVEX_URL not set in environment variables")
+        logger.error("CONVEX_URL not set in environment variables")
         return
     
-    print(f"Starting Landslide IoT Processing Server")
-    print(f"Convex URL: {CONVEX_URL}")
-    print(f"Poll Interval: {POLL_INTERVAL}s")
-    print("-" * 50)
+    logger.info("Starting Landslide IoT Processing Server")
+    logger.info("Convex URL: %s", CONVEX_URL)
+    logger.info("Poll Interval: %ss-%ss (adaptive)", POLL_MIN_INTERVAL, POLL_MAX_INTERVAL)
+    logger.info("Mode: %s, scoring workers: %d", PROCESSING_MODE, SCORING_WORKERS)
+    if METRICS_PORT:
+        metrics_server = start_metrics_server(METRICS_PORT, METRICS_HOST)
+        host, port = metrics_server.server_address[:2]
+        logger.info("Metrics: http://%s:%d/metrics", host, port)
     
     # Initialize clients
-    convex = ConvexClient(CONVEX_URL)
-    detector = AnomalyDetector(window_size=20)
+    convex = ConvexClient(CONVEX_URL, pool_size=max(10, WRITE_CONCURRENCY + 2),
+                          breaker=CircuitBreaker(BREAKER_FAILURES, BREAKER_RESET))
+    thresholds = ThresholdConfig.from_file(THRESHOLDS_FILE) if THRESHOLDS_FILE else None
+    if thresholds:
+        logger.info("Thresholds: %s (%d site, %d device overrides)", THRESHOLDS_FILE,
+                    len(thresholds.sites), len(thresholds.devices))
+    if SCORING_WORKERS > 1:
+        # Devices hashed onto worker processes, each owning its devices' detectors
+        scorer = ShardedScorer(
+            CONVEX_URL,
+            num_workers=SCORING_WORKERS,
+            window_size=WINDOW_SIZE,
+            max_detectors=MAX_DETECTORS,
+            snapshot_path=STATE_SNAPSHOT_PATH or None,
+            snapshot_interval=SNAPSHOT_INTERVAL,
+            thresholds=thresholds
+        )
+    else:
+        # One detector per device, restored from the local snapshot or warmed from stored results
+        scorer = LocalScorer(DetectorRegistry(
+            window_size=WINDOW_SIZE,
+            max_detectors=MAX_DETECTORS,
+            history_loader=convex.get_device_history,
+            thresholds=thresholds
+        ), snapshot_path=STATE_SNAPSHOT_PATH or None, snapshot_interval=SNAPSHOT_INTERVAL)
+    
+    if STATE_SNAPSHOT_PATH:
+        logger.info("Snapshot: %s", os.path.abspath(STATE_SNAPSHOT_PATH))
+    archive = ReadingArchive(ARCHIVE_DIR) if ARCHIVE_DIR else None
+    if archive:
+        logger.info("Archive: %s", os.path.abspath(ARCHIVE_DIR))
+    
+    rollups = RollupAggregator(convex, interval=ROLLUP_INTERVAL, max_gap=ROLLUP_MAX_GAP,
+                               max_pending=ROLLUP_MAX_PENDING) if ROLLUP_INTERVAL > 0 else None
+    
+    def on_saved(results: List[Dict[str, Any]]):
+        """Results written from the write-behind log"""
+        if archive:
+            archive.append(results)
+        if rollups:
+            rollups.add(results)
+    
+    # Results and processed-marks Convex cannot take during an outage wait here, then flush in large batches
+    outbox = WriteBehind(convex, WRITE_BEHIND_PATH, batch_size=WRITE_BATCH_SIZE,
+                         on_saved=on_saved) if WRITE_BEHIND_PATH else None
+    if outbox:
+        logger.info("Write-behind log: %s", os.path.abspath(WRITE_BEHIND_PATH))
+    
+    cache = ResultCache(DEDUPE_CACHE_SIZE) if DEDUPE_CACHE_SIZE > 0 else None
+    leases = LeaseManager(convex, ttl=LEASE_TTL, owner=POLLER_ID or None) if LEASE_TTL > 0 else None
+    if leases:
+        leases.start()
+        logger.info("Leases: owner %s, ttl %ss", leases.owner, LEASE_TTL)
+    
+    scheduler = AdaptivePollScheduler(floor=POLL_MIN_INTERVAL, ceiling=POLL_MAX_INTERVAL)
+    REGISTRY.register_stats("scheduler", scheduler.stats)
+    REGISTRY.register_stats("scoring", scorer.stats)
+    if archive:
+        REGISTRY.register_stats("archive", archive.stats)
+    if leases:
+        REGISTRY.register_stats("leases", leases.stats)
+    if cache:
+        REGISTRY.register_stats("dedupe", cache.stats)
+    REGISTRY.register_stats("breaker", convex.breaker.stats)
+    if outbox:
+        REGISTRY.register_stats("outbox", outbox.stats)
+    if rollups:
+        REGISTRY.register_stats("rollups", rollups.stats)
+    
+    if PROCESSING_MODE == "async":
+        pipeline = AsyncPipeline(
+            convex,
+            scorer,
+            scheduler=scheduler,
+            queue_size=PIPELINE_QUEUE_SIZE,
+            write_concurrency=WRITE_CONCURRENCY,
+            write_batch_size=WRITE_BATCH_SIZE,
+            page_size=PAGE_SIZE,
+            archive=archive,
+            leases=leases,
+            cache=cache,
+            outbox=outbox,
+            rollups=rollups
+        )
+        REGISTRY.register_stats("pipeline", pipeline.stats)
+        try:
+            asyncio.run(pipeline.run())
+        except KeyboardInterrupt:
+            logger.info("Shutting down gracefully...")
+            logger.info("Pipeline: %s", pipeline.stats())
+            logger.info("Scheduler: %s", scheduler.stats())
+            logger.info("Scoring: %s", scorer.stats())
+        finally:
+            if leases:
+                leases.stop()
+            scorer.close()
+            if rollups:
+                rollups.flush(force=True)
+            if outbox:
+                outbox.close()
+            if archive:
+                archive.close()
+        return
     
     processed_count = 0
     
     while True:
         try:
-            # Fetch unprocessed data
-            unprocessed_data = convex.get_unprocessed_data()
+            # Stream unprocessed data page by page; the next page is fetched while this one is processed
+            found = 0
+            saved_this_poll = 0
+            if outbox and outbox.pending:
+                outbox.flush()
+            # With leases, only this poller's device partitions are read
+            partitions = leases.claim() if leases else None
+            if leases:
+                leases.evict_lost(scorer)
+            lease_owner = leases.owner if leases else None
+            for unprocessed_data in prefetch(convex.iter_unprocessed_pages(PAGE_SIZE, partitions)):
+                found += len(unprocessed_data)
+                saved = process_records(convex, scorer, unprocessed_data, archive, lease_owner, cache, outbox, rollups)
+                saved_this_poll += saved
+                processed_count += saved
+                logger.info("✓ Saved %d/%d results (total processed: %d)", saved, len(unprocessed_data), processed_count)
             
-            if unprocessed_data:
-                print(f"\n[{time.strftime('%Y-%m-%d %H:%M:%S')}] Found {len(unprocessed_data)} unprocessed records")
-                
-                for data in unprocessed_data:
-                    try:
-                        # Extract sensor values
-                        rain = data.get("rainValue", 0.0)
-                        soil = data.get("soilMoisture", 0.0)
-                        tilt = data.get("tiltValue", 0.0)
-                        sensor_id = data.get("_id")
-                        timestamp = data.get("timestamp")
-                        
-                        # Calculate risk using hybrid approach (Z-score + Thresholds)
-                        risk_score, risk_state, z_scores = detector.update_and_score(rain, soil, tilt)
-                        
-                        # Get threshold data
-                        threshold_status = detector.get_threshold_data(rain, soil, tilt)
-                        thresholds = detector.get_thresholds()
-                        rolling_mean = detector.get_rolling_mean()
-                        
-                        print(f"  Processing {sensor_id[:8]}... -> Risk: {risk_state} ({risk_score}%)")
-                        print(f"    Z-Scores: Rain={z_scores['rain']:.2f}, Soil={z_scores['soil']:.2f}, Tilt={z_scores['tilt']:.2f}")
-                        print(f"    Thresholds: Rain={threshold_status['rain']['level']}, Soil={threshold_status['soil']['level']}, Tilt={threshold_status['tilt']['level']}")
-                        
-                        # Prepare result data with enhanced information
-                        result_data = {
-                            "sensorDataId": sensor_id,
-                            "timestamp": timestamp,
-                            "rainValue": float(rain),
-                            "soilMoisture": float(soil),
-                            "tiltValue": float(tilt),
-                            "riskScore": float(risk_score),
-                            "riskState": risk_state,
-                            "zScoreRain": float(z_scores["rain"]),
-                            "zScoreSoil": float(z_scores["soil"]),
-                            "zScoreTilt": float(z_scores["tilt"]),
-                            # New fields for hybrid approach
-                            "thresholdStatus": {
-                                "rain": threshold_status['rain'],
-                                "soil": threshold_status['soil'],
-                                "tilt": threshold_status['tilt']
-                            },
-                            "thresholds": thresholds,
-                            "rollingMean": rolling_mean
-                        }
-                        
-                        # Save result to Convex
-                        if convex.add_anomaly_result(result_data):
-                            # Mark as processed
-                            convex.mark_as_processed(sensor_id)
-                            processed_count += 1
-                            print(f"    ✓ Saved to database (Total processed: {processed_count})")
-                        else:
-                            print(f"    ✗ Failed to save result")
-                            
-                    except Exception as e:
-                        print(f"    ✗ Error processing record: {e}")
-                        continue
-            else:
-                # No data to process
-                print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] No unprocessed data. Waiting...", end="\r")
+            POLL_FOUND_RECORDS.set(found)
+            if rollups:
+                rollups.flush()
+            if not found:
+                logger.debug("No unprocessed data. Waiting...")
             
-            # Wait before next poll
-            time.sleep(POLL_INTERVAL)
+            # Poll again at once while draining a backlog; back off if idle or nothing could be saved
+            scheduler.wait(saved_this_poll, error=found > 0 and saved_this_poll == 0)
             
         except KeyboardInterrupt:
-            print("\n\nShutting down gracefully...")
-            print(f"Total records processed: {processed_count}")
+            logger.info("Shutting down gracefully...")
+            logger.info("Total records processed: %d", processed_count)
+            logger.info("Scoring: %s", scorer.stats())
+            logger.info("Scheduler: %s", scheduler.stats())
             break
         except Exception as e:
-            print(f"\n✗ Error in main loop: {e}")
-            time.sleep(POLL_INTERVAL)
+            logger.error("✗ Error in main loop: %s", e)
+            LOOP_ERRORS.inc()
+            PENDING_RECORDS.set(0)
+            try:
+                scheduler.wait(0, error=True)
+            except KeyboardInterrupt:
+                break
+    
+    if leases:
+        leases.stop()
+    scorer.close()
+    if rollups:
+        rollups.flush(force=True)
+    if outbox:
+        outbox.close()
+    if archive:
+        archive.close()
 
 if __name__ == "__main__":
     main()
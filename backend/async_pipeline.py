@@ -0,0 +1,244 @@
+import asyncio
+import logging
+import time
+import zlib
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+from convex_client import ConvexClient
+from leases import LeaseManager, lease_page_partitions
+from processing import ResultCache, Scorer, split_handled
+from reading_archive import ReadingArchive
+from write_behind import WriteBehind
+from rollups import RollupAggregator
+from scheduler import AdaptivePollScheduler
+from metrics import LOOP_ERRORS, PENDING_RECORDS, POLL_FOUND_RECORDS, RECORDS, observe_scoring, record_write_statuses
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncPipeline:
+    """
+    Asyncio processing mode: fetch, score and write run as overlapping stages.
+
+    Stages are connected by bounded queues, so a slow stage applies
+    backpressure to the ones before it. Writes go through `write_concurrency`
+    lanes; a device always maps to the same lane, so its results are written
+    in order while different devices are written concurrently.
+
+    HTTP calls run on worker threads against the client's pooled keep-alive
+    session, so the event loop never blocks on the network.
+
+    With `leases`, each fetch pass first claims this poller's device
+    partitions and reads only those, and writes carry the lease owner. With
+    `cache`, records this poller already handled are not scored again. With
+    `outbox`, writes Convex cannot take now are queued on disk and flushed at
+    the start of each fetch pass. With `rollups`, saved results are folded
+    into the time-bucket rollups, which are flushed from the fetch stage.
+    """
+
+    def __init__(self, convex: ConvexClient, scorer: Scorer,
+                 scheduler: Optional[AdaptivePollScheduler] = None,
+                 queue_size: int = 4, write_concurrency: int = 4, write_batch_size: int = 100,
+                 page_size: int = 200, archive: Optional[ReadingArchive] = None,
+                 leases: Optional[LeaseManager] = None, cache: Optional[ResultCache] = None,
+                 outbox: Optional[WriteBehind] = None, rollups: Optional[RollupAggregator] = None):
+        self.convex = convex
+        self.scorer = scorer
+        self.scheduler = scheduler or AdaptivePollScheduler()
+        self.queue_size = queue_size
+        self.write_concurrency = max(1, write_concurrency)
+        self.write_batch_size = write_batch_size
+        self.page_size = page_size
+        self.archive = archive
+        self.leases = leases
+        self.cache = cache
+        self.outbox = outbox
+        self.writer = outbox or convex
+        self.rollups = rollups
+
+        # Records fetched but not yet written; a re-poll must not pick them up again
+        self._in_flight: Set[str] = set()
+        # Records written since the last fetch started; that fetch may still see them unprocessed
+        self._recently_written: Set[str] = set()
+        self._progress: Optional[asyncio.Event] = None
+
+        # Counters
+        self.fetched = 0
+        self.scored = 0
+        self.written = 0
+        self.queued = 0
+        self.failed = 0
+
+    async def run(self):
+        """Run all stages until cancelled"""
+        self._progress = asyncio.Event()
+        score_queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        lanes: List[asyncio.Queue] = [
+            asyncio.Queue(maxsize=self.queue_size) for _ in range(self.write_concurrency)
+        ]
+
+        tasks = [
+            asyncio.create_task(self._fetch_stage(score_queue)),
+            asyncio.create_task(self._score_stage(score_queue, lanes)),
+        ]
+        tasks.extend(asyncio.create_task(self._write_stage(lane)) for lane in lanes)
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _fetch_stage(self, score_queue: asyncio.Queue):
+        """Page through unprocessed records; start a new pass immediately while there is a backlog"""
+        while True:
+            found, error = await self._fetch_pass(score_queue)
+            POLL_FOUND_RECORDS.set(found)
+            if self.rollups:
+                await asyncio.to_thread(self.rollups.flush)
+            delay = self.scheduler.next_delay(found, error)
+            if delay:
+                # Idle, failing, or everything returned is still in flight: wait for a write or the backoff
+                self._progress.clear()
+                try:
+                    await asyncio.wait_for(self._progress.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def _fetch_pass(self, score_queue: asyncio.Queue) -> Tuple[int, bool]:
+        """One pass over the unprocessed pages; returns (new records queued, whether a fetch failed)"""
+        found = 0
+        if self.outbox and self.outbox.pending:
+            await asyncio.to_thread(self.outbox.flush)
+        try:
+            fetchers = await self._page_fetchers()
+        except Exception as e:
+            logger.error("✗ Error claiming leases: %s", e)
+            return found, True
+        for fetch in fetchers:
+            cursor = None
+            while True:
+                settled = set(self._recently_written)  # Committed before this query starts
+                try:
+                    result = await asyncio.to_thread(fetch, cursor)
+                except Exception as e:
+                    logger.error("✗ Error fetching unprocessed data page: %s", e)
+                    return found, True
+                fresh = [
+                    r for r in result.get("page", [])
+                    if r.get("_id") not in self._in_flight and r.get("_id") not in self._recently_written
+                ]
+                if self.outbox:
+                    fresh = self.outbox.unqueued(fresh)
+                self._recently_written -= settled
+
+                if fresh:
+                    self._in_flight.update(r["_id"] for r in fresh)
+                    PENDING_RECORDS.set(len(self._in_flight))
+                    self.fetched += len(fresh)
+                    found += len(fresh)
+                    logger.info("Fetched %d records (%d in flight)", len(fresh), len(self._in_flight))
+                    await score_queue.put(fresh)  # Blocks while the scorer is behind
+
+                if result.get("isDone") or not result.get("page"):
+                    break
+                cursor = result.get("continueCursor")
+        return found, False
+
+    async def _page_fetchers(self) -> List[Callable[[Optional[str]], Dict[str, Any]]]:
+        """cursor -> page functions for this pass: every unprocessed row, or the held lease partitions"""
+        if self.leases is None:
+            return [lambda cursor: self.convex.get_unprocessed_page(cursor, self.page_size)]
+        partitions = await asyncio.to_thread(self.leases.claim)
+        return [
+            lambda cursor, p=partition: self.convex.get_unprocessed_partition_page(p, cursor, self.page_size)
+            for partition in lease_page_partitions(partitions)
+        ]
+
+    async def _score_stage(self, score_queue: asyncio.Queue, lanes: List[asyncio.Queue]):
+        """Score fetched records per device and hand results to their write lanes"""
+        while True:
+            records = await score_queue.get()
+            try:
+                by_lane, failed_ids, skipped_ids = await asyncio.to_thread(self._score, records)
+            except Exception as e:
+                logger.error("✗ Error scoring records: %s", e)
+                LOOP_ERRORS.inc()
+                RECORDS.inc(len(records), outcome="score_failed")
+                self._release(r.get("_id") for r in records)
+                continue
+            RECORDS.inc(len(failed_ids), outcome="score_failed")
+            self._release(failed_ids + skipped_ids)
+
+            for lane, results in zip(lanes, by_lane):
+                for start in range(0, len(results), self.write_batch_size):
+                    await lane.put(results[start:start + self.write_batch_size])
+
+    def _score(self, records: List[Dict[str, Any]]) -> Tuple[List[List[Dict[str, Any]]], List[str], List[str]]:
+        """
+        Score records (on a worker thread); returns results per write lane, ids
+        that failed and ids skipped as already saved
+        """
+        if self.leases:
+            self.leases.evict_lost(self.scorer)
+        resend: List[Dict[str, Any]] = []
+        skipped_ids: List[str] = []
+        if self.cache:
+            records, skipped_ids, resend = split_handled(self.cache, self.writer, records)
+        start = time.perf_counter()
+        results, failed_ids = self.scorer(records)
+        observe_scoring(len(records), time.perf_counter() - start)
+        if self.cache:
+            self.cache.scored(results)
+        by_lane: List[List[Dict[str, Any]]] = [[] for _ in range(self.write_concurrency)]
+        for result in resend + results:
+            by_lane[self._lane_for(result.get("deviceId"))].append(result)
+        self.scored += len(results)
+        return by_lane, failed_ids, skipped_ids
+
+    def _lane_for(self, device_id: Optional[str]) -> int:
+        """Stable device -> write lane mapping"""
+        return zlib.crc32((device_id or "").encode()) % self.write_concurrency
+
+    async def _write_stage(self, lane: asyncio.Queue):
+        """Write one lane's batches in order"""
+        while True:
+            batch = await lane.get()
+            statuses = await asyncio.to_thread(
+                self.writer.add_anomaly_results_batch, batch, True, self.write_batch_size,
+                self.leases.owner if self.leases else None
+            )
+            for status in statuses:
+                if status.get("ok"):
+                    self.written += 1
+                    self._recently_written.add(status.get("sensorDataId"))
+                elif status.get("queued"):
+                    self.queued += 1
+                else:
+                    self.failed += 1
+                    logger.warning("✗ Failed to save result for %s: %s", status.get('sensorDataId'), status.get('error'))
+            record_write_statuses(statuses)
+            if self.cache:
+                self.cache.record_statuses(statuses)
+            saved = [r for r, status in zip(batch, statuses) if status.get("ok")]
+            if self.archive:
+                await asyncio.to_thread(self.archive.append, saved)
+            if self.rollups:
+                await asyncio.to_thread(self.rollups.add, saved)
+            self._release(r["sensorDataId"] for r in batch)
+
+    def _release(self, sensor_data_ids):
+        """Forget in-flight records so failed ones can be fetched again"""
+        self._in_flight.difference_update(sensor_data_ids)
+        PENDING_RECORDS.set(len(self._in_flight))
+        if self._progress is not None:
+            self._progress.set()
+
+    def stats(self) -> Dict[str, int]:
+        """Counters for monitoring"""
+        return {
+            'fetched': self.fetched,
+            'scored': self.scored,
+            'written': self.written,
+            'queued': self.queued,
+            'failed': self.failed,
+            'inFlight': len(self._in_flight)
+        }
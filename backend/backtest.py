@@ -0,0 +1,316 @@
+"""
+Offline backtest: re-score archived readings under alternate detector configs.
+
+Streams each device's readings from the local reading archive (ARCHIVE_DIR,
+see reading_archive.py) through many AnomalyDetector configurations at once
+and reports, per config, how alert volume would change:
+
+  - alerts: entries into High (from any other state), and devices alerted
+  - time in High (reading-to-next-reading time, gaps capped by --max-gap)
+  - state counts and state transitions
+
+Configs that share a window size share one rolling z-score pass; each config
+then only adds the vectorized threshold/hybrid combination. Devices are spread
+over worker processes, and each device is read in bounded chunks through memmaps.
+Results follow update_and_score exactly; --verify re-runs the sequential path
+on a sample to confirm it.
+
+    python backtest.py --window 10,20,40 --z-boost 2.5,3
+    python backtest.py --thresholds default,strict.json --start 2025-01-01 --end 2026-01-01 --workers 8
+    python backtest.py --configs configs.json --output backtest.json
+
+A --thresholds file holds per-sensor overrides ({"tilt": {"warning": 10}}) or a
+THRESHOLDS_FILE-style {"default": {...}}. A --configs file is a list of
+{"name", "windowSize", "zBoost", "thresholds"} objects.
+"""
+
+import argparse
+import itertools
+import json
+import multiprocessing as mp
+import os
+import time
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+
+from anomaly_detector import (SENSORS, RISK_STATES, DEFAULT_THRESHOLDS, AnomalyDetector, ThresholdTable,
+                              compile_thresholds, hybrid_levels, merge_thresholds)
+from reading_archive import ReadingArchive, default_archive_dir
+
+load_dotenv()
+
+ARCHIVE_DIR = default_archive_dir()
+
+STATES = RISK_STATES + ('Initializing',)
+HIGH = STATES.index('High')
+INITIALIZING = STATES.index('Initializing')
+
+# Upper bound on window_size * chunk length (batch_zscores memory is proportional to it)
+CHUNK_ELEMENTS = 1 << 22
+
+
+class BacktestConfig(NamedTuple):
+    """One detector configuration to replay"""
+    name: str
+    window_size: int = 20
+    z_boost: float = 3.0
+    thresholds: Optional[Dict[str, Dict[str, Any]]] = None  # Per-sensor overrides of DEFAULT_THRESHOLDS
+
+    def table(self) -> ThresholdTable:
+        return compile_thresholds(merge_thresholds(DEFAULT_THRESHOLDS, self.thresholds))
+
+
+class ConfigStats:
+    """Alert statistics of one config, accumulated chunk by chunk and device by device"""
+
+    __slots__ = ('readings', 'state_counts', 'transitions', 'high_ms', 'devices', 'devices_alerted',
+                 '_prev_level', '_prev_ts', '_alerted')
+
+    def __init__(self):
+        self.readings = 0
+        self.state_counts = np.zeros(len(STATES), dtype=np.int64)
+        self.transitions = np.zeros((len(STATES), len(STATES)), dtype=np.int64)  # [from, to]
+        self.high_ms = 0
+        self.devices = 0
+        self.devices_alerted = 0
+        self._prev_level: Optional[int] = None
+        self._prev_ts = 0
+        self._alerted = False
+
+    def add(self, levels: np.ndarray, timestamps: np.ndarray, max_gap_ms: int):
+        """Account for the next chunk of one device's readings (in order)"""
+        if not len(levels):
+            return
+        self.readings += len(levels)
+        self.state_counts += np.bincount(levels, minlength=len(STATES))
+
+        # Pair each reading with the one before it, carrying over the previous chunk's last reading.
+        # A device's first reading is always Initializing (fresh detector), so pairs see every alert.
+        if self._prev_level is not None:
+            levels = np.concatenate(([self._prev_level], levels))
+            timestamps = np.concatenate(([self._prev_ts], timestamps))
+        before, after = levels[:-1], levels[1:]
+        self.transitions += np.bincount(before * len(STATES) + after,
+                                        minlength=len(STATES) ** 2).reshape(len(STATES), len(STATES))
+        gaps = np.clip(np.diff(timestamps), 0, max_gap_ms)
+        self.high_ms += int(gaps[before == HIGH].sum())
+        self._alerted = self._alerted or bool(((before != HIGH) & (after == HIGH)).any())
+
+        self._prev_level = int(levels[-1])
+        self._prev_ts = int(timestamps[-1])
+
+    def end_device(self):
+        self.devices += 1
+        self.devices_alerted += self._alerted
+        self._prev_level = None
+        self._alerted = False
+
+    def merge(self, other: "ConfigStats"):
+        self.readings += other.readings
+        self.state_counts += other.state_counts
+        self.transitions += other.transitions
+        self.high_ms += other.high_ms
+        self.devices += other.devices
+        self.devices_alerted += other.devices_alerted
+
+    def to_dict(self) -> Dict[str, Any]:
+        changes = self.transitions.copy()
+        np.fill_diagonal(changes, 0)
+        changes[INITIALIZING, :] = 0  # Leaving warm-up is not a change of risk
+        return {
+            "readings": self.readings,
+            "alerts": int(self.transitions[:, HIGH].sum() - self.transitions[HIGH, HIGH]),
+            "devices": self.devices,
+            "devicesAlerted": self.devices_alerted,
+            "timeInHighHours": round(self.high_ms / 3.6e6, 2),
+            "highFraction": round(float(self.state_counts[HIGH]) / self.readings, 5) if self.readings else 0.0,
+            "stateCounts": {state: int(n) for state, n in zip(STATES, self.state_counts)},
+            "stateChanges": int(changes.sum()),
+            "transitions": {f"{STATES[a]}->{STATES[b]}": int(changes[a, b])
+                            for a in range(len(STATES)) for b in range(len(STATES)) if changes[a, b]},
+        }
+
+
+def score_levels(chunks: Iterator[np.ndarray], configs: List[BacktestConfig]) -> Iterator[Tuple[np.ndarray, Dict[str, np.ndarray]]]:
+    """
+    State indexes of one device's archived readings under every config, chunk
+    by chunk: yields (timestamps, {config name: levels}). One rolling z-score
+    pass per distinct window size and one classification per distinct
+    threshold table are shared by all configs that use them.
+    """
+    detectors = {w: AnomalyDetector(window_size=w) for w in sorted({c.window_size for c in configs})}
+    tables = {c.name: c.table() for c in configs}
+    for records in chunks:
+        values = {key: np.asarray(records[key], dtype=np.float64) for key in SENSORS}
+        zscores = {w: detector.batch_zscores(values) for w, detector in detectors.items()}
+        codes: Dict[int, np.ndarray] = {}
+        levels = {}
+        for config in configs:
+            table = tables[config.name]
+            if id(table) not in codes:
+                codes[id(table)] = table.classify_batch(values)[1]
+            z, _, initializing = zscores[config.window_size]
+            _, levels[config.name] = hybrid_levels(z['rain'], z['soil'], z['tilt'], codes[id(table)],
+                                                   table, initializing, config.z_boost)
+        yield np.asarray(records['timestamp']), levels
+
+
+def _device_chunks(archive: ReadingArchive, device_id: Optional[str], start: Optional[str], end: Optional[str],
+                   chunk_size: int) -> Iterator[np.ndarray]:
+    """A device's records in order, as chunks of about chunk_size (short days are coalesced)"""
+    pending: List[np.ndarray] = []
+    pending_count = 0
+    for _, records in archive.iter_days(device_id, start, end):
+        for offset in range(0, len(records), chunk_size):
+            part = records[offset:offset + chunk_size]
+            pending.append(part)
+            pending_count += len(part)
+            if pending_count >= chunk_size:
+                yield np.concatenate(pending)
+                pending, pending_count = [], 0
+    if pending:
+        yield np.concatenate(pending)
+
+
+def backtest_device(archive_root: str, device_id: Optional[str], configs: List[BacktestConfig],
+                    start: Optional[str] = None, end: Optional[str] = None,
+                    max_gap_ms: int = 3_600_000) -> Dict[str, ConfigStats]:
+    """Per-config statistics for one device"""
+    archive = ReadingArchive(archive_root)
+    chunk_size = max(1024, CHUNK_ELEMENTS // max(c.window_size for c in configs))
+    stats = {config.name: ConfigStats() for config in configs}
+    for timestamps, levels in score_levels(_device_chunks(archive, device_id, start, end, chunk_size), configs):
+        for name, config_levels in levels.items():
+            stats[name].add(config_levels, timestamps, max_gap_ms)
+    for config_stats in stats.values():
+        config_stats.end_device()
+    return stats
+
+
+def _backtest_device_job(args) -> Dict[str, ConfigStats]:
+    return backtest_device(*args)
+
+
+def run_backtest(archive_root: str, configs: List[BacktestConfig], devices: Optional[List[Optional[str]]] = None,
+                 start: Optional[str] = None, end: Optional[str] = None, max_gap_ms: int = 3_600_000,
+                 workers: int = 1) -> Dict[str, ConfigStats]:
+    """Per-config statistics over all (or the given) archived devices"""
+    if devices is None:
+        devices = ReadingArchive(archive_root).devices()
+    totals = {config.name: ConfigStats() for config in configs}
+    jobs = [(archive_root, device_id, configs, start, end, max_gap_ms) for device_id in devices]
+    if workers > 1 and len(jobs) > 1:
+        with mp.Pool(min(workers, len(jobs))) as pool:
+            results = pool.imap_unordered(_backtest_device_job, jobs)
+            for device_stats in results:
+                for name, config_stats in device_stats.items():
+                    totals[name].merge(config_stats)
+    else:
+        for job in jobs:
+            for name, config_stats in _backtest_device_job(job).items():
+                totals[name].merge(config_stats)
+    return totals
+
+
+def verify(archive_root: str, device_id: Optional[str], configs: List[BacktestConfig],
+           limit: int) -> Dict[str, int]:
+    """Mismatches between the backtest engine and sequential update_and_score on a device's first readings"""
+    archive = ReadingArchive(archive_root)
+    records = next(_device_chunks(archive, device_id, None, None, limit), None)
+    if records is None:
+        return {config.name: 0 for config in configs}
+    _, levels = next(score_levels(iter([records]), configs))
+    mismatches = {}
+    for config in configs:
+        detector = AnomalyDetector(window_size=config.window_size, thresholds=config.table(),
+                                   z_boost=config.z_boost)
+        expected = [STATES.index(detector.update_and_score(r, s, t)[1])
+                    for r, s, t in zip(records['rain'].tolist(), records['soil'].tolist(), records['tilt'].tolist())]
+        mismatches[config.name] = int((levels[config.name] != np.array(expected)).sum())
+    return mismatches
+
+
+def _load_thresholds(spec: str) -> Optional[Dict[str, Dict[str, Any]]]:
+    if spec == "default":
+        return None
+    with open(spec) as f:
+        rules = json.load(f)
+    return rules.get("default", rules)
+
+
+def build_configs(args) -> List[BacktestConfig]:
+    """Configs from --configs, or the grid of --window x --z-boost x --thresholds"""
+    if args.configs:
+        with open(args.configs) as f:
+            return [BacktestConfig(c.get("name", f"config{i}"), int(c.get("windowSize", 20)),
+                                   float(c.get("zBoost", 3.0)), c.get("thresholds"))
+                    for i, c in enumerate(json.load(f))]
+    windows = [int(w) for w in args.window.split(",")]
+    boosts = [float(z) for z in args.z_boost.split(",")]
+    thresholds = args.thresholds.split(",")
+    return [
+        BacktestConfig(f"w={w} z={z:g} t={os.path.splitext(os.path.basename(t))[0]}", w, z, _load_thresholds(t))
+        for w, z, t in itertools.product(windows, boosts, thresholds)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-score archived readings under alternate detector configs")
+    parser.add_argument("--archive", default=ARCHIVE_DIR or None, required=not ARCHIVE_DIR,
+                        help="reading archive directory (default: ARCHIVE_DIR, else DATA_DIR/archive)")
+    parser.add_argument("--window", default="20", help="comma-separated window sizes")
+    parser.add_argument("--z-boost", default="3", help="comma-separated |z| boost levels")
+    parser.add_argument("--thresholds", default="default",
+                        help="comma-separated threshold files ('default' for the built-in rules)")
+    parser.add_argument("--configs", help="JSON list of configs (overrides the grid options)")
+    parser.add_argument("--device", action="append", help="limit to a device (repeatable)")
+    parser.add_argument("--start", help="first reading time (ISO-8601, inclusive)")
+    parser.add_argument("--end", help="last reading time (ISO-8601, exclusive)")
+    parser.add_argument("--max-gap", type=float, default=3600.0,
+                        help="longest reading gap (seconds) counted toward time in High")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="worker processes")
+    parser.add_argument("--verify", type=int, default=0,
+                        help="check the first N readings of one device against sequential update_and_score")
+    parser.add_argument("--output", help="write results as JSON")
+    args = parser.parse_args()
+
+    configs = build_configs(args)
+    if len({c.name for c in configs}) != len(configs):
+        parser.error("config names must be unique")
+    devices = args.device or ReadingArchive(args.archive).devices()
+    if not devices:
+        print(f"No archived readings in {args.archive}")
+        return
+
+    print(f"Backtesting {len(configs)} configs over {len(devices)} devices ({args.workers} workers)")
+    if args.verify:
+        mismatches = verify(args.archive, devices[0], configs, args.verify)
+        print(f"Verify ({devices[0]}, first {args.verify} readings): "
+              + ("✓ matches update_and_score" if not any(mismatches.values()) else f"✗ mismatches {mismatches}"))
+
+    start = time.perf_counter()
+    totals = run_backtest(args.archive, configs, devices, args.start, args.end,
+                          int(args.max_gap * 1000), args.workers)
+    elapsed = time.perf_counter() - start
+    results = {name: stats.to_dict() for name, stats in totals.items()}
+    readings = next(iter(results.values()))["readings"] if results else 0
+
+    print(f"\n{'config':32} {'alerts':>8} {'devices':>9} {'High h':>10} {'High %':>8} {'changes':>9}")
+    for name, result in results.items():
+        print(f"{name:32} {result['alerts']:>8} {result['devicesAlerted']:>4}/{result['devices']:<4} "
+              f"{result['timeInHighHours']:>10} {result['highFraction'] * 100:>7.2f}% {result['stateChanges']:>9}")
+    print(f"\n{readings} readings x {len(configs)} configs in {elapsed:.1f}s "
+          f"({readings * len(configs) / elapsed if elapsed else 0:,.0f} reading-configs/s)")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"configs": [c._asdict() for c in configs], "devices": len(devices),
+                       "start": args.start, "end": args.end, "seconds": round(elapsed, 2),
+                       "results": results}, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,315 @@
+"""
+Offline benchmark suite for the scoring and ingest hot paths.
+
+Measures:
+  - AnomalyDetector.update_and_score per-reading latency (p50/p99)
+  - batch scoring throughput for 1 to 10,000 devices
+  - fleet-wide ingest and rescoring in the columnar history store
+  - calculate-risk.py handler request/response time (history vs compact state)
+  - the long-running calculate-risk server: warm keep-alive singles and /batch
+  - the full poller (fetch pages, score, batched writes) against a local Convex stand-in
+
+Results are written as JSON so runs can be compared between commits:
+
+    python benchmark.py --output bench_results.json
+    python benchmark.py --compare bench_results.json
+"""
+
+import argparse
+import contextlib
+import importlib.util
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+from http.server import ThreadingHTTPServer
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+import requests
+
+from anomaly_detector import AnomalyDetector
+from columnar_store import ColumnarStore
+from convex_client import ConvexClient
+from detector_registry import DetectorRegistry
+from local_convex import serve
+from processing import LocalScorer, prefetch
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CALCULATE_RISK_PATH = os.path.join(ROOT, "web-app", "api", "calculate-risk.py")
+
+
+def percentiles(samples_ns: List[int]) -> Dict[str, float]:
+    """p50/p99/mean of nanosecond samples, reported in microseconds"""
+    values = np.asarray(samples_ns, dtype=np.float64) / 1000.0
+    return {
+        "p50_us": round(float(np.percentile(values, 50)), 3),
+        "p99_us": round(float(np.percentile(values, 99)), 3),
+        "mean_us": round(float(values.mean()), 3),
+        "samples": len(values),
+    }
+
+
+def make_records(devices: int, per_device: int, seed: int = 7) -> List[Dict[str, Any]]:
+    """Interleaved synthetic readings, per_device for each of `devices` devices"""
+    rng = random.Random(seed)
+    records = []
+    for i in range(per_device):
+        for d in range(devices):
+            n = i * devices + d
+            records.append({
+                "_id": f"sensorData_{n:08d}",
+                "timestamp": f"2026-01-01T00:00:00.{n:09d}Z",
+                "deviceId": f"ESP32-{d:05d}",
+                "rainValue": rng.uniform(0, 100),
+                "soilMoisture": rng.uniform(20, 90),
+                "tiltValue": rng.uniform(0, 45),
+            })
+    return records
+
+
+def bench_update_and_score(readings: int) -> Dict[str, Any]:
+    """Per-reading latency of the sequential detector path"""
+    rng = random.Random(1)
+    detector = AnomalyDetector(window_size=20)
+    values = [(rng.uniform(0, 100), rng.uniform(20, 90), rng.uniform(0, 45)) for _ in range(readings)]
+    samples = []
+    clock = time.perf_counter_ns
+    for rain, soil, tilt in values:
+        start = clock()
+        detector.update_and_score(rain, soil, tilt)
+        samples.append(clock() - start)
+    return percentiles(samples[20:])  # Skip the window fill
+
+
+def bench_batch_throughput(device_counts: List[int], per_device: int) -> Dict[str, Any]:
+    """Readings/s through score_batch alone and through full payload building"""
+    results = {}
+    for devices in device_counts:
+        records = make_records(devices, per_device)
+
+        detectors = [AnomalyDetector(window_size=20) for _ in range(devices)]
+        columns = np.random.default_rng(3).uniform(0, 100, size=(devices, 3, per_device))
+        start = time.perf_counter()
+        for detector, (rain, soil, tilt) in zip(detectors, columns):
+            detector.score_batch(rain, soil, tilt)
+        score_only = time.perf_counter() - start
+
+        scorer = LocalScorer(DetectorRegistry(window_size=20, max_detectors=max(devices, 1)))
+        start = time.perf_counter()
+        scorer(records)
+        with_payloads = time.perf_counter() - start
+
+        total = devices * per_device
+        results[str(devices)] = {
+            "readings": total,
+            "score_batch_readings_per_s": round(total / score_only, 1),
+            "scorer_readings_per_s": round(total / with_payloads, 1),
+        }
+    return results
+
+
+def bench_fleet_rescore(devices: int, window_size: int, rounds: int) -> Dict[str, Any]:
+    """Columnar store: one reading per device per push_batch, then one score_latest over the fleet"""
+    store = ColumnarStore(window_size=window_size, capacity=devices)
+    device_ids = [f"ESP32-{d:05d}" for d in range(devices)]
+    rng = np.random.default_rng(11)
+    for _ in range(window_size):
+        store.push_batch(device_ids, rng.uniform(0, 60, size=(devices, 3)))
+
+    batches = [rng.uniform(0, 60, size=(devices, 3)) for _ in range(rounds)]
+    start = time.perf_counter()
+    for batch in batches:
+        store.push_batch(device_ids, batch)
+    push_seconds = time.perf_counter() - start
+
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter_ns()
+        store.score_latest()
+        samples.append(time.perf_counter_ns() - start)
+    return dict(percentiles(samples), devices=devices,
+                push_readings_per_s=round(devices * rounds / push_seconds, 1),
+                bytes_per_device=store.bytes_per_device)
+
+
+def _load_calculate_risk():
+    """Import web-app/api/calculate-risk.py (not importable by name)"""
+    sys.path.insert(0, os.path.dirname(CALCULATE_RISK_PATH))
+    try:
+        spec = importlib.util.spec_from_file_location("calculate_risk", CALCULATE_RISK_PATH)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    finally:
+        sys.path.pop(0)
+    return module
+
+
+def bench_calculate_risk(requests_count: int, window_size: int) -> Dict[str, Any]:
+    """Round-trip time of the calculate-risk handler with full history vs compact state"""
+    module = _load_calculate_risk()
+    module.handler.log_message = lambda self, *args: None
+    module.handler.protocol_version = "HTTP/1.0"
+    server = ThreadingHTTPServer(("127.0.0.1", 0), module.handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/api/calculate-risk"
+
+    rng = random.Random(5)
+    history = {key: [rng.uniform(0, 50) for _ in range(window_size)] for key in ("rain", "soil", "tilt")}
+    seed = AnomalyDetector(window_size=window_size)
+    seed.history = history
+    state = seed.export_state()
+
+    results = {}
+    session = requests.Session()
+    try:
+        for name, extra in (("history", {"history": history}), ("state", {"state": state})):
+            body = dict(rainValue=12.5, soilMoisture=40.0, tiltValue=3.0, **extra)
+            payload_bytes = len(json.dumps(body))
+            samples = []
+            for _ in range(requests_count):
+                start = time.perf_counter_ns()
+                response = session.post(url, json=body)
+                response.json()
+                samples.append(time.perf_counter_ns() - start)
+            results[name] = dict(percentiles(samples), request_bytes=payload_bytes,
+                                 response_bytes=len(response.content))
+    finally:
+        session.close()
+        server.shutdown()
+    return results
+
+
+def bench_calculate_risk_server(requests_count: int, devices: int, batch_size: int) -> Dict[str, Any]:
+    """Threaded keep-alive server with warm per-device detectors: single readings vs /batch"""
+    module = _load_calculate_risk()
+    server, url, _ = module.serve(port=0)
+    rng = random.Random(9)
+    readings = [dict(deviceId=f"ESP32-{i % devices:05d}", rainValue=rng.uniform(0, 100),
+                     soilMoisture=rng.uniform(20, 90), tiltValue=rng.uniform(0, 45)) for i in range(batch_size)]
+    session = requests.Session()
+    try:
+        samples = []
+        for i in range(requests_count):
+            start = time.perf_counter_ns()
+            session.post(url, json=readings[i % batch_size]).json()
+            samples.append(time.perf_counter_ns() - start)
+
+        start = time.perf_counter()
+        response = session.post(f"{url}/batch", json={"readings": readings})
+        response.json()
+        batch_seconds = time.perf_counter() - start
+    finally:
+        session.close()
+        server.shutdown()
+    return {
+        "single": dict(percentiles(samples), readings_per_s=round(len(samples) / (sum(samples) / 1e9), 1)),
+        "batch": {"readings": batch_size, "ms": round(batch_seconds * 1000, 2),
+                  "readings_per_s": round(batch_size / batch_seconds, 1)},
+    }
+
+
+def bench_full_loop(devices: int, per_device: int, page_size: int, write_batch_size: int) -> Dict[str, Any]:
+    """Drain a seeded backlog through the poller's page -> score -> batched write path"""
+    import app
+
+    server, url, store = serve()
+    for record in make_records(devices, per_device):
+        store.add_sensor_data(record)
+
+    convex = ConvexClient(url)
+    scorer = LocalScorer(DetectorRegistry(window_size=20, max_detectors=max(devices, 1),
+                                          history_loader=convex.get_device_history))
+    app.WRITE_BATCH_SIZE = write_batch_size
+    saved = 0
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for page in prefetch(convex.iter_unprocessed_pages(page_size)):
+            saved += app.process_records(convex, scorer, page)
+    elapsed = time.perf_counter() - start
+    convex.close()
+    server.shutdown()
+    return {
+        "records": devices * per_device,
+        "saved": saved,
+        "seconds": round(elapsed, 3),
+        "records_per_s": round(saved / elapsed, 1),
+    }
+
+
+def environment() -> Dict[str, Any]:
+    """Where and on what the benchmark ran"""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = ""
+    return {
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], prefix: str = ""):
+    """Print numeric differences between two result trees"""
+    for key, value in current.items():
+        name = f"{prefix}{key}"
+        old = baseline.get(key) if isinstance(baseline, dict) else None
+        if isinstance(value, dict):
+            compare(value, old or {}, f"{name}.")
+        elif isinstance(value, (int, float)) and isinstance(old, (int, float)) and old:
+            change = (value - old) / old * 100.0
+            print(f"  {name:60} {old:>14} -> {value:>14} ({change:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the scoring and ingest hot paths")
+    parser.add_argument("--output", default="bench_results.json", help="where to write JSON results")
+    parser.add_argument("--compare", help="earlier results file to diff against")
+    parser.add_argument("--quick", action="store_true", help="smaller sizes for a fast smoke run")
+    args = parser.parse_args()
+
+    scale = 0.1 if args.quick else 1.0
+    sized = lambda n: max(1, int(n * scale))
+    benches: Dict[str, Callable[[], Dict[str, Any]]] = {
+        "update_and_score": lambda: bench_update_and_score(sized(100_000)),
+        "batch_throughput": lambda: bench_batch_throughput([1, 10, 100, 1000, 10_000], per_device=sized(50)),
+        "fleet_rescore": lambda: bench_fleet_rescore(10_000, window_size=20, rounds=sized(50)),
+        "calculate_risk": lambda: bench_calculate_risk(sized(500), window_size=20),
+        "calculate_risk_window_1000": lambda: bench_calculate_risk(sized(200), window_size=1000),
+        "calculate_risk_server": lambda: bench_calculate_risk_server(sized(1000), devices=100,
+                                                                     batch_size=sized(5000)),
+        "full_loop": lambda: bench_full_loop(devices=100, per_device=sized(100), page_size=200,
+                                             write_batch_size=100),
+    }
+
+    results: Dict[str, Any] = {}
+    for name, bench in benches.items():
+        print(f"Running {name}...")
+        results[name] = bench()
+        print(f"  {json.dumps(results[name])}")
+
+    report = {"environment": environment(), "quick": args.quick, "results": results}
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f"\nCompared with {args.compare} ({baseline.get('environment', {}).get('commit', '?')}):")
+        compare(results, baseline.get("results", {}))
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+import threading
+import time
+from typing import Callable, Dict
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of making a call while the circuit is open"""
+
+
+class CircuitBreaker:
+    """
+    Stops calling an endpoint that keeps failing.
+
+    - Closed: calls go through; `failure_threshold` consecutive failures open it.
+    - Open: calls are rejected at once (no network wait) for `reset_timeout` seconds.
+    - Half-open: one trial call goes through; success closes the circuit,
+      failure opens it again for another `reset_timeout`.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 10.0,
+                 clock: Callable[[], float] = time.monotonic):
+        if failure_threshold < 1:
+            raise ValueError("failure_threshold must be at least 1")
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+        # Counters
+        self.opened = 0
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == self.OPEN and self.clock() - self._opened_at >= self.reset_timeout:
+                return self.HALF_OPEN
+            return self._state
+
+    def allow(self) -> bool:
+        """Whether a call may go ahead now (a True in half-open claims the single trial call)"""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.OPEN and self.clock() - self._opened_at >= self.reset_timeout:
+                self._state = self.HALF_OPEN
+            if self._state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    self.opened += 1
+                self._state = self.OPEN
+                self._opened_at = self.clock()
+            self._trial_in_flight = False
+
+    def stats(self) -> Dict[str, int]:
+        """Counters for monitoring"""
+        return {
+            'open': int(self.state != self.CLOSED),
+            'consecutiveFailures': self._failures,
+            'opened': self.opened,
+            'rejected': self.rejected
+        }
@@ -0,0 +1,318 @@
+import numpy as np
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+from anomaly_detector import (SENSORS, DEFAULT_THRESHOLD_TABLE, AnomalyDetector, RollingWindow, ThresholdTable,
+                              hybrid_risk)
+
+if TYPE_CHECKING:
+    from detector_registry import DeviceState
+
+
+class ColumnarWindow(RollingWindow):
+    """
+    RollingWindow whose ring buffer is one sensor row of a ColumnarStore slot
+    (a view, no copy). Every load/push also writes the slot's head and count,
+    so the store's fleet-wide operations see the window as the detector does.
+    Once its slot is removed the window keeps working on a private copy.
+    """
+
+    __slots__ = ('_store', '_slot')
+
+    def __init__(self, store: "ColumnarStore", slot: int, row: int, values: Iterable[float] = ()):
+        self._store: Optional[ColumnarStore] = store
+        self._slot = slot
+        self._buffer = store.values[slot, row]
+        super().__init__(store.window_size, values)
+
+    def load(self, values: Iterable[float]) -> None:
+        values = [float(v) for v in values][-self.size:]
+        self._buffer[:] = 0.0
+        self._buffer[:len(values)] = values
+        self.count = len(values)
+        self._head = self.count % self.size
+        self._sync_slot()
+        self._resync()
+
+    def push(self, value: float) -> None:
+        super().push(value)
+        self._sync_slot()
+
+    def values(self) -> List[float]:
+        if self.count < self.size:
+            return self._buffer[:self.count].tolist()
+        return np.concatenate((self._buffer[self._head:], self._buffer[:self._head])).tolist()
+
+    def _sync_slot(self) -> None:
+        if self._store is not None:
+            self._store.heads[self._slot] = self._head
+            self._store.counts[self._slot] = self.count
+
+    def _rebind(self, buffer: np.ndarray) -> None:
+        """Point at the slot's row in a reallocated store array"""
+        self._buffer = buffer
+
+    def _detach(self) -> None:
+        """Keep the contents after the slot is freed (and possibly reused by another device)"""
+        self._buffer = self._buffer.copy()
+        self._store = None
+
+
+class ColumnarStore:
+    """
+    Rolling windows for a whole fleet in one contiguous array.
+
+    `values` has shape (capacity, 3, window_size): one row per device slot,
+    rain/soil/tilt stacked inside it, each a ring buffer whose next write
+    position is `heads[slot]` and whose fill is `counts[slot]`. Unfilled
+    positions hold 0. Per-device windows are views into `values` (no copies),
+    and fleet statistics and rescoring are single vectorized operations over
+    every slot.
+
+    Memory per device is constant: bytes_per_device = 3 * window_size *
+    itemsize + 8 (int32 head and count), e.g. 488 bytes for a float64 window
+    of 20 or 248 for float32, plus the deviceId -> slot dict entry.
+
+    Raw views stay valid until the store grows past its capacity (it doubles
+    by reallocating), so size `capacity` for the fleet up front. Windows from
+    `windows()` follow the reallocation; they are how DetectorRegistry backs
+    its detectors with the store. While a device has them, write its readings
+    through them rather than with load/push/push_batch.
+    """
+
+    def __init__(self, window_size: int = 20, capacity: int = 1024, dtype: str = 'float64'):
+        if window_size < 1:
+            raise ValueError("window size must be at least 1")
+        self.window_size = window_size
+        self.dtype = np.dtype(dtype)
+        if self.dtype.name not in ('float32', 'float64'):
+            raise ValueError(f"Unsupported dtype: {self.dtype.name}")
+        capacity = max(1, capacity)
+        self.values = np.zeros((capacity, len(SENSORS), window_size), dtype=self.dtype)
+        self.heads = np.zeros(capacity, dtype=np.int32)
+        self.counts = np.zeros(capacity, dtype=np.int32)
+        self.slots: Dict[Optional[str], int] = {}
+        self.device_ids: List[Optional[str]] = [None] * capacity
+        self._free: List[int] = list(range(capacity - 1, -1, -1))
+        # Live ColumnarWindows per slot (rain/soil/tilt)
+        self._windows: Dict[int, List[ColumnarWindow]] = {}
+
+    @property
+    def bytes_per_device(self) -> int:
+        return len(SENSORS) * self.window_size * self.dtype.itemsize + 2 * self.heads.itemsize
+
+    @property
+    def capacity(self) -> int:
+        return len(self.values)
+
+    def __len__(self) -> int:
+        return len(self.slots)
+
+    def __contains__(self, device_id: Optional[str]) -> bool:
+        return device_id in self.slots
+
+    # === Slots ===
+
+    def slot(self, device_id: Optional[str]) -> int:
+        """Slot index of a device, allocating an empty window on first use"""
+        slot = self.slots.get(device_id)
+        if slot is None:
+            if not self._free:
+                self._grow()
+            slot = self._free.pop()
+            self.slots[device_id] = slot
+            self.device_ids[slot] = device_id
+        return slot
+
+    def remove(self, device_id: Optional[str]) -> bool:
+        """Drop a device's window and free its slot"""
+        slot = self.slots.pop(device_id, None)
+        if slot is None:
+            return False
+        for window in self._windows.pop(slot, ()):
+            window._detach()
+        self.values[slot] = 0
+        self.heads[slot] = 0
+        self.counts[slot] = 0
+        self.device_ids[slot] = None
+        self._free.append(slot)
+        return True
+
+    def _grow(self):
+        old = self.capacity
+        self.values = np.concatenate((self.values, np.zeros_like(self.values)))
+        self.heads = np.concatenate((self.heads, np.zeros(old, dtype=np.int32)))
+        self.counts = np.concatenate((self.counts, np.zeros(old, dtype=np.int32)))
+        self.device_ids.extend([None] * old)
+        self._free.extend(range(2 * old - 1, old - 1, -1))
+        for slot, windows in self._windows.items():
+            for row, window in enumerate(windows):
+                window._rebind(self.values[slot, row])
+
+    def _occupied(self) -> Tuple[Union[slice, np.ndarray], List[Optional[str]]]:
+        """Index of the slots in use (a slice, so reads are views, while they are dense) and their device ids"""
+        n = len(self.slots)
+        if n and self._free and min(self._free) < n:
+            slots = np.fromiter(sorted(self.slots.values()), dtype=np.intp, count=n)
+            return slots, [self.device_ids[slot] for slot in slots.tolist()]
+        return slice(0, n), self.device_ids[:n]
+
+    # === Per-device access ===
+
+    def view(self, device_id: Optional[str]) -> np.ndarray:
+        """
+        Zero-copy (3, window_size) ring buffer of a device (rows rain/soil/tilt),
+        in storage order: the oldest reading is at `heads[slot]` once full
+        """
+        return self.values[self.slots[device_id]]
+
+    def windows(self, device_id: Optional[str],
+                history: Optional[Dict[str, Sequence[float]]] = None) -> Dict[str, ColumnarWindow]:
+        """
+        RollingWindows over a device's slot, per sensor, for
+        AnomalyDetector(windows=...); the slot is reset to `history` (oldest first)
+        """
+        if self.dtype != np.float64:
+            raise ValueError("detector windows need a float64 store")
+        slot = self.slot(device_id)
+        for window in self._windows.pop(slot, ()):
+            window._detach()
+        history = history or {}
+        windows = {key: ColumnarWindow(self, slot, row, history.get(key, ())) for row, key in enumerate(SENSORS)}
+        self._windows[slot] = list(windows.values())
+        return windows
+
+    def history(self, device_id: Optional[str]) -> Dict[str, List[float]]:
+        """A device's readings per sensor, oldest first (a copy)"""
+        slot = self.slots.get(device_id)
+        if slot is None:
+            return {key: [] for key in SENSORS}
+        order = self._order(slot)
+        return {key: self.values[slot, row, order].tolist() for row, key in enumerate(SENSORS)}
+
+    def _order(self, slot: int) -> np.ndarray:
+        count, head = int(self.counts[slot]), int(self.heads[slot])
+        return (head - count + np.arange(count)) % self.window_size
+
+    def load(self, device_id: Optional[str], history: Dict[str, Sequence[float]]):
+        """Replace a device's window with the last window_size readings of `history` (oldest first)"""
+        slot = self.slot(device_id)
+        w = self.window_size
+        count = min(len(history.get('rain', [])), w)
+        self.values[slot] = 0
+        for row, key in enumerate(SENSORS):
+            series = list(history.get(key, []))[-w:]
+            self.values[slot, row, :len(series)] = series
+        self.counts[slot] = count
+        self.heads[slot] = count % w
+
+    def push(self, device_id: Optional[str], rain: float, soil: float, tilt: float):
+        """Append one reading to a device's window"""
+        slot = self.slot(device_id)
+        head = self.heads[slot]
+        self.values[slot, :, head] = (rain, soil, tilt)
+        self.heads[slot] = (head + 1) % self.window_size
+        if self.counts[slot] < self.window_size:
+            self.counts[slot] += 1
+
+    def push_batch(self, device_ids: Sequence[Optional[str]], readings: np.ndarray):
+        """
+        Append readings (N, 3) for N devices, in order, with one scatter per
+        round; a device appearing k times takes k rounds
+        """
+        readings = np.asarray(readings, dtype=self.dtype).reshape(-1, len(SENSORS))
+        if len(readings) != len(device_ids):
+            raise ValueError("one reading row is needed per device id")
+        slots = np.fromiter((self.slot(d) for d in device_ids), dtype=np.intp, count=len(device_ids))
+
+        # Rank of each row among rows for the same device, so each round writes a slot at most once
+        seen: Dict[int, int] = {}
+        ranks = np.empty(len(slots), dtype=np.intp)
+        for i, slot in enumerate(slots.tolist()):
+            ranks[i] = seen.get(slot, 0)
+            seen[slot] = ranks[i] + 1
+
+        sensors = np.arange(len(SENSORS))
+        for rank in range(int(ranks.max()) + 1 if len(ranks) else 0):
+            round_slots = slots[ranks == rank]
+            heads = self.heads[round_slots]
+            self.values[round_slots[:, None], sensors[None, :], heads[:, None]] = readings[ranks == rank]
+            self.heads[round_slots] = (heads + 1) % self.window_size
+            self.counts[round_slots] = np.minimum(self.counts[round_slots] + 1, self.window_size)
+
+    # === Fleet-wide ===
+
+    def fleet_stats(self) -> Dict[str, np.ndarray]:
+        """
+        Rolling mean and population std of every occupied slot, matching
+        RollingWindow (ddof=0, near-zero variance reported as 0).
+
+        Returns:
+            Dict with 'deviceIds' (list), 'counts' (D,), 'mean' and 'std' (D, 3)
+        """
+        slots, device_ids = self._occupied()
+        values = self.values[slots].astype(np.float64, copy=False)
+        counts = self.counts[slots]
+        divisor = np.maximum(counts, 1)[:, None]
+        filled = (np.arange(self.window_size) < counts[:, None])[:, None, :]
+
+        mean = values.sum(axis=2) / divisor
+        variance = (np.where(filled, values - mean[:, :, None], 0.0) ** 2).sum(axis=2) / divisor
+        variance[variance <= RollingWindow.VARIANCE_EPSILON * np.maximum(1.0, mean * mean)] = 0.0
+        return {
+            'deviceIds': device_ids,
+            'counts': counts,
+            'mean': mean,
+            'std': np.sqrt(variance),
+        }
+
+    def latest(self) -> Tuple[List[Optional[str]], np.ndarray]:
+        """Newest reading (D, 3) of every occupied slot, with the device ids"""
+        slots, device_ids = self._occupied()
+        rows = self.values[slots]
+        newest = (self.heads[slots] - 1) % self.window_size
+        return device_ids, rows[np.arange(len(rows)), :, newest]
+
+    def score_latest(self, thresholds: ThresholdTable = DEFAULT_THRESHOLD_TABLE,
+                     z_boost: float = 3.0) -> Dict[str, np.ndarray]:
+        """
+        Rescore every device's newest reading against its current window in one
+        vectorized pass (e.g. after a threshold change). Matches what
+        AnomalyDetector.score returned for that reading when it was pushed.
+
+        Returns:
+            Dict with 'deviceIds', 'riskScore', 'riskState', 'thresholdCodes'
+            and 'zScores' (D, 3, rounded to 4dp)
+        """
+        stats = self.fleet_stats()
+        _, latest = self.latest()
+        latest = latest.astype(np.float64, copy=False)
+        std = stats['std']
+        z = np.divide(latest - stats['mean'], std, out=np.zeros_like(std), where=std != 0)
+        initializing = stats['counts'] < 5
+        z[initializing] = 0.0
+
+        _, codes = thresholds.classify_batch({key: latest[:, row] for row, key in enumerate(SENSORS)})
+        risk, states = hybrid_risk(z[:, 0], z[:, 1], z[:, 2], codes, thresholds, initializing, z_boost)
+        return {
+            'deviceIds': stats['deviceIds'],
+            'riskScore': risk,
+            'riskState': states,
+            'thresholdCodes': codes,
+            'zScores': np.round(z, 4),
+        }
+
+    # === Conversion ===
+
+    @classmethod
+    def from_states(cls, states: Dict[Optional[str], "DeviceState"], window_size: int,
+                    dtype: str = 'float64') -> "ColumnarStore":
+        """Store holding the windows of DetectorRegistry.export_states() or load_snapshot() output"""
+        store = cls(window_size, capacity=len(states), dtype=dtype)
+        for device_id, entry in states.items():
+            store.load(device_id, entry.history)
+        return store
+
+    def detector(self, device_id: Optional[str], thresholds: Optional[ThresholdTable] = None) -> AnomalyDetector:
+        """A sequential AnomalyDetector warmed with a device's window"""
+        detector = AnomalyDetector(window_size=self.window_size, thresholds=thresholds)
+        detector.history = self.history(device_id)
+        return detector
@@ -1,79 +1,284 @@
+import json
+import logging
 import requests
+from requests.adapters import HTTPAdapter
 import os
-from typing import List, Dict, Any
+import time
+from typing import Callable, List, Dict, Any, Iterable, Iterator, Optional
+from metrics import CONVEX_REQUEST_FAILURES, CONVEX_REQUEST_SECONDS, FETCH_PAGE_RECORDS, WRITE_BATCH_RECORDS
+from profiling import PROFILER
+from leases import lease_page_partitions
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+
+logger = logging.getLogger(__name__)
+
+
+def is_transient(error: Exception) -> bool:
+    """Whether a failed call may succeed if retried later (outage, overload, open circuit)"""
+    if isinstance(error, (CircuitOpenError, requests.ConnectionError, requests.Timeout)):
+        return True
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        return error.response.status_code >= 500 or error.response.status_code == 429
+    return False
+
 
 class ConvexClient:
-    """Client to interact with Convex backend"""
-    
-    def __init__(self, convex_url: str):
+    """
+    Client to interact with Convex backend.
+
+    Calls go through a circuit breaker: after repeated outage-type failures
+    (connection errors, timeouts, 5xx/429) calls fail fast with
+    CircuitOpenError instead of each waiting on the network timeout.
+    """
+
+    def __init__(self, convex_url: str, timeout: float = 10.0, pool_size: int = 10,
+                 breaker: Optional[CircuitBreaker] = None):
         self.convex_url = convex_url.rstrip('/')
-        
+        self.timeout = timeout
+        self.breaker = breaker or CircuitBreaker()
+
+        # One pooled keep-alive session for every call (no TLS handshake per request)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({"Content-Type": "application/json"})
+
+    def _call(self, kind: str, path: str, args: Dict[str, Any]) -> Any:
+        """Run a Convex query or mutation and return its value"""
+        if not self.breaker.allow():
+            CONVEX_REQUEST_FAILURES.inc(path=path)
+            raise CircuitOpenError(f"Circuit open, not calling {path}")
+        start = time.perf_counter()
+        try:
+            with PROFILER.stage(f"convex:{path}"):
+                with PROFILER.stage("serialize"):
+                    body = json.dumps({"path": path, "args": args})
+                with PROFILER.stage("network"):
+                    response = self.session.post(f"{self.convex_url}/api/{kind}", data=body, timeout=self.timeout)
+                    response.raise_for_status()
+                with PROFILER.stage("json_decode"):
+                    result = json.loads(response.content)
+            if result.get("status") == "error":
+                raise RuntimeError(result.get("errorMessage", "Convex function failed"))
+            self.breaker.record_success()
+            return result.get("value")
+        except Exception as e:
+            CONVEX_REQUEST_FAILURES.inc(path=path)
+            if is_transient(e):
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()  # The deployment answered
+            raise
+        finally:
+            CONVEX_REQUEST_SECONDS.observe(time.perf_counter() - start, kind=kind, path=path)
+
+    def close(self):
+        """Close pooled connections"""
+        self.session.close()
+
     def get_unprocessed_data(self) -> List[Dict[str, Any]]:
         """Fetch unprocessed sensor data from Convex"""
         try:
-            response = requests.post(
-                f"{self.convex_url}/api/query",
-                json={
-                    "path": "sensorData:getUnprocessedData",
-                    "args": {}
-                },
-                headers={"Content-Type": "application/json"}
+            return self._call("query", "sensorData:getUnprocessedData", {}) or []
+        except Exception as e:
+            logger.error("Error fetching unprocessed data: %s", e)
+            return []
+
+    def get_unprocessed_page(self, cursor: Optional[str] = None, page_size: int = 100) -> Dict[str, Any]:
+        """
+        Fetch one page of unprocessed sensor data, oldest first.
+
+        Returns:
+            Dict with "page" (records), "isDone" and "continueCursor"
+        """
+        result = self._call("query", "sensorData:getUnprocessedDataPage", {
+            "paginationOpts": {"numItems": page_size, "cursor": cursor}
+        })
+        FETCH_PAGE_RECORDS.observe(len(result.get("page", [])))
+        return result
+
+    def get_unprocessed_partition_page(self, partition: Optional[int], cursor: Optional[str] = None,
+                                       page_size: int = 100) -> Dict[str, Any]:
+        """
+        Fetch one page of one lease partition's unprocessed sensor data, oldest
+        first. Partition None pages rows stored before partitions existed.
+        """
+        args: Dict[str, Any] = {"paginationOpts": {"numItems": page_size, "cursor": cursor}}
+        if partition is not None:
+            args["partition"] = partition
+        result = self._call("query", "sensorData:getUnprocessedPartitionPage", args)
+        FETCH_PAGE_RECORDS.observe(len(result.get("page", [])))
+        return result
+
+    def iter_unprocessed_pages(self, page_size: int = 100,
+                               partitions: Optional[Iterable[int]] = None) -> Iterator[List[Dict[str, Any]]]:
+        """
+        Stream unprocessed sensor data page by page, so memory is bounded by page_size.
+        With `partitions` (held leases), only those partitions are read, one after
+        another; the holder of partition 0 also reads rows stored before partitions
+        existed. Fetch errors are raised to the caller, which decides how to back off.
+        """
+        if partitions is None:
+            yield from self._iter_pages(lambda cursor: self.get_unprocessed_page(cursor, page_size))
+            return
+        for partition in lease_page_partitions(partitions):
+            yield from self._iter_pages(
+                lambda cursor, p=partition: self.get_unprocessed_partition_page(p, cursor, page_size)
             )
-            response.raise_for_status()
-            result = response.json()
-            return result.get("value", [])
+
+    @staticmethod
+    def _iter_pages(fetch: Callable[[Optional[str]], Dict[str, Any]]) -> Iterator[List[Dict[str, Any]]]:
+        cursor = None
+        while True:
+            result = fetch(cursor)
+            page = result.get("page", [])
+            if page:
+                yield page
+            if result.get("isDone") or not page:
+                return
+            cursor = result.get("continueCursor")
+
+    # === Leases (see web-app/convex/leases.ts) ===
+
+    def claim_leases(self, owner: str, ttl: float) -> Dict[str, Any]:
+        """
+        Renew this poller's partition leases and claim its fair share of free or
+        expired ones (releasing any above it).
+
+        Returns:
+            Dict with "partitions" (held, sorted), "numPartitions" and "expiresAt" (epoch ms)
+        """
+        return self._call("mutation", "leases:claimLeases", {"owner": owner, "ttlMs": int(ttl * 1000)})
+
+    def renew_leases(self, owner: str, ttl: float) -> Dict[str, Any]:
+        """Extend the leases this poller holds without claiming or releasing any"""
+        return self._call("mutation", "leases:renewLeases", {"owner": owner, "ttlMs": int(ttl * 1000)})
+
+    def release_leases(self, owner: str) -> int:
+        """Give up every lease this poller holds; returns how many were released"""
+        return self._call("mutation", "leases:releaseLeases", {"owner": owner})
+
+    # === Rollups (see web-app/convex/rollups.ts) ===
+
+    def merge_rollups(self, rows: List[Dict[str, Any]]) -> int:
+        """Merge partial rollup rows into the stored buckets (raises on failure); returns how many were merged"""
+        return self._call("mutation", "rollups:mergeRollups", {"rollups": rows})
+
+    def get_rollups(self, granularity: str, device_id: Optional[str] = None, start: Optional[int] = None,
+                    end: Optional[int] = None, limit: int = 500) -> List[Dict[str, Any]]:
+        """Rollup rows (oldest first) whose bucket starts in [start, end) epoch ms, optionally for one device"""
+        args: Dict[str, Any] = {"granularity": granularity, "limit": limit}
+        if device_id:
+            args["deviceId"] = device_id
+        if start is not None:
+            args["from"] = start
+        if end is not None:
+            args["to"] = end
+        try:
+            return self._call("query", "rollups:getRollups", args) or []
         except Exception as e:
-            print(f"Error fetching unprocessed data: {e}")
+            logger.error("Error fetching rollups: %s", e)
             return []
-    
+
     def mark_as_processed(self, sensor_data_id: str) -> bool:
         """Mark sensor data as processed"""
         try:
-            response = requests.post(
-                f"{self.convex_url}/api/mutation",
-                json={
-                    "path": "sensorData:markAsProcessed",
-                    "args": {"id": sensor_data_id}
-                },
-                headers={"Content-Type": "application/json"}
-            )
-            response.raise_for_status()
+            self._call("mutation", "sensorData:markAsProcessed", {"id": sensor_data_id})
             return True
         except Exception as e:
-            print(f"Error marking as processed: {e}")
+            logger.error("Error marking as processed: %s", e)
             return False
-    
+
     def add_anomaly_result(self, result_data: Dict[str, Any]) -> bool:
         """Add anomaly detection result to Convex"""
         try:
-            response = requests.post(
-                f"{self.convex_url}/api/mutation",
-                json={
-                    "path": "sensorData:addAnomalyResult",
-                    "args": result_data
-                },
-                headers={"Content-Type": "application/json"}
-            )
-            response.raise_for_status()
+            self._call("mutation", "sensorData:addAnomalyResult", result_data)
             return True
         except Exception as e:
-            print(f"Error adding anomaly result: {e}")
+            logger.error("Error adding anomaly result: %s", e)
             return False
-    
+
+    def add_anomaly_results_batch(self, results: List[Dict[str, Any]], mark_processed: bool = True,
+                                  batch_size: int = 100, lease_owner: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Add many anomaly results (and mark their sensor data processed) with one
+        request per `batch_size` records. With `lease_owner`, records in
+        partitions whose lease it no longer holds fail with "lease lost".
+
+        Returns:
+            One status per input record, in order: {"sensorDataId", "ok", "id"?, "error"?}
+        """
+        statuses: List[Dict[str, Any]] = []
+        for start in range(0, len(results), batch_size):
+            chunk = results[start:start + batch_size]
+            try:
+                statuses.extend(self.write_results_chunk(chunk, mark_processed, lease_owner))
+            except Exception as e:
+                logger.error("Error adding anomaly results batch: %s", e)
+                statuses.extend(
+                    {"sensorDataId": r.get("sensorDataId"), "ok": False, "error": str(e)} for r in chunk
+                )
+        return statuses
+
+    def write_results_chunk(self, chunk: List[Dict[str, Any]], mark_processed: bool = True,
+                            lease_owner: Optional[str] = None) -> List[Dict[str, Any]]:
+        """One addAnomalyResultsBatch call; raises on failure (see is_transient)"""
+        WRITE_BATCH_RECORDS.observe(len(chunk))
+        args: Dict[str, Any] = {"results": chunk, "markProcessed": mark_processed}
+        if lease_owner is not None:
+            args["leaseOwner"] = lease_owner
+        return self._call("mutation", "sensorData:addAnomalyResultsBatch", args)
+
+    def mark_processed_chunk(self, sensor_data_ids: List[str]) -> List[Dict[str, Any]]:
+        """One markManyAsProcessed call; raises on failure (see is_transient)"""
+        return self._call("mutation", "sensorData:markManyAsProcessed", {"ids": sensor_data_ids})
+
+    def mark_many_as_processed(self, sensor_data_ids: List[str], batch_size: int = 500) -> List[Dict[str, Any]]:
+        """Mark many sensor data records as processed; returns one status per id"""
+        statuses: List[Dict[str, Any]] = []
+        for start in range(0, len(sensor_data_ids), batch_size):
+            chunk = sensor_data_ids[start:start + batch_size]
+            try:
+                statuses.extend(self.mark_processed_chunk(chunk))
+            except Exception as e:
+                logger.error("Error marking batch as processed: %s", e)
+                statuses.extend({"id": i, "ok": False, "error": str(e)} for i in chunk)
+        return statuses
+
     def get_all_sensor_data(self, limit: int = 50) -> List[Dict[str, Any]]:
         """Get all sensor data for debugging"""
         try:
-            response = requests.post(
-                f"{self.convex_url}/api/query",
-                json={
-                    "path": "sensorData:getAllSensorData",
-                    "args": {"limit": limit}
-                },
-                headers={"Content-Type": "application/json"}
-            )
-            response.raise_for_status()
-            result = response.json()
-            return result.get("value", [])
+            return self._call("query", "sensorData:getAllSensorData", {"limit": limit}) or []
         except Exception as e:
-            print(f"Error fetching sensor data: {e}")
+            logger.error("Error fetching sensor data: %s", e)
             return []
+
+    def get_latest_results(self, device_id: Optional[str] = None, limit: int = 20) -> List[Dict[str, Any]]:
+        """Get the latest anomaly results (newest first), optionally for one device"""
+        args: Dict[str, Any] = {"limit": limit}
+        if device_id:
+            args["deviceId"] = device_id
+        try:
+            return self._call("query", "sensorData:getLatestResults", args) or []
+        except Exception as e:
+            logger.error("Error fetching latest results: %s", e)
+            return []
+
+    def get_device_history(self, device_id: Optional[str] = None, limit: int = 20,
+                           since: Optional[str] = None) -> Dict[str, List[float]]:
+        """
+        Rebuild a detector window (oldest first) from the latest stored results,
+        optionally only those after `since`. Readings without a deviceId start
+        empty: the latest results across all devices are not their history.
+        """
+        if not device_id:
+            return {'rain': [], 'soil': [], 'tilt': []}
+        results = list(reversed(self.get_latest_results(device_id, limit)))
+        if since:
+            results = [r for r in results if r.get("timestamp", "") > since]
+        return {
+            'rain': [r["rainValue"] for r in results],
+            'soil': [r["soilMoisture"] for r in results],
+            'tilt': [r["tiltValue"] for r in results]
+        }
@@ -0,0 +1,154 @@
+from collections import OrderedDict
+import numpy as np
+from typing import Callable, Dict, List, NamedTuple, Optional
+from anomaly_detector import DEFAULT_THRESHOLD_TABLE, AnomalyDetector, ThresholdTable
+from columnar_store import ColumnarStore
+from threshold_config import ThresholdConfig
+
+# (device_id, limit, since) -> recent readings per sensor newer than `since`, oldest first
+HistoryLoader = Callable[[Optional[str], int, Optional[str]], Dict[str, List[float]]]
+
+
+
+class DeviceState(NamedTuple):
+    """Saved rolling state for one device"""
+    history: Dict[str, List[float]]  # oldest first
+    last_timestamp: Optional[str]
+
+
+class DetectorRegistry:
+    """
+    Per-device AnomalyDetector instances, created lazily and bounded with LRU eviction.
+
+    Every resident detector's window lives in one ColumnarStore (`store`), so
+    the fleet's history is a single contiguous array and fleet_stats /
+    rescore_fleet are vectorized over all devices.
+    """
+
+    def __init__(self, window_size: int = 20, max_detectors: int = 1000,
+                 history_loader: Optional[HistoryLoader] = None,
+                 thresholds: Optional[ThresholdConfig] = None):
+        if max_detectors < 1:
+            raise ValueError("max_detectors must be at least 1")
+        self.window_size = window_size
+        self.max_detectors = max_detectors
+        self.history_loader = history_loader
+        self.thresholds = thresholds
+        # Windows of resident detectors; a new detector is created before the LRU one is evicted
+        self.store = ColumnarStore(window_size, capacity=min(max_detectors + 1, 1024))
+        self._detectors: "OrderedDict[Optional[str], AnomalyDetector]" = OrderedDict()
+        # Timestamp of the newest reading each resident detector has seen
+        self.last_timestamps: Dict[Optional[str], str] = {}
+        # Snapshot states not yet claimed by a detector
+        self._restored: Dict[Optional[str], DeviceState] = {}
+
+        # Counters
+        self.created = 0
+        self.evictions = 0
+        self.warm_starts = 0
+        self.restores = 0
+
+    def get(self, device_id: Optional[str], location: Optional[str] = None) -> AnomalyDetector:
+        """Return the detector for a device, creating (and warming) it on first use; `location` picks site thresholds"""
+        detector = self._detectors.get(device_id)
+        if detector is not None:
+            self._detectors.move_to_end(device_id)
+            return detector
+
+        detector = self._create(device_id, location)
+        self._detectors[device_id] = detector
+        while len(self._detectors) > self.max_detectors:
+            evicted_id, _ = self._detectors.popitem(last=False)
+            self.last_timestamps.pop(evicted_id, None)
+            self.store.remove(evicted_id)
+            self.evictions += 1
+        return detector
+
+    def _create(self, device_id: Optional[str], location: Optional[str] = None) -> AnomalyDetector:
+        """
+        Build a detector. Its window comes from a restored snapshot plus a replay of
+        results stored after it, or else from the latest stored results.
+        """
+        table = self.thresholds.for_device(device_id, location) if self.thresholds else None
+        detector = AnomalyDetector(window_size=self.window_size, thresholds=table,
+                                   windows=self.store.windows(device_id))
+        self.created += 1
+
+        entry = self._restored.pop(device_id, None)
+        if entry is not None:
+            detector.history = entry.history
+            if entry.last_timestamp:
+                self.last_timestamps[device_id] = entry.last_timestamp
+            if self.history_loader and entry.last_timestamp:
+                newer = self.history_loader(device_id, self.window_size, entry.last_timestamp)
+                for rain, soil, tilt in zip(newer.get('rain', []), newer.get('soil', []), newer.get('tilt', [])):
+                    detector.update_and_score(rain, soil, tilt)
+            self.restores += 1
+        elif self.history_loader:
+            history = self.history_loader(device_id, self.window_size, None)
+            if history and history.get('rain'):
+                detector.history = history
+                self.warm_starts += 1
+        return detector
+
+    def mark_scored(self, device_id: Optional[str], timestamp: Optional[str]):
+        """Record the newest reading timestamp a device's detector has seen"""
+        if timestamp and device_id in self._detectors:
+            self.last_timestamps[device_id] = timestamp
+
+    def restore(self, entries: Dict[Optional[str], DeviceState]):
+        """Stage snapshot states; each device picks its state up when first used"""
+        self._restored.update(entries)
+
+    def forget(self, predicate: Callable[[Optional[str]], bool]) -> int:
+        """Drop resident detectors and staged states of devices matching `predicate`; returns how many were resident"""
+        dropped = [device_id for device_id in self._detectors if predicate(device_id)]
+        for device_id in dropped:
+            del self._detectors[device_id]
+            self.last_timestamps.pop(device_id, None)
+            self.store.remove(device_id)
+        for device_id in [d for d in self._restored if predicate(d)]:
+            del self._restored[device_id]
+        return len(dropped)
+
+    def export_states(self) -> Dict[Optional[str], DeviceState]:
+        """Current state of every resident detector, plus staged states not yet used"""
+        states = dict(self._restored)
+        for device_id, detector in self._detectors.items():
+            states[device_id] = DeviceState(detector.history, self.last_timestamps.get(device_id))
+        return states
+
+    def fleet_stats(self) -> Dict[str, np.ndarray]:
+        """Rolling mean/std of every resident detector in one pass (see ColumnarStore.fleet_stats)"""
+        return self.store.fleet_stats()
+
+    def rescore_fleet(self, thresholds: Optional[ThresholdTable] = None) -> Dict[str, np.ndarray]:
+        """
+        Rescore every resident device's newest reading in one vectorized pass,
+        e.g. to preview a threshold change across the fleet. One table applies
+        to all devices: `thresholds`, else the configured defaults.
+        """
+        if thresholds is None:
+            thresholds = self.thresholds.for_device(None) if self.thresholds else DEFAULT_THRESHOLD_TABLE
+        return self.store.score_latest(thresholds)
+
+    def __contains__(self, device_id: Optional[str]) -> bool:
+        return device_id in self._detectors
+
+    def __len__(self) -> int:
+        return len(self._detectors)
+
+    @property
+    def resident_count(self) -> int:
+        """Number of detectors currently held in memory"""
+        return len(self._detectors)
+
+    def stats(self) -> Dict[str, int]:
+        """Counters for monitoring"""
+        return {
+            'resident': self.resident_count,
+            'created': self.created,
+            'evictions': self.evictions,
+            'warmStarts': self.warm_starts,
+            'restores': self.restores
+        }
@@ -0,0 +1,182 @@
+"""
+Device-partition leases, so several pollers can process sensorData in parallel.
+
+Unprocessed readings are split into LEASE_PARTITIONS partitions by a hash of
+their deviceId (stored on each sensorData row by addSensorData). A poller
+claims a fair share of partitions through the `leases:claimLeases` mutation,
+reads only those partitions, and writes with its owner id, so Convex rejects
+results for partitions it no longer holds. Leases expire after a TTL unless
+renewed; a poller that dies stops renewing and its partitions are picked up by
+the others on their next claim. Because a device always maps to one
+partition, its readings are still scored in order by a single poller.
+
+Keep LEASE_PARTITIONS and partition_for() in step with web-app/convex/leases.ts.
+"""
+
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+LEASE_PARTITIONS = 16
+
+
+def partition_for(device_id: Optional[str], num_partitions: int = LEASE_PARTITIONS) -> int:
+    """FNV-1a (32-bit) hash of the UTF-8 deviceId, modulo num_partitions (matches partitionFor in leases.ts)"""
+    value = 0x811c9dc5
+    for byte in (device_id or "").encode():
+        value = ((value ^ byte) * 0x01000193) & 0xffffffff
+    return value % num_partitions
+
+
+def lease_page_partitions(partitions: Iterable[int]) -> List[Optional[int]]:
+    """
+    Partitions to page through for a set of held leases, in order. None stands
+    for rows stored before partitions existed, which go to the holder of partition 0.
+    """
+    partitions = sorted(set(partitions))
+    return ([None] if 0 in partitions else []) + partitions
+
+
+def default_owner() -> str:
+    """Poller id unique per process: hostname-pid-random"""
+    return f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+
+class LeaseManager:
+    """
+    Holds this poller's partition leases.
+
+    claim() is called at the start of every poll pass to renew, rebalance and
+    pick up expired partitions. While a pass runs, a background thread renews
+    the held leases every ttl/3 seconds. Partitions found lost on either path
+    are collected until evict_lost() drops their devices' detectors, whose
+    windows are stale once another poller has scored their newer readings.
+    """
+
+    def __init__(self, convex, ttl: float = 30.0, owner: Optional[str] = None):
+        if ttl <= 0:
+            raise ValueError("lease ttl must be positive")
+        self.convex = convex
+        self.ttl = ttl
+        self.owner = owner or default_owner()
+        self.num_partitions = LEASE_PARTITIONS
+
+        self._held: Set[int] = set()
+        self._lost: Set[int] = set()
+        self._valid_until = 0.0  # Monotonic time the held leases are known to last until
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        # Counters
+        self.claims = 0
+        self.renewals = 0
+        self.failures = 0
+        self.lost = 0
+
+    @property
+    def partitions(self) -> List[int]:
+        """Partitions currently held"""
+        with self._lock:
+            return sorted(self._held)
+
+    def claim(self) -> List[int]:
+        """Renew, rebalance and claim this poller's share; returns the held partitions (raises on failure)"""
+        started = time.monotonic()
+        try:
+            result = self.convex.claim_leases(self.owner, self.ttl)
+        except Exception:
+            self.failures += 1
+            raise
+        self.claims += 1
+        held = self._update(result, started)
+        return sorted(held)
+
+    def renew(self) -> bool:
+        """Extend the held leases; returns False if the call failed"""
+        started = time.monotonic()
+        try:
+            result = self.convex.renew_leases(self.owner, self.ttl)
+        except Exception as e:
+            self.failures += 1
+            logger.warning("✗ Could not renew leases: %s", e)
+            with self._lock:
+                if self._held and time.monotonic() >= self._valid_until:
+                    # Expired by now as far as we can tell; someone else may own them
+                    self._mark_lost(set(self._held))
+                    self._held = set()
+            return False
+        self.renewals += 1
+        self._update(result, started)
+        return True
+
+    def _update(self, result: Dict[str, Any], started: float) -> Set[int]:
+        held = set(result.get("partitions", []))
+        self.num_partitions = result.get("numPartitions", self.num_partitions)
+        with self._lock:
+            gained, lost = held - self._held, self._held - held
+            self._mark_lost(lost)
+            self._lost -= held  # Reclaimed before eviction: keep the detectors
+            self._held = held
+            self._valid_until = started + self.ttl
+        if gained or lost:
+            logger.info("Leases: %d partitions held (+%d/-%d) as %s", len(held), len(gained), len(lost), self.owner)
+        return held
+
+    def _mark_lost(self, partitions: Set[int]):
+        self._lost |= partitions
+        self.lost += len(partitions)
+
+    def evict_lost(self, scorer) -> int:
+        """
+        Drop detectors of devices in partitions lost since the last call, via
+        scorer.forget_partitions. Call from the thread that runs the scorer.
+        """
+        with self._lock:
+            lost, self._lost = self._lost, set()
+        if lost:
+            scorer.forget_partitions(lost, self.num_partitions)
+            logger.info("Dropped detectors for %d lost partitions", len(lost))
+        return len(lost)
+
+    # === Background renewal ===
+
+    def start(self):
+        """Start renewing held leases every ttl/3 seconds"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._renew_loop, name="lease-renewal", daemon=True)
+            self._thread.start()
+
+    def _renew_loop(self):
+        while not self._stop.wait(self.ttl / 3):
+            self.renew()  # Also keeps this poller counted in the fair share while it holds nothing
+
+    def stop(self, release: bool = True):
+        """Stop renewing and (by default) release every lease so others can take them at once"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        if release:
+            try:
+                self.convex.release_leases(self.owner)
+            except Exception as e:
+                logger.warning("✗ Could not release leases: %s", e)
+        with self._lock:
+            self._held = set()
+
+    def stats(self) -> Dict[str, int]:
+        """Counters for monitoring"""
+        return {
+            'partitions': len(self._held),
+            'claims': self.claims,
+            'renewals': self.renewals,
+            'failures': self.failures,
+            'lost': self.lost,
+        }
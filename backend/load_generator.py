@@ -0,0 +1,261 @@
+"""
+Load generator: simulates many ESP32 devices posting to /sensor-data.
+
+Each simulated device produces a correlated series instead of independent
+random values:
+  - rain comes in storms (a dry/raining Markov chain with gamma-distributed intensity)
+  - soil moisture rises with rain and drains back toward a field-capacity baseline
+  - tilt creeps slowly, faster when the soil is saturated, with occasional slip
+    events (sudden jumps) whose odds grow with saturation
+
+Requests are paced to an aggregate target rate across a pool of worker threads,
+each with its own keep-alive session. Latency is reported both from the moment
+a request was sent and from when it was scheduled, so a server that falls
+behind shows up in the numbers instead of silently lowering the send rate.
+
+    python load_generator.py --devices 2000 --rate 500 --duration 60
+    python load_generator.py --url http://127.0.0.1:3210 --devices 5000 --rate 2000 --workers 64
+"""
+
+import argparse
+import math
+import os
+import random
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+
+load_dotenv()
+
+CONVEX_URL = os.getenv("CONVEX_URL_SITE", "https://your-deployment.convex.site")
+
+
+class DeviceSimulator:
+    """Correlated rain -> soil saturation -> tilt series for one device"""
+
+    def __init__(self, device_id: str, location: str, rng: random.Random):
+        self.device_id = device_id
+        self.location = location
+        self.rng = rng
+
+        # Each site has its own soil and slope
+        self.field_capacity = rng.uniform(30.0, 50.0)   # Soil moisture the site drains back to (%)
+        self.drainage = rng.uniform(0.02, 0.08)         # Fraction of excess moisture lost per step
+        self.creep_rate = rng.uniform(0.0005, 0.003)    # Baseline tilt creep per step (°)
+
+        self.raining = False
+        self.storm_intensity = 0.0
+        self.rain = 0.0
+        self.soil = self.field_capacity
+        self.tilt = rng.uniform(0.5, 5.0)
+
+    def step(self) -> Dict[str, Any]:
+        """Advance one reading and return it as a /sensor-data body"""
+        rng = self.rng
+
+        # Rain: storms start rarely and end after a while
+        if self.raining:
+            if rng.random() < 0.05:
+                self.raining = False
+        elif rng.random() < 0.01:
+            self.raining = True
+            self.storm_intensity = rng.gammavariate(2.0, 15.0)
+        target = self.storm_intensity if self.raining else 0.0
+        self.rain = max(0.0, 0.7 * self.rain + 0.3 * target + rng.gauss(0.0, 1.5 if self.raining else 0.3))
+
+        # Soil: infiltration from rain, exponential drainage toward field capacity
+        self.soil += 0.08 * self.rain * (100.0 - self.soil) / 100.0
+        self.soil -= self.drainage * (self.soil - self.field_capacity)
+        self.soil = min(100.0, max(0.0, self.soil + rng.gauss(0.0, 0.3)))
+
+        # Tilt: creep accelerates with saturation; slips become likelier near saturation
+        saturation = max(0.0, (self.soil - self.field_capacity) / (100.0 - self.field_capacity))
+        self.tilt += self.creep_rate * (1.0 + 10.0 * saturation ** 2)
+        if rng.random() < 0.0005 + 0.02 * saturation ** 3:
+            self.tilt += rng.expovariate(1.0 / 4.0)  # Slip event, ~4° on average
+        self.tilt = min(90.0, self.tilt)
+
+        return {
+            "device_id": self.device_id,
+            "location": self.location,
+            "rain_value": round(min(100.0, self.rain), 2),
+            "soil_moisture": round(self.soil, 2),
+            "tilt_value": round(max(0.0, self.tilt + rng.gauss(0.0, 0.05)), 2),
+        }
+
+
+class LoadGenerator:
+    """Paces readings from many simulated devices to a target aggregate rate"""
+
+    def __init__(self, url: str, devices: int = 1000, rate: float = 100.0, workers: int = 16,
+                 timeout: float = 10.0, seed: Optional[int] = None):
+        self.endpoint = f"{url.rstrip('/')}/sensor-data"
+        self.rate = rate
+        self.workers = workers
+        self.timeout = timeout
+
+        rng = random.Random(seed)
+        self.devices = [
+            DeviceSimulator(f"ESP32-{i:05d}", f"Site {i // 10 + 1}", random.Random(rng.random()))
+            for i in range(devices)
+        ]
+        # A device's simulator is only stepped by the thread that sends its reading
+        self._device_locks = [threading.Lock() for _ in self.devices]
+
+        self._lock = threading.Lock()
+        self._next_ticket = 0
+        self._stop = threading.Event()
+
+        # Results (appended under _lock)
+        self.service_ns: List[int] = []     # Send -> response
+        self.response_ns: List[int] = []    # Scheduled -> response (includes time spent behind schedule)
+        self.statuses: Dict[str, int] = {}
+        self.sent = 0
+
+    def _take_ticket(self) -> int:
+        with self._lock:
+            ticket = self._next_ticket
+            self._next_ticket += 1
+            return ticket
+
+    def _session(self) -> requests.Session:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=1)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def _worker(self, start: float, deadline: float):
+        session = self._session()
+        try:
+            while not self._stop.is_set():
+                ticket = self._take_ticket()
+                scheduled = start + ticket / self.rate
+                if scheduled >= deadline:
+                    return
+                delay = scheduled - time.perf_counter()
+                if delay > 0 and self._stop.wait(delay):
+                    return
+
+                index = ticket % len(self.devices)
+                with self._device_locks[index]:
+                    reading = self.devices[index].step()
+
+                sent = time.perf_counter_ns()
+                try:
+                    response = session.post(self.endpoint, json=reading, timeout=self.timeout)
+                    status = str(response.status_code)
+                except requests.RequestException as e:
+                    status = type(e).__name__
+                done = time.perf_counter_ns()
+
+                with self._lock:
+                    self.sent += 1
+                    self.statuses[status] = self.statuses.get(status, 0) + 1
+                    self.service_ns.append(done - sent)
+                    self.response_ns.append(done - int(scheduled * 1e9))
+        finally:
+            session.close()
+
+    def run(self, duration: float, report_every: float = 5.0) -> Dict[str, Any]:
+        """Send for `duration` seconds and return the summary"""
+        start = time.perf_counter() + 0.05
+        deadline = start + duration
+        threads = [
+            threading.Thread(target=self._worker, args=(start, deadline), name=f"load-{i}", daemon=True)
+            for i in range(self.workers)
+        ]
+        for thread in threads:
+            thread.start()
+
+        try:
+            last_sent, last_time = 0, start
+            while any(thread.is_alive() for thread in threads):
+                time.sleep(min(report_every, max(0.1, deadline - time.perf_counter())))
+                now = time.perf_counter()
+                if now - last_time >= report_every:
+                    sent = self.sent
+                    print(f"  {now - start:6.1f}s  sent={sent}  rate={(sent - last_sent) / (now - last_time):.1f}/s"
+                          f"  errors={self.errors()}")
+                    last_sent, last_time = sent, now
+        except KeyboardInterrupt:
+            print("\nStopping load generator...")
+            self._stop.set()
+        for thread in threads:
+            thread.join()
+
+        return self.summary(time.perf_counter() - start)
+
+    def errors(self) -> int:
+        return sum(count for status, count in self.statuses.items() if status not in ("200", "201"))
+
+    def summary(self, elapsed: float) -> Dict[str, Any]:
+        """Achieved throughput and latency percentiles (milliseconds)"""
+        with self._lock:
+            service = np.asarray(self.service_ns, dtype=np.float64) / 1e6
+            response = np.asarray(self.response_ns, dtype=np.float64) / 1e6
+            statuses = dict(self.statuses)
+            sent = self.sent
+
+        def pct(values: np.ndarray) -> Dict[str, float]:
+            if not len(values):
+                return {}
+            p50, p90, p99 = (float(p) for p in np.percentile(values, [50, 90, 99]))
+            return {"p50": round(p50, 2), "p90": round(p90, 2), "p99": round(p99, 2),
+                    "max": round(float(values.max()), 2)}
+
+        return {
+            "devices": len(self.devices),
+            "targetRate": self.rate,
+            "achievedRate": round(sent / elapsed, 1) if elapsed > 0 else 0.0,
+            "sent": sent,
+            "errors": self.errors(),
+            "statuses": statuses,
+            "serviceLatencyMs": pct(service),
+            "responseLatencyMs": pct(response),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate many ESP32 devices posting to /sensor-data")
+    parser.add_argument("--url", default=CONVEX_URL, help="site URL (default: CONVEX_URL_SITE)")
+    parser.add_argument("--devices", type=int, default=1000, help="number of simulated devices")
+    parser.add_argument("--rate", type=float, default=100.0, help="target aggregate requests/sec")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds to run")
+    parser.add_argument("--workers", type=int, default=0, help="sender threads (default: from rate)")
+    parser.add_argument("--timeout", type=float, default=10.0, help="per-request timeout (seconds)")
+    parser.add_argument("--seed", type=int, help="seed for reproducible series")
+    args = parser.parse_args()
+
+    if "your-deployment" in args.url:
+        print("⚠️  WARNING: Please update CONVEX_URL_SITE in backend/.env file or pass --url")
+        return
+
+    # Enough threads to sustain the rate at ~50ms per request, within sane bounds
+    workers = args.workers or max(4, min(256, math.ceil(args.rate * 0.05)))
+
+    print("=" * 60)
+    print("Load Generator - Landslide IoT System")
+    print("=" * 60)
+    print(f"Target URL: {args.url}/sensor-data")
+    print(f"Devices: {args.devices}, target rate: {args.rate}/s, workers: {workers}, duration: {args.duration}s\n")
+
+    generator = LoadGenerator(args.url, devices=args.devices, rate=args.rate, workers=workers,
+                              timeout=args.timeout, seed=args.seed)
+    summary = generator.run(args.duration)
+
+    print("\n" + "=" * 60)
+    print(f"Sent {summary['sent']} readings from {summary['devices']} devices")
+    print(f"Achieved rate: {summary['achievedRate']}/s (target {summary['targetRate']}/s)")
+    print(f"Statuses: {summary['statuses']}")
+    print(f"Service latency (ms):  {summary['serviceLatencyMs']}")
+    print(f"Response latency (ms): {summary['responseLatencyMs']}  (from scheduled send time)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,567 @@
+"""
+Local in-memory stand-in for the Convex HTTP API.
+
+Implements `/api/query` and `/api/mutation` for the `sensorData:*`, `leases:*` and `rollups:*` functions
+used by ConvexClient, plus the `/sensor-data` and `/health` HTTP routes, so the
+poller can be load- and soak-tested repeatably without a network.
+
+Tables keep the same indexes as web-app/convex/schema.ts, and every query
+walks an index the way its Convex counterpart does, so query cost grows with
+the page size rather than the table size. Latency and errors can be injected
+per request to exercise batching, backpressure and retry behavior.
+
+Unlike the deployed `/sensor-data` route, readings are only stored here; risk
+scoring is left to the Python poller so its throughput can be measured.
+
+    python local_convex.py --port 3210 --latency-ms 20 --error-rate 0.01
+    CONVEX_URL_CLOUD=http://127.0.0.1:3210 python app.py
+"""
+
+import argparse
+import bisect
+import copy
+import itertools
+import json
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from leases import LEASE_PARTITIONS, partition_for
+from rollups import merge_rollup
+
+# Index definitions from web-app/convex/schema.ts
+SENSOR_DATA_INDEXES = {
+    "by_timestamp": ("timestamp",),
+    "by_processed": ("processed",),
+    "by_processed_timestamp": ("processed", "timestamp"),
+    "by_processed_partition_timestamp": ("processed", "partition", "timestamp"),
+    "by_device": ("deviceId",),
+}
+ANOMALY_RESULTS_INDEXES = {
+    "by_timestamp": ("timestamp",),
+    "by_risk_state": ("riskState",),
+    "by_device": ("deviceId",),
+    "by_sensor_data": ("sensorDataId",),
+}
+DEVICE_LEASES_INDEXES = {
+    "by_partition": ("partition",),
+    "by_owner": ("owner",),
+}
+LEASE_OWNERS_INDEXES = {
+    "by_owner": ("owner",),
+}
+RESULT_ROLLUPS_INDEXES = {
+    "by_device_granularity_bucket": ("deviceId", "granularity", "bucketStart"),
+    "by_granularity_bucket": ("granularity", "bucketStart"),
+}
+
+_MISSING = (0,)   # Undefined fields sort first, as in Convex
+_END = (2,)       # Sorts after every present value; closes a prefix range
+
+
+def _sort_value(value: Any) -> Tuple:
+    return _MISSING if value is None else (1, value)
+
+
+class InjectedError(Exception):
+    """A failure injected by the fault settings, reported as HTTP 503"""
+
+
+class Table:
+    """Documents by _id plus sorted index entries (index fields..., creation order, _id)"""
+
+    def __init__(self, name: str, indexes: Dict[str, Tuple[str, ...]]):
+        self.name = name
+        self.docs: Dict[str, Dict[str, Any]] = {}
+        self.indexes = dict(indexes, by_creation_time=())
+        self._entries: Dict[str, List[Tuple]] = {index: [] for index in self.indexes}
+        self._seq: Dict[str, int] = {}
+        self._ids = itertools.count(1)
+
+    def __len__(self) -> int:
+        return len(self.docs)
+
+    def _entry(self, index: str, doc: Dict[str, Any]) -> Tuple:
+        fields = self.indexes[index]
+        return tuple(_sort_value(doc.get(f)) for f in fields) + ((1, self._seq[doc["_id"]]), doc["_id"])
+
+    def insert(self, fields: Dict[str, Any]) -> str:
+        seq = next(self._ids)
+        doc_id = f"{self.name}_{seq:08d}"
+        doc = {key: value for key, value in fields.items() if value is not None}
+        doc["_id"] = doc_id
+        self._seq[doc_id] = seq
+        self.docs[doc_id] = doc
+        for index in self.indexes:
+            bisect.insort(self._entries[index], self._entry(index, doc))
+        return doc_id
+
+    def get(self, doc_id: str) -> Optional[Dict[str, Any]]:
+        return self.docs.get(doc_id)
+
+    def delete(self, doc_id: str):
+        doc = self.docs[doc_id]
+        for index in self.indexes:
+            entries = self._entries[index]
+            del entries[bisect.bisect_left(entries, self._entry(index, doc))]
+        del self.docs[doc_id]
+        del self._seq[doc_id]
+
+    def patch(self, doc_id: str, fields: Dict[str, Any]):
+        doc = self.docs.get(doc_id)
+        if doc is None:
+            raise ValueError(f"{self.name} not found: {doc_id}")
+        touched = [index for index, idx_fields in self.indexes.items() if set(idx_fields) & set(fields)]
+        for index in touched:
+            entries = self._entries[index]
+            del entries[bisect.bisect_left(entries, self._entry(index, doc))]
+        doc.update(fields)
+        for index in touched:
+            bisect.insort(self._entries[index], self._entry(index, doc))
+
+    def scan(self, index: str, eq: Tuple = (), after: Optional[Tuple] = None,
+             desc: bool = False) -> Iterator[Tuple[Tuple, Dict[str, Any]]]:
+        """Yield (entry, doc) in index order for entries whose leading fields equal `eq`, resuming after `after`"""
+        entries = self._entries[index]
+        prefix = tuple(_sort_value(v) for v in eq)
+        lo = bisect.bisect_left(entries, prefix)
+        hi = bisect.bisect_left(entries, prefix + (_END,))
+        if after is not None:
+            if desc:
+                hi = min(hi, bisect.bisect_left(entries, after))
+            else:
+                lo = max(lo, bisect.bisect_right(entries, after))
+        positions = range(hi - 1, lo - 1, -1) if desc else range(lo, hi)
+        for i in positions:
+            entry = entries[i]
+            yield entry, self.docs[entry[-1]]
+
+    def take(self, index: str, limit: int, eq: Tuple = (), desc: bool = False) -> List[Dict[str, Any]]:
+        return [doc for _, doc in itertools.islice(self.scan(index, eq, desc=desc), limit)]
+
+
+def _encode_cursor(entry: Tuple) -> str:
+    return json.dumps(entry)
+
+
+def _decode_cursor(cursor: str) -> Tuple:
+    return tuple(tuple(part) if isinstance(part, list) else part for part in json.loads(cursor))
+
+
+class LocalConvex:
+    """In-memory Convex tables with the sensorData:*, leases:* and rollups:* functions"""
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0,
+                 lost_response_rate: float = 0.0, seed: Optional[int] = None):
+        self.sensor_data = Table("sensorData", SENSOR_DATA_INDEXES)
+        self.anomaly_results = Table("anomalyResults", ANOMALY_RESULTS_INDEXES)
+        self.device_leases = Table("deviceLeases", DEVICE_LEASES_INDEXES)
+        self.lease_owners = Table("leaseOwners", LEASE_OWNERS_INDEXES)
+        self.result_rollups = Table("resultRollups", RESULT_ROLLUPS_INDEXES)
+        self.lock = threading.Lock()
+
+        # Fault injection, applied per request; may be changed while serving
+        self.latency = latency          # Seconds added to every call
+        self.jitter = jitter            # Up to this many extra seconds, uniformly random
+        self.error_rate = error_rate    # Probability a call fails before touching any table
+        self.lost_response_rate = lost_response_rate  # Probability a mutation is applied but reported as failed
+        self._rng = random.Random(seed)
+
+        # Counters
+        self.calls: Dict[str, int] = {}
+        self.injected_errors: Dict[str, int] = {}
+
+        self.queries: Dict[str, Callable[[Dict[str, Any]], Any]] = {
+            "sensorData:getUnprocessedData": self.get_unprocessed_data,
+            "sensorData:getUnprocessedDataPage": self.get_unprocessed_data_page,
+            "sensorData:getUnprocessedPartitionPage": self.get_unprocessed_partition_page,
+            "sensorData:getLatestResults": self.get_latest_results,
+            "sensorData:getLatestResult": self.get_latest_result,
+            "sensorData:getAllSensorData": self.get_all_sensor_data,
+            "anomalyResults:getLatest": self.get_latest_anomaly,
+            "leases:getLeases": self.get_leases,
+            "rollups:getRollups": self.get_rollups,
+        }
+        self.mutations: Dict[str, Callable[[Dict[str, Any]], Any]] = {
+            "sensorData:addSensorData": self.add_sensor_data,
+            "sensorData:markAsProcessed": self.mark_as_processed,
+            "sensorData:markManyAsProcessed": self.mark_many_as_processed,
+            "sensorData:addAnomalyResult": self.add_anomaly_result,
+            "sensorData:addAnomalyResultsBatch": self.add_anomaly_results_batch,
+            "leases:claimLeases": self.claim_leases,
+            "leases:renewLeases": self.renew_leases,
+            "leases:releaseLeases": self.release_leases,
+            "rollups:mergeRollups": self.merge_rollups,
+        }
+
+    # === Queries ===
+
+    def get_unprocessed_data(self, args: Dict[str, Any]) -> List[Dict[str, Any]]:
+        return [doc for _, doc in self.sensor_data.scan("by_processed", (False,))]
+
+    def get_unprocessed_data_page(self, args: Dict[str, Any]) -> Dict[str, Any]:
+        return self._page("by_processed_timestamp", (False,), args["paginationOpts"])
+
+    def get_unprocessed_partition_page(self, args: Dict[str, Any]) -> Dict[str, Any]:
+        return self._page("by_processed_partition_timestamp", (False, args.get("partition")), args["paginationOpts"])
+
+    def _page(self, index: str, eq: Tuple, opts: Dict[str, Any]) -> Dict[str, Any]:
+        num_items = opts["numItems"]
+        after = _decode_cursor(opts["cursor"]) if opts.get("cursor") else None
+        rows = list(itertools.islice(self.sensor_data.scan(index, eq, after=after), num_items))
+        page = [doc for _, doc in rows]
+        cursor = _encode_cursor(rows[-1][0]) if rows else (opts.get("cursor") or "")
+        return {"page": page, "isDone": len(page) < num_items, "continueCursor": cursor}
+
+    def get_latest_results(self, args: Dict[str, Any]) -> List[Dict[str, Any]]:
+        limit = args.get("limit", 50)
+        if args.get("deviceId"):
+            return self.anomaly_results.take("by_device", limit, (args["deviceId"],), desc=True)
+        return self.anomaly_results.take("by_timestamp", limit, desc=True)
+
+    def get_latest_result(self, args: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        results = self.get_latest_results(dict(args, limit=1))
+        return results[0] if results else None
+
+    def get_latest_anomaly(self, args: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        results = self.anomaly_results.take("by_creation_time", 1, desc=True)
+        return results[0] if results else None
+
+    def get_all_sensor_data(self, args: Dict[str, Any]) -> List[Dict[str, Any]]:
+        return self.sensor_data.take("by_timestamp", args.get("limit", 50), desc=True)
+
+    def get_leases(self, args: Dict[str, Any]) -> List[Dict[str, Any]]:
+        return [doc for _, doc in self.device_leases.scan("by_partition")]
+
+    # === Mutations ===
+
+    def add_sensor_data(self, args: Dict[str, Any]) -> str:
+        # `timestamp` is not part of the real mutation; accepted here so tests can seed ordered data
+        return self.sensor_data.insert({
+            "timestamp": args.get("timestamp") or datetime.now(timezone.utc).isoformat(timespec="milliseconds"),
+            "deviceId": args.get("deviceId"),
+            "location": args.get("location"),
+            "rainValue": float(args["rainValue"]),
+            "soilMoisture": float(args["soilMoisture"]),
+            "tiltValue": float(args["tiltValue"]),
+            "processed": False,
+            "partition": partition_for(args.get("deviceId")),
+        })
+
+    def mark_as_processed(self, args: Dict[str, Any]) -> None:
+        self.sensor_data.patch(args["id"], {"processed": True})
+
+    def mark_many_as_processed(self, args: Dict[str, Any]) -> List[Dict[str, Any]]:
+        statuses = []
+        for doc_id in args["ids"]:
+            if self.sensor_data.get(doc_id) is None:
+                statuses.append({"id": doc_id, "ok": False, "error": "sensorData not found"})
+                continue
+            self.sensor_data.patch(doc_id, {"processed": True})
+            statuses.append({"id": doc_id, "ok": True})
+        return statuses
+
+    def _existing_result(self, sensor_data_id: str) -> Optional[Dict[str, Any]]:
+        results = self.anomaly_results.take("by_sensor_data", 1, (sensor_data_id,))
+        return results[0] if results else None
+
+    def add_anomaly_result(self, args: Dict[str, Any]) -> str:
+        if self.sensor_data.get(args["sensorDataId"]) is None:
+            raise ValueError("sensorData not found")
+        existing = self._existing_result(args["sensorDataId"])
+        if existing is not None:
+            return existing["_id"]
+        return self.anomaly_results.insert(args)
+
+    def add_anomaly_results_batch(self, args: Dict[str, Any]) -> List[Dict[str, Any]]:
+        statuses = []
+        lease_owner = args.get("leaseOwner")
+        for result in args["results"]:
+            sensor_data_id = result["sensorDataId"]
+            source = self.sensor_data.get(sensor_data_id)
+            if source is None:
+                statuses.append({"sensorDataId": sensor_data_id, "ok": False, "error": "sensorData not found"})
+                continue
+            if lease_owner is not None and not self._holds_lease(source.get("partition") or 0, lease_owner):
+                statuses.append({"sensorDataId": sensor_data_id, "ok": False, "error": "lease lost"})
+                continue
+            existing = self._existing_result(sensor_data_id)
+            doc_id = existing["_id"] if existing else self.anomaly_results.insert(result)
+            if args.get("markProcessed", True) and not source["processed"]:
+                self.sensor_data.patch(sensor_data_id, {"processed": True})
+            status = {"sensorDataId": sensor_data_id, "ok": True, "id": doc_id}
+            if existing:
+                status["duplicate"] = True
+            statuses.append(status)
+        return statuses
+
+    # === Leases ===
+
+    def _holds_lease(self, partition: int, owner: str) -> bool:
+        leases = self.device_leases.take("by_partition", 1, (partition,))
+        return bool(leases) and leases[0]["owner"] == owner and leases[0]["expiresAt"] > time.time() * 1000
+
+    def _heartbeat(self, owner: str, expires_at: float):
+        existing = self.lease_owners.take("by_owner", 1, (owner,))
+        if existing:
+            self.lease_owners.patch(existing[0]["_id"], {"expiresAt": expires_at})
+        else:
+            self.lease_owners.insert({"owner": owner, "expiresAt": expires_at})
+
+    def claim_leases(self, args: Dict[str, Any]) -> Dict[str, Any]:
+        owner = args["owner"]
+        now = time.time() * 1000
+        expires_at = now + args["ttlMs"]
+        self._heartbeat(owner, expires_at)
+        leases = [doc for _, doc in self.device_leases.scan("by_partition")]
+
+        owners = {owner}
+        for _, poller in list(self.lease_owners.scan("by_owner")):
+            if poller["expiresAt"] > now:
+                owners.add(poller["owner"])
+            else:
+                self.lease_owners.delete(poller["_id"])
+        share = -(-LEASE_PARTITIONS // len(owners))
+        by_partition = {lease["partition"]: lease for lease in leases}
+        held = []
+        for lease in (l for l in leases if l["owner"] == owner):
+            if len(held) < share:
+                self.device_leases.patch(lease["_id"], {"expiresAt": expires_at})
+                held.append(lease["partition"])
+            else:
+                self.device_leases.delete(lease["_id"])
+        for partition in range(LEASE_PARTITIONS):
+            if len(held) >= share:
+                break
+            lease = by_partition.get(partition)
+            if lease is None:
+                self.device_leases.insert({"partition": partition, "owner": owner, "expiresAt": expires_at})
+            elif lease["owner"] != owner and lease["expiresAt"] <= now:
+                self.device_leases.patch(lease["_id"], {"owner": owner, "expiresAt": expires_at})
+            else:
+                continue
+            held.append(partition)
+        return {"owner": owner, "partitions": sorted(held), "numPartitions": LEASE_PARTITIONS, "expiresAt": expires_at}
+
+    def renew_leases(self, args: Dict[str, Any]) -> Dict[str, Any]:
+        owner = args["owner"]
+        expires_at = time.time() * 1000 + args["ttlMs"]
+        self._heartbeat(owner, expires_at)
+        held = []
+        for _, lease in list(self.device_leases.scan("by_owner", (owner,))):
+            self.device_leases.patch(lease["_id"], {"expiresAt": expires_at})
+            held.append(lease["partition"])
+        return {"owner": owner, "partitions": sorted(held), "numPartitions": LEASE_PARTITIONS, "expiresAt": expires_at}
+
+    def release_leases(self, args: Dict[str, Any]) -> int:
+        leases = [doc for _, doc in self.device_leases.scan("by_owner", (args["owner"],))]
+        for lease in leases:
+            self.device_leases.delete(lease["_id"])
+        for poller in self.lease_owners.take("by_owner", 1, (args["owner"],)):
+            self.lease_owners.delete(poller["_id"])
+        return len(leases)
+
+    # === Rollups ===
+
+    def merge_rollups(self, args: Dict[str, Any]) -> int:
+        for row in args["rollups"]:
+            key = (row.get("deviceId"), row["granularity"], row["bucketStart"])
+            existing = self.result_rollups.take("by_device_granularity_bucket", 1, key)
+            if existing:
+                stored = copy.deepcopy({k: v for k, v in existing[0].items() if k != "_id"})
+                self.result_rollups.patch(existing[0]["_id"], merge_rollup(stored, row))
+            else:
+                self.result_rollups.insert(row)
+        return len(args["rollups"])
+
+    def get_rollups(self, args: Dict[str, Any]) -> List[Dict[str, Any]]:
+        if args.get("deviceId"):
+            index, eq = "by_device_granularity_bucket", (args["deviceId"], args["granularity"])
+        else:
+            index, eq = "by_granularity_bucket", (args["granularity"],)
+        after = tuple(_sort_value(v) for v in eq + (args["to"],)) if "to" in args else None
+        rows = []
+        for _, doc in self.result_rollups.scan(index, eq, after=after, desc=True):
+            if len(rows) >= args.get("limit", 500) or doc["bucketStart"] < args.get("from", 0):
+                break
+            row = dict(doc)
+            for metric in ("rain", "soil", "tilt", "risk"):
+                if metric in row:
+                    row[metric] = dict(row[metric], mean=row[metric]["sum"] / row["count"])
+            rows.append(row)
+        return rows[::-1]
+
+    # === Dispatch ===
+
+    def _inject_faults(self, path: str):
+        """Sleep for the configured latency, then fail with probability error_rate"""
+        delay = self.latency + (self.jitter * self._rng.random() if self.jitter else 0.0)
+        if delay > 0:
+            time.sleep(delay)
+        if self.error_rate and self._rng.random() < self.error_rate:
+            with self.lock:
+                self.injected_errors[path] = self.injected_errors.get(path, 0) + 1
+            raise InjectedError(f"Injected failure for {path}")
+
+    def call(self, kind: str, path: str, args: Dict[str, Any]) -> Any:
+        """Run a function the way /api/query and /api/mutation would"""
+        functions = self.queries if kind == "query" else self.mutations
+        if path not in functions:
+            raise KeyError(f"Unknown {kind}: {path}")
+        with self.lock:
+            self.calls[path] = self.calls.get(path, 0) + 1
+        self._inject_faults(path)  # Outside the lock so slow calls still overlap
+        with self.lock:
+            value = functions[path](args)
+        if kind == "mutation" and self.lost_response_rate and self._rng.random() < self.lost_response_rate:
+            with self.lock:
+                self.injected_errors[path] = self.injected_errors.get(path, 0) + 1
+            raise InjectedError(f"Injected lost response for {path}")
+        return value
+
+    def stats(self) -> Dict[str, Any]:
+        """Table sizes and per-function call counts"""
+        with self.lock:
+            unprocessed = sum(1 for _ in self.sensor_data.scan("by_processed", (False,)))
+            return {
+                "sensorData": len(self.sensor_data),
+                "unprocessed": unprocessed,
+                "anomalyResults": len(self.anomaly_results),
+                "resultRollups": len(self.result_rollups),
+                "calls": dict(self.calls),
+                "injectedErrors": dict(self.injected_errors),
+            }
+
+
+def parse_sensor_reading(data: Any) -> Optional[Dict[str, Any]]:
+    """Validate an ESP32 /sensor-data body like http.ts; returns addSensorData args or None"""
+    if not isinstance(data, dict):
+        return None
+    values = [data.get("rain_value"), data.get("soil_moisture"), data.get("tilt_value")]
+    if not all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in values):
+        return None
+    device_id, location = data.get("device_id"), data.get("location")
+    return {
+        "deviceId": device_id if isinstance(device_id, str) else None,
+        "location": location if isinstance(location, str) else None,
+        "rainValue": values[0],
+        "soilMoisture": values[1],
+        "tiltValue": values[2],
+    }
+
+
+def make_handler(store: LocalConvex):
+    """Build a request handler class bound to `store`"""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # Keep-alive, like the real deployment
+        disable_nagle_algorithm = True  # Avoid 40ms delayed-ACK stalls on kept-alive connections
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send_json(self, status: int, body: Any):
+            payload = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def _read_json(self) -> Any:
+            length = int(self.headers.get("Content-Length", 0))
+            return json.loads(self.rfile.read(length) or b"{}")
+
+        def do_GET(self):
+            route = self.path.split("?", 1)[0].rstrip("/")
+            if route == "/health":
+                self._send_json(200, {"status": "ok", "service": "Landslide IoT System (local)"})
+            elif route == "/stats":
+                self._send_json(200, store.stats())
+            else:
+                self._send_json(404, {"status": "error", "message": f"Unknown route {self.path}"})
+
+        def do_POST(self):
+            try:
+                body = self._read_json()
+            except ValueError:
+                self._send_json(400, {"status": "error", "errorMessage": "Invalid JSON"})
+                return
+
+            route = self.path.split("?", 1)[0].rstrip("/")
+            if route == "/sensor-data":
+                self._sensor_data(body)
+                return
+            if route not in ("/api/query", "/api/mutation"):
+                self._send_json(404, {"status": "error", "errorMessage": f"Unknown route {self.path}"})
+                return
+            try:
+                value = store.call(route.rsplit("/", 1)[-1], body.get("path", ""), body.get("args", {}))
+                self._send_json(200, {"status": "success", "value": value})
+            except InjectedError as e:
+                self._send_json(503, {"status": "error", "errorMessage": str(e)})
+            except Exception as e:
+                self._send_json(500, {"status": "error", "errorMessage": str(e)})
+
+        def _sensor_data(self, body: Any):
+            reading = parse_sensor_reading(body)
+            if reading is None:
+                self._send_json(400, {"status": "error", "message": "Invalid data format"})
+                return
+            try:
+                doc_id = store.call("mutation", "sensorData:addSensorData", reading)
+                latest = store.call("query", "anomalyResults:getLatest", {})
+            except InjectedError as e:
+                self._send_json(503, {"status": "error", "message": str(e), "riskState": "Low"})
+                return
+            self._send_json(201, {
+                "status": "success",
+                "id": doc_id,
+                "message": "Data received (risk calculation pending)",
+                "riskState": (latest or {}).get("riskState", "Low"),
+            })
+
+    return Handler
+
+
+def serve(store: Optional[LocalConvex] = None, host: str = "127.0.0.1", port: int = 0):
+    """Start a threaded server in the background; returns (server, base_url, store)"""
+    store = store or LocalConvex()
+    server = ThreadingHTTPServer((host, port), make_handler(store))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}", store
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local in-memory Convex stand-in for load and soak tests")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=3210)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="latency added to every call")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="extra random latency, up to this much")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="probability a call fails with 503")
+    parser.add_argument("--lost-response-rate", type=float, default=0.0,
+                        help="probability a mutation is applied but still fails with 503")
+    parser.add_argument("--seed", type=int, help="seed for latency jitter and error injection")
+    args = parser.parse_args()
+
+    store = LocalConvex(latency=args.latency_ms / 1000.0, jitter=args.jitter_ms / 1000.0,
+                        error_rate=args.error_rate, lost_response_rate=args.lost_response_rate, seed=args.seed)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(store))
+    server.daemon_threads = True
+    print(f"✓ Local Convex listening on http://{args.host}:{args.port}")
+    print(f"  latency={args.latency_ms}ms jitter={args.jitter_ms}ms error_rate={args.error_rate} "
+          f"lost_response_rate={args.lost_response_rate}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nShutting down...")
+    finally:
+        server.server_close()
+        print(f"Final stats: {json.dumps(store.stats())}")
+
+
+if __name__ == "__main__":
+    main()
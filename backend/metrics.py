@@ -0,0 +1,357 @@
+"""
+Processor instrumentation: counters, gauges and histograms rendered in the
+Prometheus text exposition format, served on a local HTTP endpoint, plus
+leveled, rate-limited logging.
+
+Metrics are module-level so any stage can record into them without threading
+a registry through every constructor:
+
+    from metrics import CONVEX_REQUEST_SECONDS
+    with CONVEX_REQUEST_SECONDS.time(kind="query", path="sensorData:getUnprocessedDataPage"):
+        ...
+"""
+
+import bisect
+import contextlib
+import logging
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+RECORD_LATENCY_BUCKETS = (1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 1e-2)
+SIZE_BUCKETS = (1, 5, 10, 25, 50, 100, 200, 500, 1000, 5000)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value != value:
+        return "NaN"
+    if value in (float("inf"), float("-inf")):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class _Metric:
+    """Base for labelled metrics; values are kept per tuple of label values"""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"] + self._samples()
+
+
+class Counter(_Metric):
+    """Monotonically increasing count"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        if amount <= 0:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(v)}" for key, v in items]
+
+
+class Gauge(_Metric):
+    """Value that can go up and down, or be read from a callback at scrape time"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 function: Optional[Callable[[], float]] = None):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self.function = function
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self) -> List[str]:
+        if self.function is not None:
+            return [f"{self.name} {_format_value(self.function())}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(v)}" for key, v in items]
+
+
+class Histogram(_Metric):
+    """Bucketed distribution with cumulative `le` buckets, sum and count"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [per-bucket counts (last is +Inf)], sum, count
+        self._series: Dict[Tuple[str, ...], List[Any]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextlib.contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        """Observe the wall time of the block, even if it raises"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels) -> int:
+        series = self._series.get(self._key(labels))
+        return series[2] if series else 0
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, ([*s[0]], s[1], s[2])) for key, s in self._series.items())
+        lines = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+def _snake_case(name: str) -> str:
+    return re.sub(r"(?<!^)(?=[A-Z])", "_", name).lower()
+
+
+class MetricsRegistry:
+    """Holds metrics and stats callbacks and renders them for a scrape"""
+
+    def __init__(self, prefix: str = "landslide"):
+        self.prefix = prefix
+        self._metrics: List[_Metric] = []
+        self._stats: List[Tuple[str, Callable[[], Dict[str, Any]]]] = []
+        self._lock = threading.Lock()
+
+    def _add(self, metric: _Metric) -> Any:
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._add(Counter(f"{self.prefix}_{name}", help, labelnames))
+
+    def gauge(self, name: str, help: str, labelnames: Sequence[str] = (),
+              function: Optional[Callable[[], float]] = None) -> Gauge:
+        return self._add(Gauge(f"{self.prefix}_{name}", help, labelnames, function))
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._add(Histogram(f"{self.prefix}_{name}", help, labelnames, buckets))
+
+    def register_stats(self, component: str, stats: Callable[[], Dict[str, Any]]):
+        """Expose a component's stats() dict as gauges, e.g. scheduler.stats()['idleBackoffs'] -> landslide_scheduler_idle_backoffs"""
+        with self._lock:
+            self._stats = [(c, fn) for c, fn in self._stats if c != component] + [(component, stats)]
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)"""
+        with self._lock:
+            metrics = list(self._metrics)
+            stats = list(self._stats)
+
+        lines: List[str] = []
+        for metric in metrics:
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                logging.getLogger(__name__).warning("Could not render %s: %s", metric.name, e)
+        for component, fn in stats:
+            try:
+                values = fn()
+            except Exception as e:
+                logging.getLogger(__name__).warning("Could not collect %s stats: %s", component, e)
+                continue
+            for key, value in values.items():
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                name = f"{self.prefix}_{component}_{_snake_case(key)}"
+                lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+# === Processor metrics ===
+
+CONVEX_REQUEST_SECONDS = REGISTRY.histogram(
+    "convex_request_seconds", "Latency of Convex HTTP API calls", ("kind", "path"))
+CONVEX_REQUEST_FAILURES = REGISTRY.counter(
+    "convex_request_failures_total", "Convex HTTP API calls that raised", ("path",))
+FETCH_PAGE_RECORDS = REGISTRY.histogram(
+    "fetch_page_records", "Records per fetched page of unprocessed data", buckets=SIZE_BUCKETS)
+WRITE_BATCH_RECORDS = REGISTRY.histogram(
+    "write_batch_records", "Results per batched Convex write", buckets=SIZE_BUCKETS)
+SCORE_BATCH_SECONDS = REGISTRY.histogram(
+    "score_batch_seconds", "Time to score one fetched batch of records")
+SCORE_RECORD_SECONDS = REGISTRY.histogram(
+    "score_record_seconds", "Scoring time per record (batch time / batch size)", buckets=RECORD_LATENCY_BUCKETS)
+RECORDS = REGISTRY.counter(
+    "records_total", "Records handled, by outcome (saved, queued, write_failed, score_failed)", ("outcome",))
+DUPLICATE_RECORDS = REGISTRY.counter(
+    "duplicate_records_total",
+    "Records handled before, by where they were caught (seen, resent, queued, convex)", ("source",))
+PENDING_RECORDS = REGISTRY.gauge(
+    "pending_records", "Records fetched but not yet written")
+POLL_FOUND_RECORDS = REGISTRY.gauge(
+    "poll_found_records", "New records found by the last completed poll pass")
+LOOP_ERRORS = REGISTRY.counter(
+    "loop_errors_total", "Unexpected errors in the processing loop")
+
+
+def observe_scoring(records: int, seconds: float):
+    """Record the time spent scoring a batch of `records`"""
+    SCORE_BATCH_SECONDS.observe(seconds)
+    if records:
+        SCORE_RECORD_SECONDS.observe(seconds / records)
+
+
+def record_write_statuses(statuses: List[Dict[str, Any]]) -> int:
+    """Count per-record write outcomes (and results Convex already had); returns how many were saved"""
+    saved = sum(1 for status in statuses if status.get("ok"))
+    queued = sum(1 for status in statuses if status.get("queued"))
+    RECORDS.inc(saved, outcome="saved")
+    RECORDS.inc(queued, outcome="queued")
+    RECORDS.inc(len(statuses) - saved - queued, outcome="write_failed")
+    DUPLICATE_RECORDS.inc(sum(1 for status in statuses if status.get("duplicate")), source="convex")
+    return saved
+
+
+# === HTTP endpoint ===
+
+def start_metrics_server(port: int, host: str = "127.0.0.1",
+                         registry: MetricsRegistry = REGISTRY) -> ThreadingHTTPServer:
+    """Serve GET /metrics from a background thread (loopback only unless `host` says otherwise)"""
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.split("?", 1)[0] != "/metrics":
+                self.send_error(404)
+                return
+            payload = registry.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
+
+
+# === Logging ===
+
+class RateLimitFilter(logging.Filter):
+    """
+    Lets at most `limit` records of the same kind (logger, level, message
+    template) through per `interval` seconds. The first record let through
+    after a quiet spell notes how many were dropped.
+    """
+
+    def __init__(self, limit: int = 10, interval: float = 10.0):
+        super().__init__()
+        self.limit = limit
+        self.interval = interval
+        self._windows: Dict[Tuple[str, int, str], List[float]] = {}  # key -> [window start, sent, dropped]
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        key = (record.name, record.levelno, str(record.msg))
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= self.interval:
+                dropped = int(window[2]) if window else 0
+                self._windows[key] = [now, 1, 0]
+                if dropped:
+                    record.msg = f"{record.msg} ({dropped} similar messages suppressed)"
+                return True
+            if window[1] < self.limit:
+                window[1] += 1
+                return True
+            window[2] += 1
+            return False
+
+
+def configure_logging(level: str = "INFO", rate_limit: int = 10, interval: float = 10.0):
+    """Log to stdout at `level`, rate-limiting repeats of each message kind (0 disables the limit)"""
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)-7s %(name)s: %(message)s"))
+    if rate_limit > 0:
+        handler.addFilter(RateLimitFilter(rate_limit, interval))
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(level.upper())
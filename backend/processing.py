@@ -0,0 +1,278 @@
+import logging
+import queue
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Protocol, Set, Tuple, TypeVar, Union
+from anomaly_detector import SENSORS, AnomalyDetector, ScoreResult
+from convex_client import ConvexClient
+from detector_registry import DetectorRegistry
+from leases import partition_for
+from state_snapshot import load_snapshot, save_snapshot
+from metrics import DUPLICATE_RECORDS
+from profiling import PROFILER
+from write_behind import WriteBehind
+
+T = TypeVar("T")
+
+logger = logging.getLogger(__name__)
+
+
+def group_by_device(records: List[Dict[str, Any]]) -> "OrderedDict[Optional[str], List[Dict[str, Any]]]":
+    """Split records by deviceId, keeping arrival order within each device"""
+    groups: "OrderedDict[Optional[str], List[Dict[str, Any]]]" = OrderedDict()
+    for record in records:
+        groups.setdefault(record.get("deviceId"), []).append(record)
+    return groups
+
+
+def score_records(detector: AnomalyDetector, records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Score one device's records in a single batch and build addAnomalyResult payloads"""
+    rain = [r.get("rainValue", 0.0) for r in records]
+    soil = [r.get("soilMoisture", 0.0) for r in records]
+    tilt = [r.get("tiltValue", 0.0) for r in records]
+    with PROFILER.stage("score_batch"):
+        scores = detector.score_batch(rain, soil, tilt)
+
+    with PROFILER.stage("build_payloads"):
+        return _build_payloads(detector, records, rain, soil, tilt, scores)
+
+
+def _build_payloads(detector: AnomalyDetector, records: List[Dict[str, Any]], rain: List[float],
+                    soil: List[float], tilt: List[float], scores: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """addAnomalyResult payloads from score_batch output"""
+    table = detector.threshold_table
+    rows = zip(records, rain, soil, tilt, scores["riskScore"].tolist(), scores["riskState"].tolist(),
+               *(scores["zScores"][key].tolist() for key in SENSORS),
+               *(scores["rollingMean"][key].tolist() for key in SENSORS),
+               scores["thresholdCodes"].tolist())
+    return [
+        ScoreResult(risk, state, z_rain, z_soil, z_tilt, mean_rain, mean_soil, mean_tilt, code, table)
+        .to_payload(record, r, s, t)
+        for record, r, s, t, risk, state, z_rain, z_soil, z_tilt, mean_rain, mean_soil, mean_tilt, code in rows
+    ]
+
+
+class Scorer(Protocol):
+    """Turns fetched records into addAnomalyResult payloads (in-process or sharded)"""
+
+    def __call__(self, records: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[str]]: ...
+
+    def forget_partitions(self, partitions: Set[int], num_partitions: int) -> None: ...
+
+    def stats(self) -> Dict[str, int]: ...
+
+    def close(self) -> None: ...
+
+
+class LocalScorer:
+    """
+    Scores records in this process with a DetectorRegistry.
+
+    With a `snapshot_path`, detector windows are restored from it on start,
+    saved to it every `snapshot_interval` seconds and saved again on close.
+    """
+
+    def __init__(self, detectors: DetectorRegistry, snapshot_path: Optional[str] = None,
+                 snapshot_interval: float = 30.0):
+        self.detectors = detectors
+        self.snapshot_path = snapshot_path
+        self.snapshot_interval = snapshot_interval
+        self._last_snapshot = time.monotonic()
+        if snapshot_path:
+            try:
+                restored = load_snapshot(snapshot_path)
+                detectors.restore(restored)
+                if restored:
+                    logger.info("✓ Restored %d device windows from %s", len(restored), snapshot_path)
+            except Exception as e:
+                logger.warning("✗ Could not load state snapshot %s: %s", snapshot_path, e)
+
+    def __call__(self, records: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[str]]:
+        """
+        Score records per device, keeping each device's order.
+
+        Returns:
+            Tuple of (addAnomalyResult payloads, sensorData ids that could not be scored)
+        """
+        results: List[Dict[str, Any]] = []
+        failed_ids: List[str] = []
+        for device_id, device_records in group_by_device(records).items():
+            try:
+                with PROFILER.stage("history_rebuild"):
+                    detector = self.detectors.get(device_id, device_records[-1].get("location"))
+                # Calculate risk for the device's records in one vectorized pass
+                results.extend(score_records(detector, device_records))
+                self.detectors.mark_scored(device_id, device_records[-1].get("timestamp"))
+            except Exception as e:
+                logger.error("✗ Error scoring device %s: %s", device_id, e)
+                failed_ids.extend(r.get("_id") for r in device_records)
+
+        if self.snapshot_path and time.monotonic() - self._last_snapshot >= self.snapshot_interval:
+            self.snapshot()
+        return results, failed_ids
+
+    def snapshot(self):
+        """Save detector windows to the snapshot file"""
+        self._last_snapshot = time.monotonic()
+        try:
+            save_snapshot(self.detectors, self.snapshot_path)
+        except Exception as e:
+            logger.warning("✗ Could not save state snapshot %s: %s", self.snapshot_path, e)
+
+    def forget_partitions(self, partitions: Set[int], num_partitions: int) -> None:
+        """Drop detectors of devices in lease partitions this poller no longer holds"""
+        self.detectors.forget(lambda device_id: partition_for(device_id, num_partitions) in partitions)
+
+    def stats(self) -> Dict[str, int]:
+        """Counters for monitoring"""
+        return self.detectors.stats()
+
+    def close(self):
+        """Save a final snapshot"""
+        if self.snapshot_path:
+            self.snapshot()
+
+
+class ResultCache:
+    """
+    Bounded LRU of the sensorData ids this poller has handled, so records that
+    come back unprocessed (a lost response, a write that failed after scoring,
+    a page read before a write committed) are not scored twice.
+
+    A saved id maps to None: the record is skipped and only marked processed
+    again. A scored but unsaved id maps to its payload, which is resent as-is
+    instead of pushing the reading into its device's window a second time.
+    Thread-safe.
+    """
+
+    def __init__(self, max_size: int = 100000):
+        if max_size < 1:
+            raise ValueError("max_size must be at least 1")
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, Optional[Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        # Counters
+        self.skipped = 0
+        self.resent = 0
+        self.evictions = 0
+
+    def split(self, records: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[str], List[Dict[str, Any]]]:
+        """
+        Returns:
+            Tuple of (records to score, ids already saved, cached payloads to resend)
+        """
+        fresh: List[Dict[str, Any]] = []
+        saved_ids: List[str] = []
+        resend: List[Dict[str, Any]] = []
+        with self._lock:
+            for record in records:
+                record_id = record.get("_id")
+                if record_id not in self._entries:
+                    fresh.append(record)
+                    continue
+                self._entries.move_to_end(record_id)
+                payload = self._entries[record_id]
+                if payload is None:
+                    saved_ids.append(record_id)
+                else:
+                    resend.append(payload)
+            self.skipped += len(saved_ids)
+            self.resent += len(resend)
+        return fresh, saved_ids, resend
+
+    def scored(self, payloads: List[Dict[str, Any]]):
+        """Remember payloads until they are saved"""
+        with self._lock:
+            for payload in payloads:
+                self._put(payload["sensorDataId"], payload)
+
+    def record_statuses(self, statuses: List[Dict[str, Any]]):
+        """Apply write statuses: saved ids are kept as handled, lease-lost ones forgotten"""
+        with self._lock:
+            for status in statuses:
+                record_id = status.get("sensorDataId")
+                if status.get("ok"):
+                    self._put(record_id, None)
+                elif status.get("error") == "lease lost":
+                    self._entries.pop(record_id, None)  # Another poller scores it now
+
+    def _put(self, record_id: str, payload: Optional[Dict[str, Any]]):
+        self._entries[record_id] = payload
+        self._entries.move_to_end(record_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, int]:
+        """Counters for monitoring"""
+        return {
+            'size': len(self._entries),
+            'skipped': self.skipped,
+            'resent': self.resent,
+            'evictions': self.evictions
+        }
+
+
+def split_handled(cache: ResultCache, convex: Union[ConvexClient, WriteBehind],
+                  records: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[str], List[Dict[str, Any]]]:
+    """
+    Drop records this poller already saved (marking them processed again) and
+    take cached payloads for ones it scored but could not save.
+
+    Returns:
+        Tuple of (records to score, ids skipped as already saved, payloads to resend)
+    """
+    fresh, saved_ids, resend = cache.split(records)
+    DUPLICATE_RECORDS.inc(len(saved_ids), source="seen")
+    DUPLICATE_RECORDS.inc(len(resend), source="resent")
+    if saved_ids:
+        logger.info("Skipped %d already saved records", len(saved_ids))
+        for status in convex.mark_many_as_processed(saved_ids):
+            if not status.get("ok"):
+                logger.warning("✗ Failed to mark %s as processed: %s", status.get('id'), status.get('error'))
+    return fresh, saved_ids, resend
+
+
+def prefetch(iterable: Iterable[T], depth: int = 1) -> Iterator[T]:
+    """
+    Iterate on a background thread, keeping up to `depth` items ready.
+
+    Lets the next page be fetched while the current one is scored and written.
+    """
+    items: "queue.Queue" = queue.Queue(maxsize=max(1, depth))
+    stop = threading.Event()
+    done = object()
+
+    def offer(item) -> bool:
+        """Put an item unless the consumer has gone away"""
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not offer(item):
+                    return
+        except Exception as e:
+            offer(e)
+            return
+        offer(done)
+
+    threading.Thread(target=produce, daemon=True).start()
+    try:
+        while True:
+            item = items.get()
+            if item is done:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stop.set()
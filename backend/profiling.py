@@ -0,0 +1,246 @@
+"""
+Opt-in per-stage profiler.
+
+Code marks its stages with `with PROFILER.stage("json_decode"): ...`. While no
+profiling window is open a stage costs one attribute check. During a window
+each stage records wall and CPU time (nested stages form a path such as
+`request;score`), and a sampler thread records the Python stack of
+every thread inside a stage. At the end of the window the profile is written
+in collapsed-stack format, which flamegraph.pl, speedscope and inferno read
+directly:
+
+    <prefix>.wall.folded     self wall time per stage path (microseconds)
+    <prefix>.cpu.folded      self CPU time per stage path (microseconds)
+    <prefix>.samples.folded  sampled stacks: stage path, then Python frames
+    <prefix>.json            per-stage count/wall/CPU summary
+
+A window is opened by PROFILE=1 at startup or by SIGUSR1 while running, and
+lasts PROFILE_SECONDS (default 30). Output goes to PROFILE_DIR.
+
+Keep web-app/api/profiling.py identical to this file.
+"""
+
+import json
+import os
+import signal
+import sys
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+_MAX_SAMPLE_DEPTH = 64
+
+
+class _NullStage:
+    """Stage used while no window is open"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    """Times one stage on the current thread"""
+
+    __slots__ = ("profiler", "name", "stack", "path", "wall", "cpu")
+
+    def __init__(self, profiler: "Profiler", name: str):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.stack = self.profiler._thread_stack()
+        parent = self.stack[-1][0] if self.stack else None
+        self.path = f"{parent};{self.name}" if parent else self.name
+        self.stack.append((self.path, sys._getframe(1)))
+        self.cpu = time.thread_time_ns()
+        self.wall = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        wall = time.perf_counter_ns() - self.wall
+        cpu = time.thread_time_ns() - self.cpu
+        self.stack.pop()
+        parent = self.stack[-1][0] if self.stack else None
+        self.profiler._record(self.path, parent, wall, cpu)
+        return False
+
+
+class Profiler:
+    """Per-stage wall/CPU timer with a stack sampler, active only during a bounded window"""
+
+    def __init__(self, output_dir: str = "profiles", window: float = 30.0, sample_interval: float = 0.005,
+                 report: Callable[[str], None] = print):
+        self.output_dir = output_dir
+        self.window = window
+        self.sample_interval = sample_interval
+        self.report = report
+
+        self._active = False
+        self._deadline = 0.0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._stacks: Dict[int, List[Tuple[str, object]]] = {}  # Thread id -> open stages
+        self._generation = 0  # Bumped per window so finished threads drop out of _stacks
+
+        # Window results: path -> [count, wall ns, cpu ns, children wall ns, children cpu ns]
+        self._stages: Dict[str, List[int]] = {}
+        self._samples: Dict[str, int] = {}
+        self._started = 0.0
+
+    # === Instrumentation ===
+
+    @property
+    def active(self) -> bool:
+        return self._active
+
+    def stage(self, name: str):
+        """Context manager timing `name` (a no-op unless a window is open)"""
+        if not self._active:
+            return _NULL_STAGE
+        return _Stage(self, name)
+
+    def _thread_stack(self) -> List[Tuple[str, object]]:
+        local = self._local
+        if getattr(local, "generation", None) != self._generation:
+            local.stack = []
+            local.generation = self._generation
+            with self._lock:
+                self._stacks[threading.get_ident()] = local.stack
+        return local.stack
+
+    def _record(self, path: str, parent: Optional[str], wall: int, cpu: int):
+        with self._lock:
+            totals = self._stages.get(path)
+            if totals is None:
+                totals = self._stages[path] = [0, 0, 0, 0, 0]
+            totals[0] += 1
+            totals[1] += wall
+            totals[2] += cpu
+            if parent is not None:
+                parent_totals = self._stages.setdefault(parent, [0, 0, 0, 0, 0])
+                parent_totals[3] += wall
+                parent_totals[4] += cpu
+
+    # === Window control ===
+
+    def start(self, seconds: Optional[float] = None) -> bool:
+        """Open a profiling window; returns False if one is already open"""
+        with self._lock:
+            if self._active:
+                return False
+            self._stages = {}
+            self._samples = {}
+            self._stacks = {}
+            self._generation += 1
+            self._started = time.time()
+            self._deadline = time.monotonic() + (seconds if seconds is not None else self.window)
+            self._active = True
+        threading.Thread(target=self._run_window, name="profiler", daemon=True).start()
+        self.report(f"Profiling for {seconds if seconds is not None else self.window:.0f}s -> {self.output_dir}")
+        return True
+
+    def _run_window(self):
+        """Sample stacks until the deadline, then write the profile"""
+        own = threading.get_ident()
+        while time.monotonic() < self._deadline:
+            time.sleep(self.sample_interval)
+            self._sample(own)
+        self._active = False
+        try:
+            path = self.dump()
+            self.report(f"✓ Profile written to {path}.*")
+        except Exception as e:
+            self.report(f"✗ Could not write profile: {e}")
+
+    def _sample(self, own: int):
+        frames = sys._current_frames()
+        with self._lock:
+            stacks = [(tid, list(stack)) for tid, stack in self._stacks.items() if stack and tid != own]
+        for tid, stack in stacks:
+            frame = frames.get(tid)
+            if frame is None:
+                continue
+            path, entry = stack[-1]
+            names = []
+            while frame is not None and frame is not entry and len(names) < _MAX_SAMPLE_DEPTH:
+                code = frame.f_code
+                names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            key = ";".join([path] + names[::-1]).replace(" ", "_")
+            with self._lock:
+                self._samples[key] = self._samples.get(key, 0) + 1
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """Per-stage totals for the current (or last) window, in milliseconds"""
+        with self._lock:
+            stages = {path: list(totals) for path, totals in self._stages.items()}
+        return {
+            path: {
+                "count": count,
+                "wallMs": round(wall / 1e6, 3),
+                "cpuMs": round(cpu / 1e6, 3),
+                "selfWallMs": round(max(0, wall - child_wall) / 1e6, 3),
+                "selfCpuMs": round(max(0, cpu - child_cpu) / 1e6, 3),
+            }
+            for path, (count, wall, cpu, child_wall, child_cpu) in stages.items() if count
+        }
+
+    def dump(self) -> str:
+        """Write the window's profile files; returns their common path prefix"""
+        os.makedirs(self.output_dir, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(self._started))
+        prefix = os.path.join(self.output_dir, f"profile-{stamp}-{os.getpid()}")
+        summary = self.summary()
+        with self._lock:
+            samples = dict(self._samples)
+
+        with open(f"{prefix}.wall.folded", "w") as f:
+            for path, stats in sorted(summary.items()):
+                if stats["selfWallMs"] > 0:
+                    f.write(f"{path} {int(stats['selfWallMs'] * 1000)}\n")
+        with open(f"{prefix}.cpu.folded", "w") as f:
+            for path, stats in sorted(summary.items()):
+                if stats["selfCpuMs"] > 0:
+                    f.write(f"{path} {int(stats['selfCpuMs'] * 1000)}\n")
+        with open(f"{prefix}.samples.folded", "w") as f:
+            for stack, count in sorted(samples.items()):
+                f.write(f"{stack} {count}\n")
+        with open(f"{prefix}.json", "w") as f:
+            json.dump({"started": self._started, "sampleInterval": self.sample_interval,
+                       "stages": summary}, f, indent=2)
+
+        for path, stats in sorted(summary.items(), key=lambda item: -item[1]["wallMs"]):
+            self.report(f"  {path}: n={stats['count']} wall={stats['wallMs']}ms cpu={stats['cpuMs']}ms "
+                        f"self={stats['selfWallMs']}ms")
+        return prefix
+
+    def install_signal_handler(self, signum: Optional[int] = getattr(signal, "SIGUSR1", None)) -> bool:
+        """Open a window when `signum` arrives (main thread only; not available on Windows)"""
+        if signum is None:
+            return False
+        try:
+            # Start from a thread: the handler may interrupt code holding the profiler lock
+            signal.signal(signum, lambda *_: threading.Thread(target=self.start, daemon=True).start())
+            return True
+        except ValueError:
+            return False
+
+    def configure_from_env(self, default_dir: str = "profiles"):
+        """Apply PROFILE_* settings, listen for SIGUSR1 and open a window now if PROFILE is set"""
+        self.output_dir = os.getenv("PROFILE_DIR", default_dir)
+        self.window = float(os.getenv("PROFILE_SECONDS", str(self.window)))
+        self.sample_interval = float(os.getenv("PROFILE_SAMPLE_MS", str(self.sample_interval * 1000))) / 1000.0
+        self.install_signal_handler()
+        if os.getenv("PROFILE", "").lower() in ("1", "true", "yes"):
+            self.start()
+
+
+PROFILER = Profiler()
@@ -0,0 +1,240 @@
+"""
+Local append-only archive of scored readings, for replay and backtesting.
+
+Every saved anomaly result (the reading plus its score) is appended as one
+fixed 64-byte record (RECORD_DTYPE) to a raw, header-less file per device and
+UTC day:
+
+    <root>/<device>/<YYYY-MM-DD>.bin
+
+Device ids are percent-encoded into directory names (readings without a
+deviceId go to `@none`). Because the files are bare arrays of RECORD_DTYPE they
+can be opened directly with
+
+    np.memmap(path, dtype=RECORD_DTYPE, mode='r')
+
+and scanned at disk speed without loading months of data into RAM. A record
+cut short by a crash is ignored by readers and trimmed before the next append.
+"""
+
+import os
+import threading
+import warnings
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import quote, unquote
+
+import numpy as np
+
+from anomaly_detector import SENSORS, AnomalyDetector
+
+def default_archive_dir() -> str:
+    """ARCHIVE_DIR, else DATA_DIR/archive, else '' (no archive configured)"""
+    data_dir = os.getenv("DATA_DIR", "")
+    return os.getenv("ARCHIVE_DIR", os.path.join(data_dir, "archive") if data_dir else "")
+
+
+RECORD_DTYPE = np.dtype([
+    ('timestamp', '<i8'),              # Reading time, epoch milliseconds (UTC)
+    ('rain', '<f8'),
+    ('soil', '<f8'),
+    ('tilt', '<f8'),
+    ('riskScore', '<f4'),
+    ('zScores', '<f4', (3,)),          # rain, soil, tilt
+    ('rollingMean', '<f4', (3,)),      # rain, soil, tilt
+    ('riskState', 'u1'),               # Index into ARCHIVE_STATES
+    ('thresholdCode', 'u1'),           # ThresholdTable code: rain * 9 + soil * 3 + tilt levels
+    ('reserved', 'V2'),
+])
+assert RECORD_DTYPE.itemsize == 64
+
+ARCHIVE_STATES = ('Low', 'Moderate', 'High', 'Initializing')
+_STATE_INDEX = {state: i for i, state in enumerate(ARCHIVE_STATES)}
+_STATUS_LEVEL = {'normal': 0, 'warning': 1, 'danger': 2}
+_NO_DEVICE = '@none'  # '@' is always percent-encoded, so no device id can map here
+
+
+def device_dir_name(device_id: Optional[str]) -> str:
+    return _NO_DEVICE if device_id is None else quote(device_id, safe='')
+
+
+def device_from_dir_name(name: str) -> Optional[str]:
+    return None if name == _NO_DEVICE else unquote(name)
+
+
+def parse_timestamps(timestamps: List[Optional[str]]) -> np.ndarray:
+    """ISO-8601 timestamps to epoch milliseconds (0 where missing or unparseable)"""
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')  # UTC offsets are applied, but numpy warns about them
+            values = np.array([t[:-1] if t.endswith('Z') else t for t in timestamps], dtype='datetime64[ms]')
+        return values.astype(np.int64)
+    except (ValueError, TypeError, AttributeError):
+        return np.array([_parse_one(t) for t in timestamps], dtype=np.int64)
+
+
+def _parse_one(timestamp: Optional[str]) -> int:
+    try:
+        parsed = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+    except (ValueError, TypeError, AttributeError):
+        return 0
+    if parsed.tzinfo is None:
+        return int((parsed - datetime(1970, 1, 1)).total_seconds() * 1000)
+    return int(parsed.timestamp() * 1000)
+
+
+def to_records(results: List[Dict[str, Any]]) -> np.ndarray:
+    """Archive records for addAnomalyResult payloads"""
+    records = np.zeros(len(results), dtype=RECORD_DTYPE)
+    if not results:
+        return records
+    records['timestamp'] = parse_timestamps([r.get('timestamp') for r in results])
+    records['rain'] = [r.get('rainValue', 0.0) for r in results]
+    records['soil'] = [r.get('soilMoisture', 0.0) for r in results]
+    records['tilt'] = [r.get('tiltValue', 0.0) for r in results]
+    records['riskScore'] = [r.get('riskScore', 0.0) for r in results]
+    records['zScores'] = [(r.get('zScoreRain', 0.0), r.get('zScoreSoil', 0.0), r.get('zScoreTilt', 0.0))
+                          for r in results]
+    means = [r.get('rollingMean') or {} for r in results]
+    records['rollingMean'] = [tuple(m.get(key, 0.0) for key in SENSORS) for m in means]
+    records['riskState'] = [_STATE_INDEX.get(r.get('riskState'), 0) for r in results]
+    records['thresholdCode'] = [_threshold_code(r.get('thresholdStatus')) for r in results]
+    return records
+
+
+def _threshold_code(status: Optional[Dict[str, Dict[str, str]]]) -> int:
+    if not status:
+        return 0
+    code = 0
+    for key in SENSORS:
+        code = code * 3 + _STATUS_LEVEL.get((status.get(key) or {}).get('status'), 0)
+    return code
+
+
+class ReadingArchive:
+    """Appends scored readings to per-device, per-day memmap-able files and reads them back"""
+
+    def __init__(self, root: str, max_open_files: int = 64):
+        self.root = root
+        self.max_open_files = max(1, max_open_files)
+        self._files: "OrderedDict[str, Any]" = OrderedDict()  # Path -> append handle, LRU
+        self._lock = threading.Lock()
+        self.appended = 0
+
+    # === Writing ===
+
+    def append(self, results: List[Dict[str, Any]]) -> int:
+        """Archive addAnomalyResult payloads (thread-safe); returns how many were written"""
+        if not results:
+            return 0
+        records = to_records(results)
+        days = records['timestamp'].astype('datetime64[ms]').astype('datetime64[D]').astype(str)
+
+        groups: Dict[Tuple[Optional[str], str], List[int]] = {}
+        for i, result in enumerate(results):
+            groups.setdefault((result.get('deviceId'), days[i]), []).append(i)
+
+        with self._lock:
+            for (device_id, day), rows in groups.items():
+                handle = self._handle(self.path(device_id, day))
+                handle.write(records[rows].tobytes())
+                handle.flush()
+            self.appended += len(records)
+        return len(records)
+
+    def _handle(self, path: str):
+        handle = self._files.get(path)
+        if handle is not None:
+            self._files.move_to_end(path)
+            return handle
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        handle = open(path, 'ab')
+        # Trim a partial record left by a crash so the file stays a whole number of records
+        size = handle.seek(0, os.SEEK_END)
+        if size % RECORD_DTYPE.itemsize:
+            handle.truncate(size - size % RECORD_DTYPE.itemsize)
+        self._files[path] = handle
+        while len(self._files) > self.max_open_files:
+            _, evicted = self._files.popitem(last=False)
+            evicted.close()
+        return handle
+
+    def close(self):
+        with self._lock:
+            for handle in self._files.values():
+                handle.close()
+            self._files.clear()
+
+    # === Reading ===
+
+    def path(self, device_id: Optional[str], day: str) -> str:
+        return os.path.join(self.root, device_dir_name(device_id), f"{day}.bin")
+
+    def devices(self) -> List[Optional[str]]:
+        """Archived device ids"""
+        if not os.path.isdir(self.root):
+            return []
+        return [device_from_dir_name(name) for name in sorted(os.listdir(self.root))
+                if os.path.isdir(os.path.join(self.root, name))]
+
+    def days(self, device_id: Optional[str]) -> List[str]:
+        """Archived UTC days (YYYY-MM-DD) of a device, oldest first"""
+        directory = os.path.join(self.root, device_dir_name(device_id))
+        if not os.path.isdir(directory):
+            return []
+        return sorted(name[:-4] for name in os.listdir(directory) if name.endswith('.bin'))
+
+    def open_day(self, device_id: Optional[str], day: str) -> np.ndarray:
+        """Read-only memmap of one device-day (whole records only)"""
+        path = self.path(device_id, day)
+        count = os.path.getsize(path) // RECORD_DTYPE.itemsize if os.path.exists(path) else 0
+        if count == 0:
+            return np.zeros(0, dtype=RECORD_DTYPE)
+        return np.memmap(path, dtype=RECORD_DTYPE, mode='r', shape=(count,))
+
+    def iter_days(self, device_id: Optional[str], start: Optional[str] = None,
+                  end: Optional[str] = None) -> Iterator[Tuple[str, np.ndarray]]:
+        """(day, records) for a device, oldest first, limited to [start, end) when given (ISO-8601)"""
+        start_ms = int(parse_timestamps([start])[0]) if start else None
+        end_ms = int(parse_timestamps([end])[0]) if end else None
+        first_day = str(np.datetime64(start_ms, 'ms').astype('datetime64[D]')) if start_ms is not None else None
+        last_day = str(np.datetime64(end_ms, 'ms').astype('datetime64[D]')) if end_ms is not None else None
+        for day in self.days(device_id):
+            if (first_day and day < first_day) or (last_day and day > last_day):
+                continue
+            records = self.open_day(device_id, day)
+            if start_ms is not None or end_ms is not None:
+                keep = np.ones(len(records), dtype=bool)
+                if start_ms is not None:
+                    keep &= records['timestamp'] >= start_ms
+                if end_ms is not None:
+                    keep &= records['timestamp'] < end_ms
+                if not keep.all():
+                    records = records[keep]
+            if len(records):
+                yield day, records
+
+    def read(self, device_id: Optional[str], start: Optional[str] = None, end: Optional[str] = None) -> np.ndarray:
+        """All of a device's records in [start, end) as one in-memory array"""
+        parts = [records for _, records in self.iter_days(device_id, start, end)]
+        return np.concatenate(parts) if parts else np.zeros(0, dtype=RECORD_DTYPE)
+
+    def replay(self, device_id: Optional[str], detector: Optional[AnomalyDetector] = None,
+               start: Optional[str] = None, end: Optional[str] = None,
+               chunk_size: int = 65536) -> Iterator[Tuple[np.ndarray, Dict[str, Any]]]:
+        """
+        Re-score a device's archived readings in order through `detector`
+        (a fresh one by default), `chunk_size` records at a time, yielding
+        (records, score_batch output) per chunk. Memory stays bounded by the
+        chunk size however long the range is.
+        """
+        detector = detector or AnomalyDetector()
+        for _, records in self.iter_days(device_id, start, end):
+            for offset in range(0, len(records), chunk_size):
+                chunk = records[offset:offset + chunk_size]
+                yield chunk, detector.score_batch(chunk['rain'], chunk['soil'], chunk['tilt'])
+
+    def stats(self) -> Dict[str, int]:
+        """Counters for monitoring"""
+        return {'appended': self.appended, 'openFiles': len(self._files)}
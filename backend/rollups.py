@@ -0,0 +1,330 @@
+"""
+Incremental per-device time-bucket rollups of saved results, for history charts.
+
+As results are saved, RollupAggregator folds them into minute, hour and day
+buckets per device (UTC, keyed by bucket start in epoch ms):
+
+  - count, and min/max/sum/last of rain, soil, tilt and risk score
+  - lastAt / lastRiskState of the newest reading
+  - seconds spent in each riskState: a reading's state lasts until the
+    device's next reading, capped at `max_gap` (as in backtest.py), and that
+    time is split across the buckets it spans
+
+Buckets are held in memory and sent as partial rows to the
+`rollups:mergeRollups` mutation every `interval` seconds, which merges them
+into the stored rows (web-app/convex/rollups.ts). Rows that fail to send are
+kept for the next flush, up to `max_pending` rows; beyond that the oldest
+buckets are dropped, minute buckets first, so an outage cannot grow memory
+without bound. A call that times out after Convex applied it is
+counted twice, and a result saved after newer readings of its device (a
+retried write) does not move time in state, so rollups are for charts, not
+exact accounting.
+
+History that predates rollups can be loaded from the reading archive once:
+
+    python rollups.py --end 2026-10-17T00:00:00Z   # time rollups were switched on
+"""
+
+import argparse
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+
+from convex_client import ConvexClient
+from reading_archive import ARCHIVE_STATES, ReadingArchive, default_archive_dir, parse_timestamps
+
+logger = logging.getLogger(__name__)
+
+GRANULARITIES = {'minute': 60_000, 'hour': 3_600_000, 'day': 86_400_000}  # Bucket widths in ms
+METRICS = ('rain', 'soil', 'tilt', 'risk')
+_RESULT_FIELDS = ('rainValue', 'soilMoisture', 'tiltValue', 'riskScore')
+_STATE_INDEX = {state: i for i, state in enumerate(ARCHIVE_STATES)}
+
+
+def merge_rollup(into: Dict[str, Any], row: Dict[str, Any]) -> Dict[str, Any]:
+    """Fold partial rollup `row` into `into` for the same bucket, in place (mirrors mergeRollup in rollups.ts)"""
+    into['count'] += row['count']
+    for state, seconds in row['stateSeconds'].items():
+        into['stateSeconds'][state] = into['stateSeconds'].get(state, 0.0) + seconds
+    if not row['count']:
+        return into
+
+    newer = 'lastAt' not in into or row['lastAt'] >= into['lastAt']
+    for metric in METRICS:
+        a, b = into.get(metric), row[metric]
+        if a is None:
+            into[metric] = dict(b)
+            continue
+        a['min'] = min(a['min'], b['min'])
+        a['max'] = max(a['max'], b['max'])
+        a['sum'] += b['sum']
+        if newer:
+            a['last'] = b['last']
+    if newer:
+        into['lastAt'] = row['lastAt']
+        into['lastRiskState'] = row['lastRiskState']
+    return into
+
+
+def _runs(*keys: np.ndarray) -> np.ndarray:
+    """Start index of each run of equal consecutive (key, ...) tuples"""
+    change = np.zeros(len(keys[0]), dtype=bool)
+    change[0] = True
+    for key in keys:
+        change[1:] |= key[1:] != key[:-1]
+    return np.flatnonzero(change)
+
+
+def split_state_time(codes: np.ndarray, starts: np.ndarray, gaps: np.ndarray, states: np.ndarray,
+                     width: int) -> Dict[Tuple[int, int], np.ndarray]:
+    """
+    Milliseconds per (device code, bucket start) and state for intervals
+    [start, start + gap), split at bucket edges
+    """
+    totals: Dict[Tuple[int, int], np.ndarray] = {}
+    if not len(starts):
+        return totals
+    first = starts // width * width
+    inside = starts + gaps <= first + width
+
+    # Most intervals lie inside one bucket: sum them per (device, bucket, state) in one pass
+    order = np.lexsort((first[inside], codes[inside]))
+    in_codes, in_first = codes[inside][order], first[inside][order]
+    if len(order):
+        runs = _runs(in_codes, in_first)
+        by_state = np.zeros((len(order), len(ARCHIVE_STATES)))
+        by_state[np.arange(len(order)), states[inside][order]] = gaps[inside][order]
+        sums = np.add.reduceat(by_state, runs, axis=0)
+        for code, bucket, row in zip(in_codes[runs].tolist(), in_first[runs].tolist(), sums):
+            totals[(code, bucket)] = row
+
+    for code, start, gap, state, bucket in zip(codes[~inside].tolist(), starts[~inside].tolist(),
+                                               gaps[~inside].tolist(), states[~inside].tolist(),
+                                               first[~inside].tolist()):
+        end = start + gap
+        while start < end:
+            step = min(end, bucket + width) - start
+            totals.setdefault((code, bucket), np.zeros(len(ARCHIVE_STATES)))[state] += step
+            start = bucket = bucket + width
+    return totals
+
+
+class RollupAggregator:
+    """Per-device minute/hour/day rollups of saved results, flushed to Convex periodically"""
+
+    def __init__(self, convex: ConvexClient, interval: float = 10.0, max_gap: float = 300.0,
+                 granularities: Tuple[str, ...] = tuple(GRANULARITIES), batch_size: int = 200,
+                 max_pending: int = 100_000, clock: Callable[[], float] = time.monotonic):
+        unknown = set(granularities) - set(GRANULARITIES)
+        if unknown:
+            raise ValueError(f"Unknown rollup granularities: {sorted(unknown)}")
+        self.convex = convex
+        self.interval = interval
+        self.max_gap_ms = int(max_gap * 1000)
+        self.granularities = granularities
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self.clock = clock
+
+        self._pending: Dict[Tuple[Optional[str], str, int], Dict[str, Any]] = {}
+        self._last: Dict[Optional[str], Tuple[int, int]] = {}  # deviceId -> (timestamp ms, state) of its newest reading
+        self._lock = threading.Lock()
+        self._last_flush = clock()
+
+        # Counters
+        self.added = 0
+        self.flushed = 0
+        self.failures = 0
+        self.dropped = 0
+
+    # === Aggregation ===
+
+    def add(self, results: List[Dict[str, Any]]):
+        """Fold saved addAnomalyResult payloads into the pending buckets"""
+        if not results:
+            return
+        devices: Dict[Optional[str], int] = {}
+        codes = np.array([devices.setdefault(r.get('deviceId'), len(devices)) for r in results], dtype=np.int64)
+        self._add(list(devices), codes,
+                  parse_timestamps([r.get('timestamp') for r in results]),
+                  np.array([[r.get(key, 0.0) for key in _RESULT_FIELDS] for r in results], dtype=np.float64),
+                  np.array([_STATE_INDEX.get(r.get('riskState'), 0) for r in results], dtype=np.int64))
+
+    def add_archived(self, device_id: Optional[str], records: np.ndarray):
+        """Fold one device's archive records (reading_archive.RECORD_DTYPE) into the pending buckets"""
+        if not len(records):
+            return
+        values = np.column_stack([records['rain'], records['soil'], records['tilt'],
+                                  records['riskScore'].astype(np.float64)])
+        self._add([device_id], np.zeros(len(records), dtype=np.int64),
+                  np.asarray(records['timestamp'], dtype=np.int64), values, records['riskState'].astype(np.int64))
+
+    def _add(self, device_ids: List[Optional[str]], codes: np.ndarray, timestamps: np.ndarray,
+             values: np.ndarray, states: np.ndarray):
+        """
+        Readings of several devices, as device codes (indexes into device_ids),
+        timestamps (ms), values (n, 4: rain, soil, tilt, risk) and state indexes
+        """
+        order = np.lexsort((timestamps, codes))
+        codes, timestamps, values, states = codes[order], timestamps[order], values[order], states[order]
+        firsts = _runs(codes)
+        lasts = np.concatenate((firsts[1:], [len(codes)])) - 1
+
+        with self._lock:
+            # Time in state: each reading's state lasts until the device's next reading,
+            # and the newest reading of an earlier batch lasts until this batch's first
+            same = codes[1:] == codes[:-1]
+            pair_codes, pair_starts, pair_ends, pair_states = (
+                [codes[:-1][same]], [timestamps[:-1][same]], [timestamps[1:][same]], [states[:-1][same]])
+            carried = []
+            for first, last in zip(firsts.tolist(), lasts.tolist()):
+                device_id = device_ids[codes[first]]
+                previous = self._last.get(device_id)
+                if previous is not None and previous[0] <= timestamps[first]:
+                    carried.append((codes[first], previous[0], timestamps[first], previous[1]))
+                if previous is None or previous[0] <= timestamps[last]:
+                    self._last[device_id] = (int(timestamps[last]), int(states[last]))
+            if carried:
+                for pairs, column in zip((pair_codes, pair_starts, pair_ends, pair_states), zip(*carried)):
+                    pairs.append(np.array(column, dtype=np.int64))
+            pair_codes, pair_starts, pair_ends, pair_states = (
+                np.concatenate(pairs) for pairs in (pair_codes, pair_starts, pair_ends, pair_states))
+            gaps = np.clip(pair_ends - pair_starts, 0, self.max_gap_ms)
+
+            for granularity in self.granularities:
+                width = GRANULARITIES[granularity]
+                buckets = timestamps // width * width
+                starts = _runs(codes, buckets)
+                ends = np.concatenate((starts[1:], [len(timestamps)])) - 1
+                mins = np.minimum.reduceat(values, starts, axis=0).tolist()
+                maxs = np.maximum.reduceat(values, starts, axis=0).tolist()
+                sums = np.add.reduceat(values, starts, axis=0).tolist()
+                lasts_of_run = values[ends].tolist()
+                for i, (start, end) in enumerate(zip(starts.tolist(), ends.tolist())):
+                    row = self._row(device_ids[codes[start]], granularity, int(buckets[start]))
+                    row.update(count=end - start + 1, lastAt=int(timestamps[end]),
+                               lastRiskState=ARCHIVE_STATES[states[end]])
+                    for j, metric in enumerate(METRICS):
+                        row[metric] = {'min': mins[i][j], 'max': maxs[i][j], 'sum': sums[i][j],
+                                       'last': lasts_of_run[i][j]}
+                    self._merge_pending(row)
+
+                for (code, bucket), milliseconds in split_state_time(pair_codes, pair_starts, gaps, pair_states,
+                                                                     width).items():
+                    row = self._row(device_ids[code], granularity, bucket)
+                    row['stateSeconds'] = {state: ms / 1000
+                                           for state, ms in zip(ARCHIVE_STATES, milliseconds.tolist())}
+                    self._merge_pending(row)
+            self.added += len(timestamps)
+            self._trim()
+
+    @staticmethod
+    def _row(device_id: Optional[str], granularity: str, bucket_start: int) -> Dict[str, Any]:
+        row: Dict[str, Any] = {'granularity': granularity, 'bucketStart': bucket_start, 'count': 0,
+                               'stateSeconds': {state: 0.0 for state in ARCHIVE_STATES}}
+        if device_id is not None:
+            row['deviceId'] = device_id
+        return row
+
+    def _merge_pending(self, row: Dict[str, Any]):
+        key = (row.get('deviceId'), row['granularity'], row['bucketStart'])
+        existing = self._pending.get(key)
+        if existing is None:
+            self._pending[key] = row
+        else:
+            merge_rollup(existing, row)
+
+    def _trim(self):
+        """Drop the oldest pending rows beyond max_pending, minute buckets first (caller holds the lock)"""
+        excess = len(self._pending) - self.max_pending
+        if excess <= 0:
+            return
+        for key in sorted(self._pending, key=lambda key: (GRANULARITIES[key[1]], key[2]))[:excess]:
+            del self._pending[key]
+        self.dropped += excess
+        logger.warning("✗ Rollup backlog above %d rows, dropped the %d oldest", self.max_pending, excess)
+
+    # === Flushing ===
+
+    def flush(self, force: bool = False) -> int:
+        """
+        Send pending rows to Convex if `interval` seconds have passed since the
+        last flush (or `force`); returns how many rows were sent. Rows that
+        fail to send are kept for the next flush.
+        """
+        with self._lock:
+            if not self._pending or (not force and self.clock() - self._last_flush < self.interval):
+                return 0
+            rows, self._pending = list(self._pending.values()), {}
+            self._last_flush = self.clock()
+
+        sent = 0
+        for start in range(0, len(rows), self.batch_size):
+            try:
+                self.convex.merge_rollups(rows[start:start + self.batch_size])
+            except Exception as e:
+                self.failures += 1
+                logger.warning("✗ Could not save %d rollup rows (kept for the next flush): %s", len(rows) - start, e)
+                with self._lock:
+                    for row in rows[start:]:
+                        self._merge_pending(row)
+                    self._trim()
+                break
+            sent += len(rows[start:start + self.batch_size])
+        self.flushed += sent
+        return sent
+
+    def stats(self) -> Dict[str, int]:
+        """Counters for monitoring"""
+        return {
+            'pending': len(self._pending),
+            'added': self.added,
+            'flushed': self.flushed,
+            'failures': self.failures,
+            'dropped': self.dropped
+        }
+
+
+def backfill(aggregator: RollupAggregator, archive: ReadingArchive, devices: List[Optional[str]],
+             start: Optional[str] = None, end: Optional[str] = None) -> int:
+    """Roll up archived readings in [start, end), device by device; returns how many were added"""
+    added = 0
+    for device_id in devices:
+        for _, records in archive.iter_days(device_id, start, end):
+            aggregator.add_archived(device_id, records)
+            added += len(records)
+        aggregator.flush(force=True)
+    return added
+
+
+def main():
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    parser = argparse.ArgumentParser(description="Load rollups for archived readings into Convex")
+    parser.add_argument("--archive", default=default_archive_dir() or None, required=not default_archive_dir(),
+                        help="reading archive directory (default: ARCHIVE_DIR, else DATA_DIR/archive)")
+    parser.add_argument("--device", action="append", help="limit to a device (repeatable)")
+    parser.add_argument("--start", help="first reading time (ISO-8601, inclusive)")
+    parser.add_argument("--end", required=True,
+                        help="last reading time (ISO-8601, exclusive): when the poller started keeping rollups")
+    parser.add_argument("--max-gap", type=float, default=float(os.getenv("ROLLUP_MAX_GAP", "300")),
+                        help="longest reading gap (seconds) counted toward time in state")
+    args = parser.parse_args()
+
+    convex = ConvexClient(os.getenv("CONVEX_URL_CLOUD", "https://your-deployment.convex.cloud"))
+    archive = ReadingArchive(args.archive)
+    devices = args.device or archive.devices()
+    aggregator = RollupAggregator(convex, max_gap=args.max_gap)
+    started = time.perf_counter()
+    added = backfill(aggregator, archive, devices, args.start, args.end)
+    print(f"Rolled up {added} readings from {len(devices)} devices in {time.perf_counter() - started:.1f}s "
+          f"({aggregator.flushed} rows sent, {aggregator.stats()['pending']} not sent)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+import random
+import time
+from typing import Callable, Dict
+
+
+class AdaptivePollScheduler:
+    """
+    Decides how long to wait before the next poll.
+
+    - Backlog (last poll found work): poll again immediately.
+    - Idle or error: exponential backoff from `floor` up to `ceiling`, with
+      jitter so several pollers do not fall into lockstep.
+
+    Idle and error streaks back off independently and reset on the next
+    successful poll that found work.
+    """
+
+    def __init__(self, floor: float = 1.0, ceiling: float = 30.0, multiplier: float = 2.0,
+                 jitter: float = 0.5, rng: Callable[[], float] = random.random):
+        if floor <= 0 or ceiling < floor:
+            raise ValueError("require 0 < floor <= ceiling")
+        self.floor = floor
+        self.ceiling = ceiling
+        self.multiplier = multiplier
+        self.jitter = jitter
+        self.rng = rng
+
+        self._idle_streak = 0
+        self._error_streak = 0
+
+        # Metrics
+        self.polls = 0
+        self.immediate_polls = 0
+        self.idle_backoffs = 0
+        self.error_backoffs = 0
+        self.last_delay = 0.0
+        self.total_delay = 0.0
+
+    def next_delay(self, found: int, error: bool = False) -> float:
+        """Record the outcome of a poll and return seconds to wait before the next one"""
+        self.polls += 1
+        if error:
+            self._error_streak += 1
+            self.error_backoffs += 1
+            delay = self._backoff(self._error_streak)
+        elif found:
+            self._idle_streak = 0
+            self._error_streak = 0
+            self.immediate_polls += 1
+            delay = 0.0
+        else:
+            self._error_streak = 0
+            self._idle_streak += 1
+            self.idle_backoffs += 1
+            delay = self._backoff(self._idle_streak)
+
+        self.last_delay = delay
+        self.total_delay += delay
+        return delay
+
+    def _backoff(self, streak: int) -> float:
+        """floor * multiplier^(streak-1), capped at ceiling, minus up to `jitter` of it"""
+        base = min(self.ceiling, self.floor * self.multiplier ** min(streak - 1, 64))
+        return max(self.floor, base * (1.0 - self.jitter * self.rng()))
+
+    def wait(self, found: int, error: bool = False) -> float:
+        """Sleep for the next delay; returns the delay used"""
+        delay = self.next_delay(found, error)
+        if delay:
+            time.sleep(delay)
+        return delay
+
+    def stats(self) -> Dict[str, float]:
+        """Scheduler decisions for monitoring"""
+        return {
+            'polls': self.polls,
+            'immediatePolls': self.immediate_polls,
+            'idleBackoffs': self.idle_backoffs,
+            'errorBackoffs': self.error_backoffs,
+            'lastDelay': round(self.last_delay, 3),
+            'totalDelay': round(self.total_delay, 3)
+        }
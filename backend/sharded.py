@@ -0,0 +1,187 @@
+import logging
+import multiprocessing as mp
+import os
+import queue
+import signal
+import threading
+import zlib
+from typing import Any, Dict, List, Optional, Set, Tuple
+from convex_client import ConvexClient
+from detector_registry import DetectorRegistry
+from processing import LocalScorer
+from threshold_config import ThresholdConfig
+
+logger = logging.getLogger(__name__)
+
+
+def shard_for(device_id: Optional[str], num_shards: int) -> int:
+    """Stable device -> shard mapping (same on every process and restart)"""
+    return zlib.crc32((device_id or "").encode()) % num_shards
+
+
+def shard_snapshot_path(snapshot_path: Optional[str], shard: int, num_shards: int) -> Optional[str]:
+    """Per-worker snapshot file; shard layout is part of the name so a resized pool starts cold"""
+    if not snapshot_path:
+        return None
+    base, ext = os.path.splitext(snapshot_path)
+    return f"{base}.shard{shard}of{num_shards}{ext or '.npy'}"
+
+
+def _worker_main(shard: int, inbox: "mp.Queue", outbox: "mp.Queue", convex_url: Optional[str],
+                 window_size: int, max_detectors: int, snapshot_path: Optional[str],
+                 snapshot_interval: float, thresholds: Optional[ThresholdConfig]):
+    """Worker process: owns the detectors for its shard of devices"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # The parent handles Ctrl+C and shuts workers down
+
+    convex = ConvexClient(convex_url) if convex_url else None
+    scorer = LocalScorer(DetectorRegistry(
+        window_size=window_size,
+        max_detectors=max_detectors,
+        history_loader=convex.get_device_history if convex else None,
+        thresholds=thresholds
+    ), snapshot_path=snapshot_path, snapshot_interval=snapshot_interval)
+
+    while True:
+        message = inbox.get()
+        if message is None:
+            scorer.close()
+            break
+        if message[0] == "forget":  # ("forget", partitions, num_partitions); no reply
+            scorer.forget_partitions(message[1], message[2])
+            continue
+        _, job, records = message  # ("score", job, records)
+        try:
+            results, failed_ids = scorer(records)
+        except Exception as e:
+            logger.error("✗ Error in scoring worker %d: %s", shard, e)
+            results, failed_ids = [], [r.get("_id") for r in records]
+        outbox.put((shard, job, results, failed_ids, scorer.stats()))
+
+
+class ShardedScorer:
+    """
+    Scores records on a pool of worker processes, sharded by deviceId.
+
+    Each device always hashes to the same worker, so its rolling state never
+    crosses processes and its readings are scored in arrival order. Results
+    come back to the caller, which stays the single writer to Convex.
+
+    A worker that dies (crash, OOM kill) is noticed within `poll_interval`
+    seconds: its shard's records in the current batch are reported as failed
+    (they stay unprocessed and are fetched again) and a fresh worker is
+    started, which restores its shard from the snapshot or stored results.
+    """
+
+    def __init__(self, convex_url: Optional[str], num_workers: int = 2, window_size: int = 20,
+                 max_detectors: int = 1000, queue_size: int = 4, snapshot_path: Optional[str] = None,
+                 snapshot_interval: float = 30.0, thresholds: Optional[ThresholdConfig] = None,
+                 poll_interval: float = 1.0):
+        if num_workers < 1:
+            raise ValueError("num_workers must be at least 1")
+        self.num_workers = num_workers
+        self.queue_size = queue_size
+        self.poll_interval = poll_interval
+        self._outbox: "mp.Queue" = mp.Queue()
+        self._lock = threading.Lock()
+        self._worker_stats: Dict[int, Dict[str, int]] = {}
+
+        # Each worker gets a share of the resident-detector budget
+        per_worker = max(1, -(-max_detectors // num_workers))
+        self._worker_args = [
+            (convex_url, window_size, per_worker, shard_snapshot_path(snapshot_path, i, num_workers),
+             snapshot_interval, thresholds)
+            for i in range(num_workers)
+        ]
+        self._inboxes: List["mp.Queue"] = [None] * num_workers
+        self._workers: List[mp.Process] = [None] * num_workers
+        for shard in range(num_workers):
+            self._start_worker(shard)
+
+        # Counters
+        self.jobs = 0
+        self.records = 0
+        self.restarts = 0
+
+    def _start_worker(self, shard: int):
+        """Start a worker for a shard, with a fresh inbox (a killed reader can leave the old one locked)"""
+        self._inboxes[shard] = mp.Queue(maxsize=self.queue_size)
+        self._workers[shard] = mp.Process(
+            target=_worker_main,
+            args=(shard, self._inboxes[shard], self._outbox) + self._worker_args[shard],
+            name=f"scoring-worker-{shard}",
+            daemon=True
+        )
+        self._workers[shard].start()
+
+    def _restart_dead_workers(self, shards) -> List[int]:
+        """Restart workers of `shards` that are no longer running; returns those shards"""
+        dead = [shard for shard in shards if not self._workers[shard].is_alive()]
+        for shard in dead:
+            logger.error("✗ Scoring worker %d died (exit code %s); restarting it",
+                         shard, self._workers[shard].exitcode)
+            self._workers[shard].join(timeout=1)
+            self._start_worker(shard)
+            self.restarts += 1
+        return dead
+
+    def __call__(self, records: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[str]]:
+        """Scatter records to their shards and gather the results"""
+        shards: Dict[int, List[Dict[str, Any]]] = {}
+        for record in records:
+            shards.setdefault(shard_for(record.get("deviceId"), self.num_workers), []).append(record)
+
+        with self._lock:
+            self._restart_dead_workers(shards)
+            self.jobs += 1
+            job = self.jobs
+            for shard, shard_records in shards.items():
+                self._inboxes[shard].put(("score", job, shard_records))
+
+            results: List[Dict[str, Any]] = []
+            failed_ids: List[str] = []
+            pending = set(shards)
+            while pending:
+                try:
+                    shard, reply_job, shard_results, shard_failed, worker_stats = \
+                        self._outbox.get(timeout=self.poll_interval)
+                except queue.Empty:
+                    for shard in self._restart_dead_workers(pending):
+                        pending.discard(shard)
+                        failed_ids.extend(r.get("_id") for r in shards[shard])
+                    continue
+                if reply_job != job or shard not in pending:
+                    continue  # Late reply to a batch that already gave up on this shard
+                pending.discard(shard)
+                results.extend(shard_results)
+                failed_ids.extend(shard_failed)
+                self._worker_stats[shard] = worker_stats
+
+            self.records += len(records)
+        return results, failed_ids
+
+    def forget_partitions(self, partitions: Set[int], num_partitions: int) -> None:
+        """Have every worker drop detectors of devices in lease partitions no longer held"""
+        with self._lock:
+            for inbox in self._inboxes:
+                inbox.put(("forget", set(partitions), num_partitions))
+
+    def stats(self) -> Dict[str, int]:
+        """Counters for monitoring, summed over workers"""
+        totals = {'workers': self.num_workers, 'jobs': self.jobs, 'records': self.records,
+                  'restarts': self.restarts}
+        for worker_stats in self._worker_stats.values():
+            for key, value in worker_stats.items():
+                totals[key] = totals.get(key, 0) + value
+        return totals
+
+    def close(self):
+        """Stop the worker processes"""
+        for inbox in self._inboxes:
+            try:
+                inbox.put(None, timeout=1)
+            except Exception:
+                pass
+        for worker in self._workers:
+            worker.join(timeout=5)
+            if worker.is_alive():
+                worker.terminate()
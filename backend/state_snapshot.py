@@ -0,0 +1,69 @@
+import os
+import numpy as np
+from typing import Dict, Optional
+from detector_registry import DetectorRegistry, DeviceState
+
+SENSORS = ('rain', 'soil', 'tilt')
+
+
+def snapshot_dtype(window_size: int, device_bytes: int = 64, timestamp_bytes: int = 32) -> np.dtype:
+    """
+    Fixed-width record per device: ~24 * window_size + device_bytes +
+    timestamp_bytes + 8 bytes. Device ids and timestamps are UTF-8.
+    """
+    return np.dtype([
+        ('device', f'S{max(device_bytes, 1)}'),
+        ('hasDevice', '?'),  # False for readings without a deviceId
+        ('count', '<u4'),
+        ('lastTimestamp', f'S{max(timestamp_bytes, 1)}'),
+        ('values', '<f8', (len(SENSORS), window_size))
+    ])
+
+
+def save_snapshot(registry: DetectorRegistry, path: str) -> int:
+    """
+    Write every resident detector's window to `path` as a .npy structured array.
+
+    The id and timestamp fields are as wide as the longest UTF-8 value, so
+    nothing is truncated. The file is written next to the target and renamed
+    into place, so a crash mid-write never leaves a torn snapshot. Returns the
+    number of devices saved.
+    """
+    states = registry.export_states()
+    devices = [(device_id or '').encode() for device_id in states]
+    timestamps = [(entry.last_timestamp or '').encode() for entry in states.values()]
+    if any(value.endswith(b'\0') for value in devices + timestamps):
+        raise ValueError("Device ids and timestamps in a snapshot cannot end with a NUL character")
+    records = np.zeros(len(states), dtype=snapshot_dtype(
+        registry.window_size, max(map(len, devices), default=1), max(map(len, timestamps), default=1)))
+    for i, (device_id, entry) in enumerate(states.items()):
+        count = len(entry.history['rain'])
+        records[i]['device'] = devices[i]
+        records[i]['hasDevice'] = device_id is not None
+        records[i]['count'] = count
+        records[i]['lastTimestamp'] = timestamps[i]
+        for row, key in enumerate(SENSORS):
+            records[i]['values'][row, :count] = entry.history[key]
+
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp.npy"
+    np.save(tmp_path, records, allow_pickle=False)
+    os.replace(tmp_path, path)
+    return len(records)
+
+
+def load_snapshot(path: str) -> Dict[Optional[str], DeviceState]:
+    """Read a snapshot written by save_snapshot (memory-mapped); empty if there is none"""
+    if not os.path.exists(path):
+        return {}
+    records = np.load(path, mmap_mode='r', allow_pickle=False)
+    entries: Dict[Optional[str], DeviceState] = {}
+    for record in records:
+        count = int(record['count'])
+        device_id = record['device'].decode('utf-8') if record['hasDevice'] else None
+        entries[device_id] = DeviceState(
+            history={key: record['values'][row, :count].tolist() for row, key in enumerate(SENSORS)},
+            last_timestamp=record['lastTimestamp'].decode('utf-8') or None
+        )
+    return entries
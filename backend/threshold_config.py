@@ -0,0 +1,53 @@
+import json
+from typing import Any, Dict, Optional
+from anomaly_detector import DEFAULT_THRESHOLDS, ThresholdTable, compile_thresholds, merge_thresholds
+
+# Per-sensor rules, e.g. {"tilt": {"warning": 10.0, "danger": 20.0}}; omitted fields keep their defaults
+ThresholdRules = Dict[str, Dict[str, Any]]
+
+
+class ThresholdConfig:
+    """
+    Threshold rules per device and per site (sensorData `location`).
+
+    A device's rules are the defaults, overlaid by its site's overrides, then by
+    its own. Each distinct result is compiled once and shared, so per-device
+    rules keep the precompiled, allocation-free classification.
+
+    File format (THRESHOLDS_FILE):
+
+        {
+          "default": {"rain": {"warning": 50, "danger": 75}},
+          "sites":   {"Site A - Armani Cameron Residence": {"soil": {"warning": 65}}},
+          "devices": {"ESP32-002": {"tilt": {"warning": 10, "danger": 20}}}
+        }
+    """
+
+    def __init__(self, defaults: Optional[ThresholdRules] = None,
+                 sites: Optional[Dict[str, ThresholdRules]] = None,
+                 devices: Optional[Dict[str, ThresholdRules]] = None):
+        self.defaults = merge_thresholds(DEFAULT_THRESHOLDS, defaults)
+        self.sites = sites or {}
+        self.devices = devices or {}
+        # Compile everything up front so bad values fail at startup, not mid-batch
+        compile_thresholds(self.defaults)
+        for site in self.sites:
+            self.for_device(None, site)
+        for device_id in self.devices:
+            self.for_device(device_id)
+
+    @classmethod
+    def from_file(cls, path: str) -> "ThresholdConfig":
+        """Load rules from a JSON file"""
+        with open(path) as f:
+            config = json.load(f)
+        return cls(config.get("default"), config.get("sites"), config.get("devices"))
+
+    def for_device(self, device_id: Optional[str], location: Optional[str] = None) -> ThresholdTable:
+        """Compiled threshold table for a device at a site"""
+        rules = self.defaults
+        if location in self.sites:
+            rules = merge_thresholds(rules, self.sites[location])
+        if device_id in self.devices:
+            rules = merge_thresholds(rules, self.devices[device_id])
+        return compile_thresholds(rules)
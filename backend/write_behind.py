@@ -0,0 +1,334 @@
+"""
+Durable write-behind queue for Convex writes during outages.
+
+WriteBehind is a drop-in for ConvexClient.add_anomaly_results_batch and
+mark_many_as_processed. While Convex answers, writes go straight through.
+When a write fails with an outage-type error (connection error, timeout,
+5xx/429 or an open circuit, see convex_client.is_transient), that batch and
+every later one is appended to a local log instead, so scoring carries on at
+full speed and no result is dropped:
+
+    <path>           append-only JSON lines, one queued result or processed-mark each
+    <path>.offset    byte offset of the first entry not yet written to Convex
+    <path>.rejected  entries Convex refused for good, with the error
+
+flush() writes the log to Convex in order, in batches of up to
+`flush_batch_size`, advancing the offset after each batch, and empties the log
+once it has caught up. While the log is not empty new writes are queued behind
+it, so each device's results still reach Convex in scoring order. An entry
+replayed after a crash is harmless: result writes are idempotent per
+sensorDataId.
+"""
+
+import json
+import logging
+import os
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from convex_client import ConvexClient, is_transient
+from metrics import DUPLICATE_RECORDS, record_write_statuses
+
+logger = logging.getLogger(__name__)
+
+# Per-record errors that retrying cannot fix; such entries are dropped rather than dead-lettered
+_DROPPED_ERRORS = ("sensorData not found", "lease lost")
+
+
+class WriteBehind:
+    """Writes results and processed-marks to Convex, queueing them on disk while it is unavailable"""
+
+    def __init__(self, convex: ConvexClient, path: str, batch_size: int = 100, flush_batch_size: int = 1000,
+                 max_attempts: int = 20, fsync: bool = True,
+                 on_saved: Optional[Callable[[List[Dict[str, Any]]], Any]] = None):
+        self.convex = convex
+        self.path = path
+        self.offset_path = f"{path}.offset"
+        self.rejected_path = f"{path}.rejected"
+        self.batch_size = batch_size
+        self.flush_batch_size = flush_batch_size
+        self.max_attempts = max_attempts  # Non-transient failures of the head batch before it is dead-lettered
+        self.fsync = fsync
+        self.on_saved = on_saved  # Called with results written from the log (e.g. ReadingArchive.append)
+
+        self._lock = threading.Lock()        # Log handle, offset and counts
+        self._flush_lock = threading.Lock()  # One flush at a time
+        self._queued: Dict[str, int] = {}    # sensorDataId -> entries in the log
+        self._pending = 0
+        self._attempts = 0
+
+        # Counters
+        self.enqueued = 0
+        self.flushed = 0
+        self.dropped = 0
+        self.rejected = 0
+        self.corrupt = 0  # Undecodable log lines skipped at startup
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._offset = self._load()
+        self._handle = open(path, 'ab')
+        if self.corrupt:
+            logger.warning("✗ Skipped %d undecodable entries in write-behind log %s", self.corrupt, path)
+        if self._pending:
+            logger.info("✓ Write-behind log %s has %d queued entries", path, self._pending)
+
+    # === Log ===
+
+    def _load(self) -> int:
+        """Read the checkpoint, trim a torn last line and count the entries after it (skipping corrupt ones)"""
+        offset = 0
+        try:
+            with open(self.offset_path) as f:
+                offset = int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            pass
+        if not os.path.exists(self.path):
+            return 0
+        size = os.path.getsize(self.path)
+        if offset > size:
+            offset = 0  # Log was emptied after the checkpoint was written
+
+        with open(self.path, 'rb+') as f:
+            f.seek(offset)
+            position = offset
+            for line in f:
+                if not line.endswith(b'\n'):
+                    f.truncate(position)  # Cut short by a crash mid-append
+                    break
+                position += len(line)
+                entry = self._decode(line)
+                if entry is None:
+                    self.corrupt += 1
+                    continue
+                self._count(entry, 1)
+        return offset
+
+    @staticmethod
+    def _decode(line: bytes) -> Optional[Dict[str, Any]]:
+        """Entry of one log line, or None if it is corrupt"""
+        try:
+            entry = json.loads(line)
+            if entry['op'] == 'result':
+                entry['result']['sensorDataId']
+            else:
+                entry['id']
+        except (ValueError, KeyError, TypeError):
+            return None
+        return entry
+
+    def _count(self, entry: Dict[str, Any], delta: int):
+        record_id = entry['result']['sensorDataId'] if entry['op'] == 'result' else entry['id']
+        count = self._queued.get(record_id, 0) + delta
+        if count > 0:
+            self._queued[record_id] = count
+        else:
+            self._queued.pop(record_id, None)
+        self._pending += delta
+
+    def _append(self, entries: List[Dict[str, Any]]):
+        data = b''.join(json.dumps(entry, separators=(',', ':')).encode() + b'\n' for entry in entries)
+        with self._lock:
+            self._handle.write(data)
+            self._handle.flush()
+            if self.fsync:
+                os.fsync(self._handle.fileno())
+            for entry in entries:
+                self._count(entry, 1)
+            self.enqueued += len(entries)
+
+    def _read_batch(self) -> Tuple[List[Dict[str, Any]], int]:
+        """Next run of up to flush_batch_size entries that can go in one call, and the offset after them"""
+        with self._lock:
+            offset = self._offset
+        entries: List[Dict[str, Any]] = []
+        key = None
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break  # Still being appended
+                entry = self._decode(line)
+                if entry is None:
+                    offset += len(line)  # Corrupt; skipped (and counted) when the log was loaded
+                    continue
+                entry_key = (entry['op'], entry.get('leaseOwner'), entry.get('markProcessed'))
+                if key is not None and (entry_key != key or len(entries) >= self.flush_batch_size):
+                    break
+                key = entry_key
+                entries.append(entry)
+                offset += len(line)
+        return entries, offset
+
+    def _advance(self, entries: List[Dict[str, Any]], offset: int):
+        """Move the checkpoint past written entries; empty the log once it is fully written"""
+        with self._lock:
+            self._offset = offset
+            for entry in entries:
+                self._count(entry, -1)
+            if self._pending == 0:
+                self._handle.truncate(0)
+                self._offset = 0
+            self._write_offset()
+
+    def _write_offset(self):
+        tmp = f"{self.offset_path}.tmp"
+        with open(tmp, 'w') as f:
+            f.write(str(self._offset))
+        os.replace(tmp, self.offset_path)
+
+    def _reject(self, entries: List[Dict[str, Any]], error: str):
+        logger.error("✗ Convex refused %d queued entries (%s); kept in %s", len(entries), error, self.rejected_path)
+        with open(self.rejected_path, 'a') as f:
+            for entry in entries:
+                f.write(json.dumps({'entry': entry, 'error': error}) + '\n')
+        self.rejected += len(entries)
+
+    # === Writes (same interface as ConvexClient) ===
+
+    def add_anomaly_results_batch(self, results: List[Dict[str, Any]], mark_processed: bool = True,
+                                  batch_size: Optional[int] = None,
+                                  lease_owner: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Write results now, or queue them if Convex is unavailable or earlier
+        writes are still queued. Queued records get {"ok": False, "queued": True}.
+        """
+        def entry(result):
+            item = {'op': 'result', 'result': result, 'markProcessed': mark_processed}
+            if lease_owner is not None:
+                item['leaseOwner'] = lease_owner
+            return item
+
+        def queued(chunk):
+            self._append([entry(r) for r in chunk])
+            return [{"sensorDataId": r.get("sensorDataId"), "ok": False, "queued": True, "error": "queued"}
+                    for r in chunk]
+
+        return self._write(results, batch_size or self.batch_size,
+                           lambda chunk: self.convex.write_results_chunk(chunk, mark_processed, lease_owner),
+                           queued,
+                           lambda chunk, e: [{"sensorDataId": r.get("sensorDataId"), "ok": False, "error": str(e)}
+                                             for r in chunk])
+
+    def mark_many_as_processed(self, sensor_data_ids: List[str], batch_size: int = 500) -> List[Dict[str, Any]]:
+        """Mark records processed now, or queue the marks like results"""
+        def queued(chunk):
+            self._append([{'op': 'mark', 'id': i} for i in chunk])
+            return [{"id": i, "ok": False, "queued": True, "error": "queued"} for i in chunk]
+
+        return self._write(sensor_data_ids, batch_size, self.convex.mark_processed_chunk, queued,
+                           lambda chunk, e: [{"id": i, "ok": False, "error": str(e)} for i in chunk])
+
+    def _write(self, items: List[Any], batch_size: int, send: Callable, queue: Callable,
+               fail: Callable) -> List[Dict[str, Any]]:
+        statuses: List[Dict[str, Any]] = []
+        backlog = self._pending > 0
+        for start in range(0, len(items), batch_size):
+            chunk = items[start:start + batch_size]
+            if not backlog:
+                try:
+                    statuses.extend(send(chunk))
+                    continue
+                except Exception as e:
+                    if not is_transient(e):
+                        logger.error("Error writing to Convex: %s", e)
+                        statuses.extend(fail(chunk, e))
+                        continue
+                    logger.warning("✗ Convex unavailable (%s); queueing writes in %s", e, self.path)
+                    backlog = True
+            statuses.extend(queue(chunk))
+        return statuses
+
+    # === Draining ===
+
+    def flush(self) -> int:
+        """Write queued entries to Convex in order until the log is empty or a write fails; returns how many were written"""
+        if not self._flush_lock.acquire(blocking=False):
+            return 0  # Another thread is flushing
+        try:
+            total = 0
+            while self._pending:
+                entries, offset = self._read_batch()
+                if not entries:
+                    break
+                if not self._flush_batch(entries, offset):
+                    break
+                total += len(entries)
+            if total:
+                logger.info("✓ Flushed %d queued writes (%d still queued)", total, self._pending)
+            return total
+        finally:
+            self._flush_lock.release()
+
+    def _flush_batch(self, entries: List[Dict[str, Any]], offset: int) -> bool:
+        head = entries[0]
+        try:
+            if head['op'] == 'result':
+                statuses = self.convex.write_results_chunk(
+                    [e['result'] for e in entries], head.get('markProcessed', True), head.get('leaseOwner'))
+            else:
+                statuses = self.convex.mark_processed_chunk([e['id'] for e in entries])
+        except Exception as e:
+            if is_transient(e):
+                return False
+            self._attempts += 1
+            if self._attempts < self.max_attempts:
+                logger.warning("✗ Flushing queued writes failed (%d/%d): %s", self._attempts, self.max_attempts, e)
+                return False
+            self._reject(entries, str(e))
+            self._attempts = 0
+            self._advance(entries, offset)
+            return True
+        self._attempts = 0
+
+        refused = []
+        for entry, status in zip(entries, statuses):
+            if status.get("ok"):
+                continue
+            if status.get("error") in _DROPPED_ERRORS:
+                self.dropped += 1
+            else:
+                refused.append(entry)
+        if refused:
+            self._reject(refused, "refused per record")
+        self._advance(entries, offset)
+        self.flushed += len(entries)
+
+        if head['op'] == 'result':
+            record_write_statuses(statuses)
+            if self.on_saved:
+                self.on_saved([e['result'] for e, status in zip(entries, statuses) if status.get("ok")])
+        return True
+
+    # === Inspection ===
+
+    def __contains__(self, sensor_data_id: str) -> bool:
+        """Whether a record has a queued result or mark (so a re-fetched copy must not be scored again)"""
+        return sensor_data_id in self._queued
+
+    def unqueued(self, records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Fetched records minus those already waiting in the log"""
+        if not self._queued:
+            return records
+        fresh = [r for r in records if r.get("_id") not in self._queued]
+        DUPLICATE_RECORDS.inc(len(records) - len(fresh), source="queued")
+        return fresh
+
+    @property
+    def pending(self) -> int:
+        """Entries queued and not yet written"""
+        return self._pending
+
+    def close(self):
+        with self._lock:
+            self._handle.close()
+
+    def stats(self) -> Dict[str, int]:
+        """Counters for monitoring"""
+        return {
+            'pending': self._pending,
+            'enqueued': self.enqueued,
+            'flushed': self.flushed,
+            'dropped': self.dropped,
+            'rejected': self.rejected,
+            'corrupt': self.corrupt
+        }
@@ -0,0 +1,34 @@
+import pytest
+
+import local_convex
+from convex_client import ConvexClient
+
+
+@pytest.fixture
+def store():
+    """Fresh in-memory Convex stand-in, served over HTTP for the test"""
+    server, url, store = local_convex.serve()
+    store.url = url
+    yield store
+    server.shutdown()
+
+
+@pytest.fixture
+def convex(store):
+    client = ConvexClient(store.url, timeout=5)
+    yield client
+    client.close()
+
+
+def add_readings(store, device_id, count, start_minute=0, **values):
+    """Store `count` readings one minute apart for a device; returns their ids"""
+    ids = []
+    for i in range(count):
+        minute = start_minute + i
+        reading = {"rainValue": 10.0 + i % 7, "soilMoisture": 40.0 + i % 5, "tiltValue": 5.0 + i % 3,
+                   "timestamp": f"2026-01-01T{minute // 60:02d}:{minute % 60:02d}:00.000Z"}
+        reading.update(values)
+        if device_id is not None:
+            reading["deviceId"] = device_id
+        ids.append(store.add_sensor_data(reading))
+    return ids
@@ -0,0 +1,131 @@
+import numpy as np
+import pytest
+
+from anomaly_detector import AnomalyDetector, RollingWindow
+
+
+@pytest.mark.parametrize("size", [1, 5, 20])
+def test_rolling_window_matches_numpy(size):
+    values = np.random.default_rng(size).uniform(-50, 150, size=10 * size + 7)
+    window = RollingWindow(size)
+    for i, value in enumerate(values):
+        window.push(value)
+        expected = values[max(0, i + 1 - size):i + 1]
+        assert window.values() == expected.tolist()
+        assert window.count == len(expected)
+        assert window.mean == pytest.approx(np.mean(expected), rel=1e-9, abs=1e-12)
+        assert window.std == pytest.approx(np.std(expected), rel=1e-9, abs=1e-9)
+
+
+def test_rolling_window_constant_values_have_zero_std():
+    window = RollingWindow(4, [0.1] * 4)
+    for _ in range(50):
+        window.push(0.1)
+    assert window.std == 0.0
+    assert window.zscore(5.0) == 0.0
+
+
+def test_rolling_window_load_keeps_newest_values():
+    window = RollingWindow(3, range(10))
+    assert window.values() == [7.0, 8.0, 9.0]
+    window.push(10)
+    assert window.values() == [8.0, 9.0, 10.0]
+    assert window.mean == pytest.approx(9.0)
+
+
+@pytest.mark.parametrize("window_size,chunks", [(5, [1, 3, 40, 7]), (20, [60]), (20, [4, 4, 100, 1, 31])])
+def test_score_batch_matches_sequential_scoring(window_size, chunks):
+    rng = np.random.default_rng(window_size + len(chunks))
+    # Sensor ranges that cross the default warning and danger thresholds, plus spikes
+    readings = rng.uniform([0, 10, 0], [90, 95, 30], size=(sum(chunks), 3))
+    readings[rng.choice(len(readings), 8, replace=False), 2] *= 4
+    sequential = AnomalyDetector(window_size=window_size)
+    batched = AnomalyDetector(window_size=window_size)
+
+    start = 0
+    for chunk in chunks:
+        rows = readings[start:start + chunk]
+        start += chunk
+        batch = batched.score_batch(rows[:, 0], rows[:, 1], rows[:, 2])
+        for i, (rain, soil, tilt) in enumerate(rows):
+            expected = sequential.score(rain, soil, tilt)
+            assert batch['riskState'][i] == expected.risk_state
+            assert batch['thresholdCodes'][i] == expected.code
+            assert batch['riskScore'][i] == pytest.approx(expected.risk_score, abs=0.01)
+            for key, z in zip(('rain', 'soil', 'tilt'), (expected.z_rain, expected.z_soil, expected.z_tilt)):
+                assert batch['zScores'][key][i] == pytest.approx(z, abs=1e-4)
+            for key, mean in zip(('rain', 'soil', 'tilt'), (expected.mean_rain, expected.mean_soil, expected.mean_tilt)):
+                assert batch['rollingMean'][key][i] == pytest.approx(mean, rel=1e-9)
+        for key, values in sequential.history.items():
+            assert batched.history[key] == pytest.approx(values)
+
+
+@pytest.mark.parametrize("count", [0, 3, 8])
+def test_export_state_round_trip(count):
+    readings = np.random.default_rng(count).uniform(0, 90, size=(count, 3))
+    detector = AnomalyDetector(window_size=8)
+    for rain, soil, tilt in readings:
+        detector.update_and_score(rain, soil, tilt)
+
+    exact = AnomalyDetector(window_size=8)
+    exact.load_state(detector.export_state('float64'))
+    assert exact.history == detector.history
+
+    compact = AnomalyDetector(window_size=8)
+    compact.load_state(detector.export_state())
+    for key, values in detector.history.items():
+        assert compact.history[key] == pytest.approx(values, rel=1e-6)
+
+
+def test_restored_detector_scores_like_history_warmed_detector():
+    readings = np.random.default_rng(7).uniform([0, 10, 0], [90, 95, 30], size=(30, 3))
+    source = AnomalyDetector(window_size=10)
+    for rain, soil, tilt in readings[:25]:
+        source.update_and_score(rain, soil, tilt)
+
+    restored = AnomalyDetector(window_size=10)
+    restored.load_state(source.export_state('float64'))
+    warmed = AnomalyDetector(window_size=10)
+    warmed.history = source.history
+    for rain, soil, tilt in readings[25:]:
+        assert restored.update_and_score(rain, soil, tilt) == warmed.update_and_score(rain, soil, tilt)
+
+
+def test_load_state_rejects_mismatched_values():
+    state = AnomalyDetector(window_size=4).export_state()
+    state["count"] = 2
+    with pytest.raises(ValueError):
+        AnomalyDetector(window_size=4).load_state(state)
+
+
+LEGACY_PAYLOAD_KEYS = {
+    "sensorDataId", "timestamp", "deviceId", "location", "rainValue", "soilMoisture", "tiltValue",
+    "riskScore", "riskState", "zScoreRain", "zScoreSoil", "zScoreTilt",
+    "thresholdStatus", "thresholds", "rollingMean",
+}
+
+
+def test_to_payload_keeps_the_legacy_layout():
+    detector = AnomalyDetector(window_size=5)
+    for tilt in (3.0, 4.0, 5.0):
+        detector.score(10.0, 40.0, tilt)
+    result = detector.score(60.0, 40.0, 30.0)
+    record = {"_id": "r1", "timestamp": "2026-01-01T00:00:00.000Z", "deviceId": "dev-1", "location": "Site A"}
+
+    payload = result.to_payload(record, 60, 40, 30)
+    assert set(payload) == LEGACY_PAYLOAD_KEYS
+    assert payload["sensorDataId"] == "r1" and payload["deviceId"] == "dev-1" and payload["location"] == "Site A"
+    assert isinstance(payload["rainValue"], float) and payload["tiltValue"] == 30.0
+    assert (payload["riskScore"], payload["riskState"]) == (result.risk_score, result.risk_state)
+    assert [payload["zScoreRain"], payload["zScoreSoil"], payload["zScoreTilt"]] == list(result.z_scores.values())
+    assert payload["thresholdStatus"] == result.threshold_status
+    assert payload["thresholdStatus"]["tilt"]["status"] == "danger"
+    assert payload["thresholds"] == detector.thresholds
+    assert payload["rollingMean"] == result.rolling_mean
+
+
+def test_to_payload_omits_missing_device_and_location():
+    result = AnomalyDetector(window_size=5).score(10.0, 40.0, 3.0)
+    payload = result.to_payload({"_id": "r1", "timestamp": "t", "deviceId": None}, 10.0, 40.0, 3.0)
+    assert set(payload) == LEGACY_PAYLOAD_KEYS - {"deviceId", "location"}
+    assert None not in payload.values()
@@ -0,0 +1,80 @@
+import asyncio
+import random
+import threading
+import time
+from collections import defaultdict
+
+from async_pipeline import AsyncPipeline
+from conftest import add_readings
+from detector_registry import DetectorRegistry
+from processing import LocalScorer
+from scheduler import AdaptivePollScheduler
+
+
+def make_pipeline(convex, **kwargs):
+    scorer = LocalScorer(DetectorRegistry(window_size=5))
+    return AsyncPipeline(convex, scorer, scheduler=AdaptivePollScheduler(floor=0.01, ceiling=0.05), **kwargs)
+
+
+def run_until(pipeline, done, timeout=10.0, check=None):
+    """Run the pipeline until done() holds, calling check() while it runs"""
+    async def main():
+        task = asyncio.create_task(pipeline.run())
+        try:
+            deadline = time.monotonic() + timeout
+            while not done():
+                assert time.monotonic() < deadline, f"pipeline stalled: {pipeline.stats()}"
+                if check:
+                    check()
+                await asyncio.sleep(0.01)
+        finally:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+    asyncio.run(main())
+
+
+def test_slow_writes_stop_the_fetch_stage(store, convex):
+    add_readings(store, "dev-1", 40)
+    gate = threading.Event()
+    write = convex.add_anomaly_results_batch
+
+    def blocked_write(*args, **kwargs):
+        gate.wait()
+        return write(*args, **kwargs)
+
+    convex.add_anomaly_results_batch = blocked_write
+    pipeline = make_pipeline(convex, queue_size=1, write_concurrency=1, write_batch_size=2, page_size=2)
+
+    # While the writer is stuck, at most one page per queue slot and stage hand-off is held
+    bound = 2 * 5
+    high_water = []
+
+    def check():
+        high_water.append(pipeline.fetched)
+        if len(high_water) == 30:
+            gate.set()
+
+    run_until(pipeline, lambda: pipeline.written == 40, check=check)
+    assert max(high_water[:29]) <= bound
+    assert pipeline.fetched == 40
+    assert convex.get_unprocessed_data() == []
+
+
+def test_each_device_is_written_in_order_across_lanes(store, convex):
+    expected = {f"dev-{n}": add_readings(store, f"dev-{n}", 12) for n in range(8)}
+    written = defaultdict(list)
+    lock = threading.Lock()
+    write = convex.add_anomaly_results_batch
+
+    def shuffled_write(batch, *args, **kwargs):
+        time.sleep(random.uniform(0, 0.02))  # Lanes finish out of step with each other
+        with lock:
+            for result in batch:
+                written[result["deviceId"]].append(result["sensorDataId"])
+        return write(batch, *args, **kwargs)
+
+    convex.add_anomaly_results_batch = shuffled_write
+    pipeline = make_pipeline(convex, write_concurrency=4, write_batch_size=3, page_size=10)
+    run_until(pipeline, lambda: pipeline.written == 96)
+
+    assert dict(written) == expected
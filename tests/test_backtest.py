@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+
+import backtest
+from anomaly_detector import AnomalyDetector
+from backtest import STATES, BacktestConfig
+from reading_archive import ReadingArchive
+
+CONFIGS = [
+    BacktestConfig("default"),
+    BacktestConfig("short", window_size=5, z_boost=2.0),
+    BacktestConfig("strict", window_size=5, thresholds={"tilt": {"warning": 8.0, "danger": 12.0}}),
+]
+START_MS = int(np.datetime64("2026-01-01T00:00:00", "ms").astype(np.int64))
+
+
+def readings(device, count):
+    """Random walk readings ten minutes apart that cross warning and danger thresholds"""
+    rng = np.random.default_rng(sum(map(ord, device)))
+    values = rng.uniform([0, 10, 0], [90, 95, 30], size=(count, 3))
+    values[rng.choice(count, count // 20, replace=False), 2] *= 3
+    timestamps = [str(np.datetime64(START_MS + i * 600_000, "ms")) + "Z" for i in range(count)]
+    return values, timestamps
+
+
+def sequential_states(config, values):
+    detector = AnomalyDetector(window_size=config.window_size, thresholds=config.table(), z_boost=config.z_boost)
+    return [STATES.index(detector.update_and_score(rain, soil, tilt)[1]) for rain, soil, tilt in values.tolist()]
+
+
+@pytest.fixture
+def archive_root(tmp_path):
+    root = str(tmp_path / "archive")
+    archive = ReadingArchive(root)
+    for device, count in (("dev-1", 500), ("dev-2", 333)):  # Several days each
+        values, timestamps = readings(device, count)
+        archive.append([{"deviceId": device, "timestamp": ts, "rainValue": r, "soilMoisture": s, "tiltValue": t}
+                        for ts, (r, s, t) in zip(timestamps, values.tolist())])
+    archive.close()
+    return root
+
+
+def test_chunked_levels_match_sequential_scoring():
+    values, _ = readings("dev-1", 400)
+    records = np.zeros(len(values), dtype=[("timestamp", "<i8"), ("rain", "<f8"), ("soil", "<f8"), ("tilt", "<f8")])
+    records["rain"], records["soil"], records["tilt"] = values.T
+    bounds = [0, 1, 4, 70, 71, 250, 400]
+    chunks = [records[a:b] for a, b in zip(bounds, bounds[1:])]
+
+    levels = {config.name: [] for config in CONFIGS}
+    for _, chunk_levels in backtest.score_levels(iter(chunks), CONFIGS):
+        for name, config_levels in chunk_levels.items():
+            levels[name].extend(config_levels.tolist())
+    for config in CONFIGS:
+        assert levels[config.name] == sequential_states(config, values)
+
+
+def test_device_stats_match_sequential_states(archive_root):
+    values, _ = readings("dev-1", 500)
+    stats = backtest.backtest_device(archive_root, "dev-1", CONFIGS)
+    for config in CONFIGS:
+        states = sequential_states(config, values)
+        alerts = sum(1 for a, b in zip(states, states[1:]) if a != STATES.index("High") == b)
+        result = stats[config.name].to_dict()
+        assert result["readings"] == 500
+        assert result["stateCounts"] == {state: states.count(i) for i, state in enumerate(STATES)}
+        assert result["alerts"] == alerts
+        assert alerts and result["devicesAlerted"] == 1
+        assert result["timeInHighHours"] == round(states[:-1].count(STATES.index("High")) / 6, 2)
+
+
+def test_verify_and_parallel_run_agree(archive_root):
+    assert backtest.verify(archive_root, "dev-2", CONFIGS, 333) == {config.name: 0 for config in CONFIGS}
+    serial = backtest.run_backtest(archive_root, CONFIGS)
+    parallel = backtest.run_backtest(archive_root, CONFIGS, workers=2)
+    for config in CONFIGS:
+        assert serial[config.name].to_dict() == parallel[config.name].to_dict()
+        assert serial[config.name].devices == 2
@@ -0,0 +1,84 @@
+import importlib.util
+import os
+
+import pytest
+import requests
+
+from anomaly_detector import DEFAULT_THRESHOLDS, AnomalyDetector
+
+API_PATH = os.path.join(os.path.dirname(__file__), "..", "web-app", "api", "calculate-risk.py")
+
+
+@pytest.fixture(scope="module")
+def calculate_risk():
+    spec = importlib.util.spec_from_file_location("calculate_risk", API_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture
+def server(calculate_risk):
+    server, url, detectors = calculate_risk.serve(port=0, window_size=5)
+    yield url, detectors
+    server.shutdown()
+
+
+CUSTOM = {"tilt": {"warning": 1.0, "danger": 2.0}}
+
+
+def reading(device_id, tilt=3.0, **extra):
+    return dict({"deviceId": device_id, "rainValue": 10.0, "soilMoisture": 20.0, "tiltValue": tilt}, **extra)
+
+
+def test_threshold_override_applies_to_its_request_only(server):
+    url, detectors = server
+    custom = requests.post(url, json=reading("dev-1", thresholds=CUSTOM)).json()["data"]
+    assert custom["thresholds"]["tilt"]["danger"] == 2.0
+    assert custom["thresholdStatus"]["tilt"]["status"] == "danger"
+
+    plain = requests.post(url, json=reading("dev-1")).json()["data"]
+    assert plain["thresholds"] == DEFAULT_THRESHOLDS
+    assert plain["thresholdStatus"]["tilt"]["status"] == "normal"
+    detector, _ = detectors.get("dev-1")
+    assert detector.thresholds == DEFAULT_THRESHOLDS
+
+
+def test_batch_threshold_override_applies_to_its_request_only(server):
+    url, detectors = server
+    batch_url = url + "/batch"
+    custom = requests.post(batch_url, json={"readings": [reading("dev-2")], "thresholds": CUSTOM}).json()
+    assert custom["data"]["results"][0]["thresholdStatus"]["tilt"]["status"] == "danger"
+
+    plain = requests.post(batch_url, json={"readings": [reading("dev-2")]}).json()
+    assert plain["data"]["results"][0]["thresholdStatus"]["tilt"]["status"] == "normal"
+    single = requests.post(url, json=reading("dev-2")).json()["data"]
+    assert single["thresholds"] == DEFAULT_THRESHOLDS
+
+
+def test_state_chain_scores_like_history_chain(server):
+    url, _ = server
+    seed = {"rain": [10.0, 12.0, 11.0], "soil": [20.0, 21.0, 19.5], "tilt": [3.0, 3.2, 2.9]}
+    seeded = AnomalyDetector(window_size=20)
+    seeded.history = seed
+    history, state = seed, seeded.export_state("float64")
+    for tilt in [3.0, 4.5, 2.0, 9.0, 3.5, 30.0]:
+        body = {"rainValue": 10.0, "soilMoisture": 20.0, "tiltValue": tilt}
+        old = requests.post(url, json=dict(body, history=history)).json()["data"]
+        new = requests.post(url, json=dict(body, state=state)).json()["data"]
+        history, state = old["history"], new["state"]
+
+        assert "history" not in new
+        assert state["dtype"] == "float64" and state["count"] == len(history["tilt"])
+        for key in ("riskScore", "riskState", "zScores", "rollingMean"):
+            assert new[key] == old[key]
+
+
+def test_history_response_state_continues_the_window(server):
+    url, _ = server
+    body = {"rainValue": 10.0, "soilMoisture": 20.0, "tiltValue": 3.0}
+    first = requests.post(url, json=dict(body, history={"rain": [9.0], "soil": [19.0], "tilt": [2.5]})).json()["data"]
+    old = requests.post(url, json=dict(body, tiltValue=6.0, history=first["history"])).json()["data"]
+    new = requests.post(url, json=dict(body, tiltValue=6.0, state=first["state"])).json()["data"]
+    assert new["riskState"] == old["riskState"]
+    assert new["riskScore"] == pytest.approx(old["riskScore"], abs=1e-4)
@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+from anomaly_detector import AnomalyDetector
+from columnar_store import ColumnarStore
+from detector_registry import DetectorRegistry
+
+
+def readings(seed, n):
+    return np.random.default_rng(seed).uniform(0, 60, size=(n, 3)).tolist()
+
+
+def test_registry_detectors_score_like_plain_detectors():
+    registry = DetectorRegistry(window_size=5, max_detectors=10)
+    registry.store = ColumnarStore(window_size=5, capacity=1)  # Force growth while detectors are live
+    plain = {}
+    for step, (rain, soil, tilt) in enumerate(readings(1, 60)):
+        device_id = f"dev-{step % 4}"
+        expected = plain.setdefault(device_id, AnomalyDetector(window_size=5)).update_and_score(rain, soil, tilt)
+        assert registry.get(device_id).update_and_score(rain, soil, tilt) == expected
+
+    assert registry.store.capacity >= 4
+    for device_id, detector in plain.items():
+        assert registry.get(device_id).history == detector.history
+        assert registry.store.history(device_id) == detector.history
+
+
+def test_evicted_detector_keeps_its_window():
+    registry = DetectorRegistry(window_size=5, max_detectors=1)
+    first = registry.get("dev-1")
+    for rain, soil, tilt in readings(2, 3):
+        first.update_and_score(rain, soil, tilt)
+    history = first.history
+
+    second = registry.get("dev-2")
+    second.update_and_score(1.0, 2.0, 3.0)
+    assert "dev-1" not in registry.store
+    assert first.history == history
+    assert registry.store.history("dev-2") == {"rain": [1.0], "soil": [2.0], "tilt": [3.0]}
+
+
+def test_rescore_fleet_matches_last_scores():
+    registry = DetectorRegistry(window_size=8, max_detectors=10)
+    last = {}
+    for step, (rain, soil, tilt) in enumerate(readings(3, 50)):
+        device_id = f"dev-{step % 5}"
+        last[device_id] = registry.get(device_id).update_and_score(rain, soil, tilt)
+
+    fleet = registry.rescore_fleet()
+    assert sorted(fleet["deviceIds"]) == sorted(last)
+    for i, device_id in enumerate(fleet["deviceIds"]):
+        risk, state, _ = last[device_id]
+        assert fleet["riskState"][i] == state
+        assert fleet["riskScore"][i] == pytest.approx(risk, abs=1e-9)
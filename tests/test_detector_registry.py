@@ -0,0 +1,29 @@
+from conftest import add_readings
+from detector_registry import DetectorRegistry
+from processing import LocalScorer
+
+
+def test_device_history_is_per_device(store, convex):
+    add_readings(store, "dev-a", 8, tiltValue=30.0)
+    scorer = LocalScorer(DetectorRegistry(window_size=5, history_loader=convex.get_device_history))
+    results, failed = scorer(convex.get_unprocessed_data())
+    assert not failed
+    convex.add_anomaly_results_batch(results)
+
+    history = convex.get_device_history("dev-a", 5)
+    assert history['tilt'] == [30.0] * 5
+    assert convex.get_device_history(None, 5) == {'rain': [], 'soil': [], 'tilt': []}
+
+
+def test_readings_without_device_do_not_warm_start_from_other_devices(store, convex):
+    add_readings(store, "dev-a", 8, tiltValue=30.0)
+    scorer = LocalScorer(DetectorRegistry(window_size=5, history_loader=convex.get_device_history))
+    results, _ = scorer(convex.get_unprocessed_data())
+    convex.add_anomaly_results_batch(results)
+
+    # A fresh poller: readings without a deviceId must start cold
+    add_readings(store, None, 3, start_minute=10)
+    results, _ = LocalScorer(DetectorRegistry(window_size=5, history_loader=convex.get_device_history))(
+        convex.get_unprocessed_data())
+    assert [r.get("deviceId") for r in results] == [None] * 3
+    assert [r["riskState"] for r in results] == ["Initializing"] * 3
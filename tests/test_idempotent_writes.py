@@ -0,0 +1,63 @@
+from collections import Counter
+
+import app
+from circuit_breaker import CircuitBreaker
+from conftest import add_readings
+from convex_client import ConvexClient
+from detector_registry import DetectorRegistry
+from processing import LocalScorer, ResultCache
+from write_behind import WriteBehind
+
+
+def score(records):
+    results, failed_ids = LocalScorer(DetectorRegistry(window_size=5))(records)
+    assert not failed_ids
+    return results
+
+
+def test_repeated_add_anomaly_result_keeps_one_row(store, convex):
+    add_readings(store, "dev-1", 2)
+    first, second = score(convex.get_unprocessed_data())
+
+    assert convex.add_anomaly_result(first)
+    assert convex.add_anomaly_result(first)  # A retry after a lost response
+    assert convex.add_anomaly_result(second)
+    assert len(store.anomaly_results) == 2
+
+
+def test_retried_batch_write_reports_duplicates(store, convex):
+    add_readings(store, "dev-1", 6)
+    results = score(convex.get_unprocessed_data())
+
+    first = convex.add_anomaly_results_batch(results, batch_size=4)
+    retry = convex.add_anomaly_results_batch(results, batch_size=4)
+
+    assert all(status["ok"] and not status.get("duplicate") for status in first)
+    assert all(status["ok"] and status["duplicate"] for status in retry)
+    assert [status["id"] for status in retry] == [status["id"] for status in first]
+    assert len(store.anomaly_results) == 6
+    assert convex.get_unprocessed_data() == []
+
+
+def test_writes_retried_after_lost_responses_save_each_reading_once(store, tmp_path):
+    ids = add_readings(store, "dev-1", 30) + add_readings(store, "dev-2", 30)
+    convex = ConvexClient(store.url, timeout=5, breaker=CircuitBreaker(failure_threshold=1000))
+    outbox = WriteBehind(convex, str(tmp_path / "write_behind.log"), batch_size=10, fsync=False)
+    scorer = LocalScorer(DetectorRegistry(window_size=5))
+    store._rng.seed(7)
+    store.lost_response_rate = 0.5  # Applied by Convex, but the poller sees a 503 and retries from the log
+
+    for _ in range(100):
+        outbox.flush()
+        records = convex.get_unprocessed_data()
+        if not records and not outbox.pending:
+            break
+        app.process_records(convex, scorer, records, cache=ResultCache(), outbox=outbox)
+        store.lost_response_rate *= 0.8
+    outbox.close()
+    convex.close()
+
+    assert outbox.enqueued and outbox.flushed == outbox.enqueued and not outbox.rejected
+    per_reading = Counter(doc["sensorDataId"] for doc in store.anomaly_results.docs.values())
+    assert sorted(per_reading) == sorted(ids)
+    assert set(per_reading.values()) == {1}
@@ -0,0 +1,56 @@
+import time
+
+from conftest import add_readings
+from detector_registry import DetectorRegistry
+from leases import LEASE_PARTITIONS, LeaseManager, partition_for
+from processing import LocalScorer
+
+
+def test_pollers_split_partitions_fairly(convex):
+    a = LeaseManager(convex, ttl=30, owner="a")
+    b = LeaseManager(convex, ttl=30, owner="b")
+    assert a.claim() == list(range(LEASE_PARTITIONS))
+
+    assert len(b.claim()) == 0  # Everything is held and unexpired
+    assert len(a.claim()) == LEASE_PARTITIONS // 2  # a sees b and releases the share above its own
+    assert len(b.claim()) == LEASE_PARTITIONS // 2
+    assert sorted(a.partitions + b.partitions) == list(range(LEASE_PARTITIONS))
+    assert a.evict_lost(LocalScorer(DetectorRegistry())) == LEASE_PARTITIONS // 2
+
+
+def lease_expiry(store):
+    return {lease["partition"]: lease["expiresAt"] for lease in store.device_leases.docs.values()}
+
+
+def test_renew_extends_held_leases(store, convex):
+    poller = LeaseManager(convex, ttl=30, owner="a")
+    poller.claim()
+    before = lease_expiry(store)
+    time.sleep(0.01)
+    assert poller.renew()
+    after = lease_expiry(store)
+    assert sorted(after) == poller.partitions
+    assert all(after[partition] > before[partition] for partition in after)
+
+
+def test_expired_leases_are_stolen_and_old_owner_writes_rejected(store, convex):
+    dead = LeaseManager(convex, ttl=0.2, owner="dead")
+    dead.claim()
+    add_readings(store, "dev-1", 6)
+    scorer = LocalScorer(DetectorRegistry(window_size=5))
+    results, _ = scorer(convex.get_unprocessed_data())
+    assert "dev-1" in scorer.detectors
+
+    time.sleep(0.3)  # "dead" stops renewing
+    alive = LeaseManager(convex, ttl=30, owner="alive")
+    assert alive.claim() == list(range(LEASE_PARTITIONS))
+
+    statuses = convex.write_results_chunk(results, lease_owner="dead")
+    assert {status["error"] for status in statuses} == {"lease lost"}
+    assert len(store.anomaly_results) == 0
+
+    assert dead.renew() and dead.partitions == []
+    assert dead.evict_lost(scorer) == LEASE_PARTITIONS
+    assert "dev-1" not in scorer.detectors
+    assert partition_for("dev-1") in alive.partitions
+    assert all(status["ok"] for status in convex.write_results_chunk(results, lease_owner="alive"))
@@ -0,0 +1,16 @@
+import requests
+
+from metrics import MetricsRegistry, start_metrics_server
+
+
+def test_metrics_server_binds_loopback_by_default():
+    registry = MetricsRegistry()
+    registry.counter("test_total", "Test counter").inc()
+    server = start_metrics_server(0, registry=registry)
+    try:
+        host, port = server.server_address[:2]
+        assert host == "127.0.0.1"
+        body = requests.get(f"http://{host}:{port}/metrics", timeout=5).text
+        assert "test_total 1" in body
+    finally:
+        server.shutdown()
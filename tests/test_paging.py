@@ -0,0 +1,45 @@
+import pytest
+
+from conftest import add_readings
+from processing import prefetch
+
+
+def test_paging_while_marking_processed_sees_every_record_once(store, convex):
+    ids = [id_ for n in range(3) for id_ in add_readings(store, f"dev-{n}", 9)]
+    seen = []
+    pages = 0
+    for page in prefetch(convex.iter_unprocessed_pages(page_size=4), depth=2):
+        pages += 1
+        seen.extend(r["_id"] for r in page)
+        convex.mark_many_as_processed([r["_id"] for r in page])
+
+    assert pages > 1
+    assert sorted(seen) == sorted(ids)
+    assert convex.get_unprocessed_data() == []
+
+
+def test_prefetch_keeps_order_and_raises_producer_errors():
+    def pages():
+        yield [1, 2]
+        yield [3]
+        raise RuntimeError("fetch failed")
+
+    seen = []
+    with pytest.raises(RuntimeError, match="fetch failed"):
+        for page in prefetch(pages()):
+            seen.append(page)
+    assert seen == [[1, 2], [3]]
+
+
+def test_prefetch_stops_when_the_consumer_leaves():
+    produced = []
+
+    def pages():
+        for n in range(100):
+            produced.append(n)
+            yield n
+
+    for page in prefetch(pages(), depth=1):
+        if page == 2:
+            break
+    assert len(produced) < 100
@@ -0,0 +1,72 @@
+import os
+
+import numpy as np
+import pytest
+
+from anomaly_detector import AnomalyDetector
+from reading_archive import RECORD_DTYPE, ReadingArchive
+
+
+def payloads(device_id, start_hour, count):
+    """Scored results one hour apart from 2026-01-01 `start_hour`:00 UTC"""
+    detector = AnomalyDetector(window_size=5)
+    results = []
+    for i in range(count):
+        hour = start_hour + i
+        rain, soil, tilt = 10.0 + i, 40.0 + i % 5, 5.0 + 3 * (i % 4)
+        record = {"_id": f"{device_id}-{i}", "deviceId": device_id,
+                  "timestamp": f"2026-01-{1 + hour // 24:02d}T{hour % 24:02d}:00:00.000Z"}
+        results.append(detector.score(rain, soil, tilt).to_payload(record, rain, soil, tilt))
+    return results
+
+
+@pytest.fixture
+def archive(tmp_path):
+    archive = ReadingArchive(str(tmp_path / "archive"))
+    yield archive
+    archive.close()
+
+
+def test_append_and_read_round_trip(archive):
+    results = payloads("site/dev 1", 20, 10) + payloads(None, 0, 3)  # Crosses midnight; odd and missing ids
+    assert archive.append(results) == 13
+
+    assert sorted(archive.devices(), key=str) == [None, "site/dev 1"]
+    assert archive.days("site/dev 1") == ["2026-01-01", "2026-01-02"]
+    records = archive.read("site/dev 1")
+    expected = [r for r in results if r.get("deviceId") == "site/dev 1"]
+    assert records["rain"].tolist() == [r["rainValue"] for r in expected]
+    assert records["tilt"].tolist() == [r["tiltValue"] for r in expected]
+    assert records["riskScore"] == pytest.approx([r["riskScore"] for r in expected])
+    assert records["zScores"][:, 2] == pytest.approx([r["zScoreTilt"] for r in expected], abs=1e-5)
+    assert np.all(np.diff(records["timestamp"]) == 3600 * 1000)
+    assert len(archive.read(None)) == 3
+
+
+def test_read_range_is_start_inclusive_end_exclusive(archive):
+    archive.append(payloads("dev-1", 20, 10))  # 2026-01-01T20:00 .. 2026-01-02T05:00
+    records = archive.read("dev-1", start="2026-01-01T22:00:00Z", end="2026-01-02T02:00:00Z")
+    hours = (records["timestamp"] // 3600000 - records["timestamp"][0] // 3600000).tolist()
+    assert len(records) == 4 and hours == [0, 1, 2, 3]
+    assert records["rain"].tolist() == [12.0, 13.0, 14.0, 15.0]
+
+    assert len(archive.read("dev-1", start="2026-01-02T00:00:00Z")) == 6
+    assert len(archive.read("dev-1", end="2026-01-02T00:00:00Z")) == 4
+    assert len(archive.read("dev-1", start="2026-01-03T00:00:00Z")) == 0
+
+
+def test_torn_trailing_record_is_ignored_and_trimmed(tmp_path):
+    root = str(tmp_path / "archive")
+    first = ReadingArchive(root)
+    first.append(payloads("dev-1", 0, 3))
+    first.close()
+    path = first.path("dev-1", "2026-01-01")
+    with open(path, "ab") as f:
+        f.write(b"\x01" * 17)  # Crash mid-append
+
+    archive = ReadingArchive(root)
+    assert len(archive.read("dev-1")) == 3
+    archive.append(payloads("dev-1", 3, 2))
+    archive.close()
+    assert os.path.getsize(path) == 5 * RECORD_DTYPE.itemsize
+    assert archive.read("dev-1")["rain"].tolist() == [10.0, 11.0, 12.0, 10.0, 11.0]
@@ -0,0 +1,101 @@
+from datetime import datetime, timezone
+
+import numpy as np
+import pytest
+
+from reading_archive import ARCHIVE_STATES
+from rollups import GRANULARITIES, METRICS, RollupAggregator
+
+START_MS = 1767225600000  # 2026-01-01T00:00:00Z
+
+
+def result(device_id, minute, risk_state="Low"):
+    return {"deviceId": device_id, "timestamp": f"2026-01-01T{minute // 60:02d}:{minute % 60:02d}:00.000Z",
+            "rainValue": 10.0, "soilMoisture": 40.0, "tiltValue": 5.0, "riskScore": 20.0, "riskState": risk_state}
+
+
+def test_pending_rows_are_capped_while_convex_is_down(store, convex):
+    store.error_rate = 1.0
+    rollups = RollupAggregator(convex, max_pending=10)
+    rollups.add([result("dev-1", minute) for minute in range(12)])  # 12 minute + 1 hour + 1 day rows
+
+    assert rollups.stats()["pending"] == 10
+    assert rollups.dropped == 4
+    assert rollups.flush(force=True) == 0
+    assert rollups.stats()["pending"] == 10
+
+    minutes = sorted(bucket for _, granularity, bucket in rollups._pending if granularity == "minute")
+    assert minutes == [START_MS + minute * 60_000 for minute in range(4, 12)]  # The oldest minutes went first
+
+    store.error_rate = 0.0
+    assert rollups.flush(force=True) == 10
+    assert len(store.result_rollups) == 10
+
+
+def iso(ms):
+    return datetime.fromtimestamp(ms / 1000, tz=timezone.utc).isoformat(timespec="milliseconds").replace("+00:00", "Z")
+
+
+def brute_force(readings, max_gap_ms):
+    """Rollup rows computed reading by reading: (deviceId, granularity, bucketStart) -> row"""
+    rows = {}
+    for device_id in {r["deviceId"] for r in readings}:
+        series = sorted((r for r in readings if r["deviceId"] == device_id), key=lambda r: r["ms"])
+        for granularity, width in GRANULARITIES.items():
+            def row(bucket):
+                return rows.setdefault((device_id, granularity, bucket), {
+                    "count": 0, "values": [], "stateMs": [0] * len(ARCHIVE_STATES), "last": None})
+            for i, reading in enumerate(series):
+                bucket = row(reading["ms"] // width * width)
+                bucket["count"] += 1
+                bucket["values"].append(reading["values"])
+                bucket["last"] = reading
+                if i + 1 < len(series):
+                    start = reading["ms"]
+                    end = start + min(series[i + 1]["ms"] - start, max_gap_ms)
+                    while start < end:
+                        edge = start // width * width + width
+                        row(start // width * width)["stateMs"][ARCHIVE_STATES.index(reading["riskState"])] += \
+                            min(end, edge) - start
+                        start = min(end, edge)
+    return rows
+
+
+def test_merged_rollups_match_brute_force(store, convex):
+    rng = np.random.default_rng(5)
+    readings = []
+    for device_id in ("dev-1", "dev-2"):
+        ms = START_MS + 23 * 3_600_000  # Spans midnight, so day buckets split too
+        for _ in range(150):
+            ms += int(rng.integers(1, 600_000))  # Gaps of up to 10 minutes, some over ROLLUP_MAX_GAP
+            readings.append({"deviceId": device_id, "ms": ms, "values": rng.uniform(0, 100, 4).tolist(),
+                             "riskState": ARCHIVE_STATES[rng.integers(len(ARCHIVE_STATES))]})
+    readings.sort(key=lambda r: r["ms"])
+
+    rollups = RollupAggregator(convex, max_gap=300)
+    for chunk in np.array_split(np.arange(len(readings)), 4):  # Partial rows merged in Convex across flushes
+        rollups.add([{"deviceId": readings[i]["deviceId"], "timestamp": iso(readings[i]["ms"]),
+                      **dict(zip(("rainValue", "soilMoisture", "tiltValue", "riskScore"), readings[i]["values"])),
+                      "riskState": readings[i]["riskState"]} for i in chunk])
+        rollups.flush(force=True)
+
+    expected = brute_force(readings, 300_000)
+    stored = {(doc["deviceId"], doc["granularity"], doc["bucketStart"]): doc
+              for doc in store.result_rollups.docs.values()}
+    assert sorted(stored) == sorted(expected)
+    for key, want in expected.items():
+        got = stored[key]
+        assert got["count"] == want["count"]
+        assert [got["stateSeconds"][state] for state in ARCHIVE_STATES] == \
+            pytest.approx([ms / 1000 for ms in want["stateMs"]])
+        if not want["count"]:
+            assert "lastAt" not in got
+            continue
+        values = np.array(want["values"])
+        assert got["lastAt"] == want["last"]["ms"]
+        assert got["lastRiskState"] == want["last"]["riskState"]
+        for j, metric in enumerate(METRICS):
+            assert got[metric]["min"] == values[:, j].min()
+            assert got[metric]["max"] == values[:, j].max()
+            assert got[metric]["sum"] == pytest.approx(values[:, j].sum())
+            assert got[metric]["last"] == want["last"]["values"][j]
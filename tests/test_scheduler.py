@@ -0,0 +1,56 @@
+import random
+
+import pytest
+
+from scheduler import AdaptivePollScheduler
+
+
+def test_idle_backoff_grows_to_the_ceiling():
+    scheduler = AdaptivePollScheduler(floor=1.0, ceiling=10.0, jitter=0.0)
+    assert [scheduler.next_delay(0) for _ in range(6)] == [1.0, 2.0, 4.0, 8.0, 10.0, 10.0]
+
+
+def test_backlog_polls_immediately_and_resets_backoff():
+    scheduler = AdaptivePollScheduler(floor=1.0, ceiling=10.0, jitter=0.0)
+    for _ in range(3):
+        scheduler.next_delay(0)
+    scheduler.next_delay(0, error=True)
+    assert scheduler.next_delay(5) == 0.0
+    assert scheduler.next_delay(0) == 1.0
+    assert scheduler.next_delay(0, error=True) == 1.0
+    assert scheduler.next_delay(0, error=True) == 2.0
+
+
+def test_idle_and_error_streaks_are_separate():
+    scheduler = AdaptivePollScheduler(floor=1.0, ceiling=100.0, jitter=0.0)
+    assert [scheduler.next_delay(0, error=True) for _ in range(3)] == [1.0, 2.0, 4.0]
+    assert scheduler.next_delay(0) == 1.0  # An idle poll starts its own streak
+
+
+@pytest.mark.parametrize("jitter", [0.25, 0.5, 1.0])
+def test_jitter_stays_within_bounds(jitter):
+    rng = random.Random(jitter)
+    scheduler = AdaptivePollScheduler(floor=0.5, ceiling=8.0, jitter=jitter, rng=rng.random)
+    delays = []
+    for streak in range(1, 12):
+        delay = scheduler.next_delay(0)
+        base = min(8.0, 0.5 * 2 ** (streak - 1))
+        assert max(0.5, base * (1 - jitter)) <= delay <= base
+        delays.append(delay)
+    assert len(set(delays)) > 1
+
+
+def test_jitter_extremes():
+    def first_delays(draw):
+        scheduler = AdaptivePollScheduler(floor=1.0, ceiling=8.0, rng=lambda: draw)
+        return [scheduler.next_delay(0) for _ in range(4)]
+
+    assert first_delays(0.0) == [1.0, 2.0, 4.0, 8.0]
+    assert first_delays(1.0) == [1.0, 1.0, 2.0, 4.0]  # Never below the floor
+
+
+def test_invalid_bounds_are_rejected():
+    with pytest.raises(ValueError):
+        AdaptivePollScheduler(floor=0.0)
+    with pytest.raises(ValueError):
+        AdaptivePollScheduler(floor=5.0, ceiling=1.0)
@@ -0,0 +1,33 @@
+import os
+import signal
+import threading
+
+from conftest import add_readings
+from sharded import ShardedScorer, shard_for
+
+
+def test_killed_worker_fails_its_shard_and_is_restarted(store, convex):
+    for n in range(6):
+        add_readings(store, f"dev-{n}", 2)
+    records = convex.get_unprocessed_data()
+    doomed = {r["_id"] for r in records if shard_for(r["deviceId"], 2) == 0}
+    assert doomed and len(doomed) < len(records)
+
+    scorer = ShardedScorer(store.url, num_workers=2, poll_interval=0.1)
+    try:
+        store.latency = 0.5  # History loads keep both workers busy while one is killed
+        killer = threading.Timer(0.2, os.kill, (scorer._workers[0].pid, signal.SIGKILL))
+        killer.start()
+        results, failed_ids = scorer(records)
+        killer.join()
+
+        assert set(failed_ids) == doomed
+        assert {r["sensorDataId"] for r in results} == {r["_id"] for r in records} - doomed
+        assert scorer.stats()["restarts"] == 1
+
+        store.latency = 0.0
+        results, failed_ids = scorer(records)  # The restarted worker picks the shard back up
+        assert failed_ids == []
+        assert len(results) == len(records)
+    finally:
+        scorer.close()
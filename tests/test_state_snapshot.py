@@ -0,0 +1,61 @@
+import app
+from conftest import add_readings
+from detector_registry import DetectorRegistry
+from processing import LocalScorer
+from state_snapshot import load_snapshot, save_snapshot
+
+LONG_ID = "site-" + "x" * 120
+UNICODE_ID = "Estación-Ñuñoa-传感器-01"
+LONG_TIMESTAMP = "2026-01-01T00:00:00.123456789+05:30[Asia/Kolkata]"
+
+
+def test_snapshot_keeps_long_and_non_ascii_ids(tmp_path):
+    registry = DetectorRegistry(window_size=4)
+    for i, device_id in enumerate((LONG_ID, UNICODE_ID, None)):
+        registry.get(device_id).update_and_score(1.0 + i, 2.0, 3.0)
+        registry.mark_scored(device_id, LONG_TIMESTAMP if device_id == LONG_ID else "2026-01-01T00:00:00Z")
+
+    path = str(tmp_path / "state.npy")
+    assert save_snapshot(registry, path) == 3
+    restored = load_snapshot(path)
+
+    assert set(restored) == {LONG_ID, UNICODE_ID, None}
+    assert restored[LONG_ID].last_timestamp == LONG_TIMESTAMP
+    assert restored[UNICODE_ID].history == {"rain": [2.0], "soil": [2.0], "tilt": [3.0]}
+    assert restored[None].history["rain"] == [3.0]
+
+
+def test_restart_from_snapshot_scores_like_an_uninterrupted_poller(store, convex, tmp_path):
+    path = str(tmp_path / "detector_state.npy")
+
+    def scorer(snapshot_path=None):
+        return LocalScorer(DetectorRegistry(window_size=5, history_loader=convex.get_device_history),
+                           snapshot_path=snapshot_path)
+
+    uninterrupted = scorer()
+    before_restart = scorer(path)
+    for device_id in ("dev-1", "dev-2"):
+        add_readings(store, device_id, 8, tiltValue=5.0)
+    records = convex.get_unprocessed_data()
+    uninterrupted(records)
+    app.process_records(convex, before_restart, records)
+    before_restart.snapshot()
+
+    # Saved after the snapshot: a restarted poller replays these from Convex
+    for device_id in ("dev-1", "dev-2"):
+        add_readings(store, device_id, 3, start_minute=8)
+    records = convex.get_unprocessed_data()
+    uninterrupted(records)
+    app.process_records(convex, before_restart, records)
+
+    restarted = scorer(path)
+    for device_id in ("dev-1", "dev-2"):
+        add_readings(store, device_id, 4, start_minute=11, tiltValue=40.0)
+    records = convex.get_unprocessed_data()
+    expected, _ = uninterrupted(records)
+    scored, _ = restarted(records)
+
+    assert restarted.detectors.restores == 2 and restarted.detectors.warm_starts == 0
+    assert [(r["riskScore"], r["riskState"], r["zScoreTilt"]) for r in scored] == \
+        [(r["riskScore"], r["riskState"], r["zScoreTilt"]) for r in expected]
+    assert {r["riskState"] for r in scored} == {"High"}
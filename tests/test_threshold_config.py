@@ -0,0 +1,68 @@
+import json
+import pickle
+
+import pytest
+
+from anomaly_detector import DEFAULT_THRESHOLDS, FrozenDict
+from threshold_config import ThresholdConfig
+
+CONFIG = {
+    "default": {"rain": {"warning": 40}},
+    "sites": {"Site A": {"rain": {"danger": 60}, "soil": {"warning": 65}}},
+    "devices": {"dev-1": {"soil": {"warning": 55}, "tilt": {"danger": 20}}},
+}
+
+
+@pytest.fixture
+def config():
+    return ThresholdConfig(CONFIG["default"], CONFIG["sites"], CONFIG["devices"])
+
+
+def test_device_overrides_site_overrides_defaults(config):
+    rules = config.for_device("dev-1", "Site A").config
+    assert rules["rain"]["warning"] == 40.0   # default override
+    assert rules["rain"]["danger"] == 60.0    # site
+    assert rules["soil"]["warning"] == 55.0   # device beats site
+    assert rules["tilt"]["danger"] == 20.0    # device
+    assert rules["tilt"]["warning"] == DEFAULT_THRESHOLDS["tilt"]["warning"]  # untouched field
+
+
+def test_unknown_site_and_device_get_defaults(config):
+    assert config.for_device("dev-1", "Elsewhere").config["soil"]["warning"] == 55.0
+    assert config.for_device("dev-9", "Site A").config["soil"]["warning"] == 65.0
+    plain = config.for_device("dev-9").config
+    assert plain["rain"] == {"warning": 40.0, "danger": 75.0, "unit": ""}
+    assert plain["soil"]["warning"] == DEFAULT_THRESHOLDS["soil"]["warning"]
+
+
+def test_identical_rules_share_one_table(config):
+    assert config.for_device("dev-8") is config.for_device("dev-9", "Elsewhere")
+    assert config.for_device("dev-1", "Site A") is config.for_device("dev-1", "Site A")
+
+
+def test_from_file_and_bad_values_fail_at_load(tmp_path):
+    path = tmp_path / "thresholds.json"
+    path.write_text(json.dumps(CONFIG))
+    assert ThresholdConfig.from_file(str(path)).for_device("dev-1").config["tilt"]["danger"] == 20.0
+
+    with pytest.raises(ValueError):
+        ThresholdConfig(devices={"dev-1": {"tilt": {"danger": "high"}}})
+
+
+def test_shared_threshold_objects_are_read_only(config):
+    table = config.for_device("dev-1", "Site A")
+    for frozen in (table.config, table.config["tilt"], table.status_by_code[0], table.status_by_code[0]["rain"]):
+        assert isinstance(frozen, FrozenDict)
+        with pytest.raises(TypeError):
+            frozen["rain"] = {}
+        with pytest.raises(TypeError):
+            frozen.update(rain={})
+        with pytest.raises(TypeError):
+            frozen.pop("rain", None)
+        with pytest.raises(TypeError):
+            del frozen["tilt"]
+    assert table.config["tilt"]["danger"] == 20.0
+
+    copy = pickle.loads(pickle.dumps(table.config))
+    assert isinstance(copy, FrozenDict) and copy == table.config
+    assert json.loads(json.dumps(table.config)) == table.config
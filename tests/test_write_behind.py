@@ -0,0 +1,108 @@
+import os
+
+import pytest
+
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+from conftest import add_readings
+from convex_client import ConvexClient
+from detector_registry import DetectorRegistry
+from processing import LocalScorer
+from write_behind import WriteBehind
+
+
+@pytest.fixture
+def results(store, convex):
+    add_readings(store, "dev-1", 12)
+    scored, _ = LocalScorer(DetectorRegistry(window_size=5))(convex.get_unprocessed_data())
+    return scored
+
+
+def stored_ids(store):
+    return sorted(doc["sensorDataId"] for doc in store.anomaly_results.docs.values())
+
+
+def test_writes_queue_during_outage_and_replay_in_order(store, convex, results, tmp_path):
+    path = str(tmp_path / "write_behind.log")
+    outbox = WriteBehind(convex, path, batch_size=4, fsync=False)
+    store.error_rate = 1.0
+    statuses = outbox.add_anomaly_results_batch(results)
+    assert all(status["queued"] for status in statuses)
+    assert outbox.pending == 12 and results[0]["sensorDataId"] in outbox
+
+    assert outbox.flush() == 0  # Still down: nothing is lost or skipped
+    store.error_rate = 0.0
+    assert outbox.flush() == 12
+    assert outbox.pending == 0 and os.path.getsize(path) == 0
+    assert [doc["sensorDataId"] for doc in store.anomaly_results.docs.values()] == \
+        [r["sensorDataId"] for r in results]
+    assert convex.get_unprocessed_data() == []
+    outbox.close()
+
+
+def test_restart_resumes_from_checkpoint(store, convex, results, tmp_path):
+    path = str(tmp_path / "write_behind.log")
+    store.error_rate = 1.0
+    outbox = WriteBehind(convex, path, flush_batch_size=5, fsync=False)
+    outbox.add_anomaly_results_batch(results)
+    store.error_rate = 0.0
+
+    def fail_after_first_batch(saved):
+        store.error_rate = 1.0
+
+    outbox.on_saved = fail_after_first_batch
+    assert outbox.flush() == 5
+    outbox.close()
+    with open(path, "ab") as f:
+        f.write(b'{"op":"result","res')  # Torn by a crash mid-append
+
+    store.error_rate = 0.0
+    calls = store.calls["sensorData:addAnomalyResultsBatch"]
+    restarted = WriteBehind(convex, path, flush_batch_size=5, fsync=False)
+    assert restarted.pending == 7  # The first five are past the checkpoint, the torn line is trimmed
+    assert restarted.flush() == 7
+    assert store.calls["sensorData:addAnomalyResultsBatch"] - calls == 2
+    assert stored_ids(store) == sorted(r["sensorDataId"] for r in results)
+    restarted.close()
+
+
+
+def test_restart_skips_corrupt_lines(store, convex, results, tmp_path):
+    path = str(tmp_path / "write_behind.log")
+    store.error_rate = 1.0
+    outbox = WriteBehind(convex, path, flush_batch_size=4, fsync=False)
+    outbox.add_anomaly_results_batch(results)
+    outbox.close()
+    with open(path, "rb") as f:
+        lines = f.readlines()
+    lines.insert(3, b'{"op":"resu\x00\xff garbage\n')   # Damaged bytes
+    lines.insert(8, b'{"op":"result"}\n')                 # Valid JSON, not an entry
+    lines.append(b'[1, 2]\n')
+    with open(path, "wb") as f:
+        f.writelines(lines)
+
+    store.error_rate = 0.0
+    restarted = WriteBehind(convex, path, flush_batch_size=4, fsync=False)
+    assert restarted.pending == 12
+    assert restarted.stats()["corrupt"] == 3
+    assert restarted.flush() == 12
+    assert restarted.pending == 0 and os.path.getsize(path) == 0
+    assert stored_ids(store) == sorted(r["sensorDataId"] for r in results)
+    restarted.close()
+
+def test_breaker_fails_fast_then_lets_a_trial_call_through(store):
+    now = [0.0]
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10.0, clock=lambda: now[0])
+    convex = ConvexClient(store.url, timeout=5, breaker=breaker)
+    store.error_rate = 1.0
+    for _ in range(2):
+        with pytest.raises(Exception):
+            convex.write_results_chunk([])
+    with pytest.raises(CircuitOpenError):
+        convex.write_results_chunk([])
+    assert store.calls["sensorData:addAnomalyResultsBatch"] == 2
+
+    now[0] = 10.0
+    store.error_rate = 0.0
+    assert convex.write_results_chunk([]) == []
+    assert breaker.state == CircuitBreaker.CLOSED
+    convex.close()
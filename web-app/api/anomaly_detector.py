@@ -1,62 +1,445 @@
+import base64
+import json
+import math
 import numpy as np
-from typing import Tuple, Dict, List
+from numpy.lib.stride_tricks import sliding_window_view
+from typing import Tuple, Dict, List, Iterable, Any, Optional
+
+SENSORS = ('rain', 'soil', 'tilt')
+RISK_STATES = ('Low', 'Moderate', 'High')
+
+# Fixed threshold values (engineering/geological limits)
+DEFAULT_THRESHOLDS = {
+    'tilt': {
+        'warning': 15.0,   # 15° = noticeable ground movement
+        'danger': 25.0,    # 25° = imminent failure risk
+        'unit': '°'
+    },
+    'soil': {
+        'warning': 70.0,   # 70% = soil saturation beginning
+        'danger': 85.0,    # 85% = pore pressure critical
+        'unit': '%'
+    },
+    'rain': {
+        'warning': 50.0,   # Moderate rainfall
+        'danger': 75.0,    # Heavy rainfall
+        'unit': ''
+    }
+}
+
+
+class RollingWindow:
+    """
+    Fixed-size ring buffer with O(1) running mean and population variance.
+
+    Uses Welford's update while the window fills and the sliding-window form
+    of it once full (the oldest value is replaced in place). The buffer is
+    re-summed exactly every `size` replacements so round-off cannot build up.
+
+    Tolerance: mean/std match np.mean/np.std (ddof=0) over the same values to
+    within 1e-9 relative for sensor-range inputs. Variances below
+    VARIANCE_EPSILON (relative to mean^2) are reported as 0, where np.std would
+    only return round-off residue.
+    """
+
+    VARIANCE_EPSILON = 1e-20
+
+    __slots__ = ('size', 'count', 'mean', '_m2', '_buffer', '_head', '_replacements')
+
+    def __init__(self, size: int, values: Iterable[float] = ()):
+        if size < 1:
+            raise ValueError("window size must be at least 1")
+        self.size = size
+        self.load(values)
+
+    def load(self, values: Iterable[float]) -> None:
+        """Reset the window to the last `size` of the given values (oldest first)"""
+        values = [float(v) for v in values][-self.size:]
+        self._buffer = values + [0.0] * (self.size - len(values))
+        self.count = len(values)
+        self._head = self.count % self.size
+        self._replacements = 0
+        self._resync()
+
+    def push(self, value: float) -> None:
+        """Add a value, evicting the oldest one if the window is full"""
+        value = float(value)
+        head = self._head
+        if self.count < self.size:
+            self.count += 1
+            delta = value - self.mean
+            self.mean += delta / self.count
+            self._m2 += delta * (value - self.mean)
+            self._buffer[head] = value
+        else:
+            old = self._buffer[head]
+            old_mean = self.mean
+            self.mean += (value - old) / self.size
+            self._m2 += (value - old) * (value - self.mean + old - old_mean)
+            self._buffer[head] = value
+            self._replacements += 1
+            if self._replacements >= self.size:
+                self._resync()
+        self._head = (head + 1) % self.size
+
+    @property
+    def variance(self) -> float:
+        """Population variance (ddof=0) of the window"""
+        if self.count == 0:
+            return 0.0
+        variance = self._m2 / self.count
+        if variance <= self.VARIANCE_EPSILON * max(1.0, self.mean * self.mean):
+            return 0.0
+        return variance
+
+    @property
+    def std(self) -> float:
+        """Population standard deviation of the window"""
+        return math.sqrt(self.variance)
+
+    def zscore(self, value: float) -> float:
+        """Z-score of value against the current window"""
+        std = self.std
+        if std == 0:
+            return 0.0  # Avoid division by zero
+        return (value - self.mean) / std
+
+    def values(self) -> List[float]:
+        """Window contents, oldest first"""
+        if self.count < self.size:
+            return self._buffer[:self.count]
+        return self._buffer[self._head:] + self._buffer[:self._head]
+
+    def _resync(self) -> None:
+        """Recompute mean and M2 exactly from the buffer"""
+        self._replacements = 0
+        if self.count == 0:
+            self.mean = 0.0
+            self._m2 = 0.0
+            return
+        values = self._buffer[:self.count]
+        self.mean = math.fsum(values) / self.count
+        self._m2 = math.fsum((v - self.mean) ** 2 for v in values)
+
+
+class FrozenDict(dict):
+    """Read-only dict, so shared threshold objects serialize like any dict but cannot be changed"""
+
+    __slots__ = ()
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError("threshold objects are shared and read-only")
+
+    __setitem__ = __delitem__ = __ior__ = _read_only
+    clear = pop = popitem = setdefault = update = _read_only
+
+    def __reduce__(self):
+        return (FrozenDict, (dict(self),))
+
+
+class ThresholdTable:
+    """
+    Threshold rules compiled once into bounds and pre-built, shared status objects.
+
+    A reading classifies into one code (rain_level * 9 + soil_level * 3 +
+    tilt_level, each level 0 = normal, 1 = warning, 2 = danger) with at most
+    six comparisons and no allocation. The code indexes the threshold risk and
+    state as well as the complete `thresholdStatus` object, so one
+    classification serves both the score and the stored status.
+    """
+
+    __slots__ = ('config', 'warning', 'danger', 'bounds', 'statuses',
+                 'status_by_code', 'risk_by_code', 'level_by_code', 'risk_array', 'level_array')
+
+    def __init__(self, config: Dict[str, Dict[str, Any]]):
+        compiled = {}
+        for key in SENSORS:
+            rules = config.get(key, {})
+            compiled[key] = FrozenDict(
+                warning=float(rules.get('warning', math.inf)),
+                danger=float(rules.get('danger', math.inf)),
+                unit=str(rules.get('unit', ''))
+            )
+        self.config = FrozenDict(compiled)
+        self.warning = tuple(compiled[key]['warning'] for key in SENSORS)
+        self.danger = tuple(compiled[key]['danger'] for key in SENSORS)
+        self.bounds = {key: np.array([compiled[key]['warning'], compiled[key]['danger']]) for key in SENSORS}
+
+        normal = FrozenDict(status='normal', level='Low', message='Within normal range')
+        self.statuses = {
+            key: (
+                normal,
+                FrozenDict(status='warning', level='Moderate',
+                           message=f"Exceeds warning threshold ({rules['warning']}{rules['unit']})"),
+                FrozenDict(status='danger', level='High',
+                           message=f"Exceeds danger threshold ({rules['danger']}{rules['unit']})")
+            )
+            for key, rules in compiled.items()
+        }
+
+        status_by_code, risk_by_code, level_by_code = [], [], []
+        for code in range(27):
+            levels = (code // 9, code // 3 % 3, code % 3)
+            status_by_code.append(FrozenDict(
+                (key, self.statuses[key][level]) for key, level in zip(SENSORS, levels)
+            ))
+            danger_count = levels.count(2)
+            warning_count = levels.count(1)
+            if danger_count >= 1:  # ANY sensor in danger
+                risk, level = 100.0, 2
+            elif warning_count >= 2:  # Two or more sensors warning
+                risk, level = 80.0, 2
+            elif warning_count >= 1:  # One sensor warning
+                risk, level = 50.0, 1
+            else:
+                risk, level = 0.0, 0
+            risk_by_code.append(risk)
+            level_by_code.append(level)
+        self.status_by_code = tuple(status_by_code)
+        self.risk_by_code = tuple(risk_by_code)
+        self.level_by_code = tuple(level_by_code)
+        self.risk_array = np.array(risk_by_code)
+        self.level_array = np.array(level_by_code, dtype=np.int8)
+
+    def level(self, sensor_type: str, value: float) -> int:
+        """Threshold level of one sensor value (0 for unknown sensors)"""
+        try:
+            i = SENSORS.index(sensor_type)
+        except ValueError:
+            return 0
+        return 2 if value >= self.danger[i] else 1 if value >= self.warning[i] else 0
+
+    def classify(self, rain: float, soil: float, tilt: float) -> int:
+        """Combined threshold code of one reading"""
+        warning, danger = self.warning, self.danger
+        return (
+            (2 if rain >= danger[0] else 1 if rain >= warning[0] else 0) * 9
+            + (2 if soil >= danger[1] else 1 if soil >= warning[1] else 0) * 3
+            + (2 if tilt >= danger[2] else 1 if tilt >= warning[2] else 0)
+        )
+
+    def classify_batch(self, values: Dict[str, np.ndarray]) -> Tuple[Dict[str, np.ndarray], np.ndarray]:
+        """Per-sensor level arrays and combined codes for arrays of readings"""
+        levels = {
+            key: np.searchsorted(self.bounds[key], values[key], side='right').astype(np.int8)
+            for key in SENSORS
+        }
+        codes = levels['rain'] * 9 + levels['soil'] * 3 + levels['tilt']
+        return levels, codes.astype(np.intp)
+
+
+def merge_thresholds(base: Dict[str, Dict[str, Any]], override: Optional[Dict[str, Dict[str, Any]]]) -> Dict[str, Dict[str, Any]]:
+    """Per-sensor merge of partial threshold overrides onto a base config"""
+    merged = {key: dict(rules) for key, rules in base.items()}
+    for key, rules in (override or {}).items():
+        merged[key] = dict(merged.get(key, {}), **rules)
+    return merged
+
+
+_TABLE_CACHE: Dict[str, ThresholdTable] = {}
+_TABLE_CACHE_SIZE = 256
+
+
+def compile_thresholds(config: Dict[str, Dict[str, Any]]) -> ThresholdTable:
+    """ThresholdTable for a config; identical configs share one compiled table"""
+    key = json.dumps(config, sort_keys=True, default=str)
+    table = _TABLE_CACHE.get(key)
+    if table is None:
+        table = ThresholdTable(config)
+        if len(_TABLE_CACHE) >= _TABLE_CACHE_SIZE:
+            _TABLE_CACHE.pop(next(iter(_TABLE_CACHE)))
+        _TABLE_CACHE[key] = table
+    return table
+
+
+DEFAULT_THRESHOLD_TABLE = compile_thresholds(DEFAULT_THRESHOLDS)
+
+
+_BATCH_STATES = np.array(RISK_STATES + ('Initializing',))
+
+
+def hybrid_levels(z_rain: np.ndarray, z_soil: np.ndarray, z_tilt: np.ndarray, codes: np.ndarray,
+                  table: ThresholdTable, initializing: np.ndarray,
+                  z_boost: float = 3.0) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Vectorized hybrid combination (the rules of AnomalyDetector.score) for
+    arrays of unrounded z-scores and threshold codes.
+
+    Returns:
+        (risk scores rounded to 2dp, state indexes: 0 Low, 1 Moderate, 2 High, 3 Initializing)
+    """
+    # === METHOD 1: Statistical Z-Scores ===
+    abs_rain, abs_soil, abs_tilt = np.abs(z_rain), np.abs(z_soil), np.abs(z_tilt)
+    statistical_risk = ((abs_rain + abs_soil + abs_tilt) / 3.0 / 3.0) * 100.0
+    statistical_risk[(abs_tilt > z_boost) | (abs_soil > z_boost)] = 100.0
+    statistical_risk = np.clip(statistical_risk, 0, 100)
+    statistical_level = np.select([statistical_risk > 60, statistical_risk > 30], [2, 1], 0)
+
+    # === METHOD 2: Fixed Threshold Checking ===
+    threshold_level = table.level_array[codes]
+    threshold_risk = table.risk_array[codes]
+
+    # === HYBRID COMBINATION: Take the WORSE of both methods ===
+    final_risk = np.round(np.maximum(statistical_risk, threshold_risk), 2)
+    final_risk[initializing] = 0.0
+    final_level = np.maximum(statistical_level, threshold_level)
+    final_level[initializing] = 3
+    return final_risk, final_level
+
+
+def hybrid_risk(z_rain: np.ndarray, z_soil: np.ndarray, z_tilt: np.ndarray, codes: np.ndarray,
+                table: ThresholdTable, initializing: np.ndarray,
+                z_boost: float = 3.0) -> Tuple[np.ndarray, np.ndarray]:
+    """hybrid_levels with the states as strings: (risk scores, risk state strings)"""
+    final_risk, final_level = hybrid_levels(z_rain, z_soil, z_tilt, codes, table, initializing, z_boost)
+    return final_risk, _BATCH_STATES[final_level]
+
+
+class ScoreResult:
+    """
+    Everything scored for one reading, from a single pass over the windows.
+
+    Per-sensor values are plain attributes; the dict views (`z_scores`,
+    `threshold_status`, `rolling_mean`) are built only when asked for, and
+    `to_payload` serializes straight to an addAnomalyResult body.
+    """
+
+    __slots__ = ('risk_score', 'risk_state', 'z_rain', 'z_soil', 'z_tilt',
+                 'mean_rain', 'mean_soil', 'mean_tilt', 'code', 'table')
+
+    def __init__(self, risk_score: float, risk_state: str, z_rain: float, z_soil: float, z_tilt: float,
+                 mean_rain: float, mean_soil: float, mean_tilt: float, code: int, table: ThresholdTable):
+        self.risk_score = risk_score
+        self.risk_state = risk_state
+        self.z_rain = z_rain
+        self.z_soil = z_soil
+        self.z_tilt = z_tilt
+        self.mean_rain = mean_rain
+        self.mean_soil = mean_soil
+        self.mean_tilt = mean_tilt
+        self.code = code  # ThresholdTable combination code
+        self.table = table
+
+    @property
+    def z_scores(self) -> Dict[str, float]:
+        return {"rain": self.z_rain, "soil": self.z_soil, "tilt": self.z_tilt}
+
+    @property
+    def threshold_status(self) -> Dict[str, Dict[str, str]]:
+        """Per-sensor threshold status (shared, read-only)"""
+        return self.table.status_by_code[self.code]
+
+    @property
+    def threshold_levels(self) -> Tuple[int, int, int]:
+        """Rain/soil/tilt levels (0 = normal, 1 = warning, 2 = danger)"""
+        return self.code // 9, self.code // 3 % 3, self.code % 3
+
+    @property
+    def thresholds(self) -> Dict[str, Dict[str, Any]]:
+        return self.table.config
+
+    @property
+    def rolling_mean(self) -> Dict[str, float]:
+        return {"rain": self.mean_rain, "soil": self.mean_soil, "tilt": self.mean_tilt}
+
+    def to_payload(self, record: Dict[str, Any], rain: float, soil: float, tilt: float) -> Dict[str, Any]:
+        """addAnomalyResult body for the sensorData record this result scored"""
+        payload = {
+            "sensorDataId": record.get("_id"),
+            "timestamp": record.get("timestamp"),
+            "deviceId": record.get("deviceId"),
+            "location": record.get("location"),
+            "rainValue": float(rain),
+            "soilMoisture": float(soil),
+            "tiltValue": float(tilt),
+            "riskScore": self.risk_score,
+            "riskState": self.risk_state,
+            "zScoreRain": self.z_rain,
+            "zScoreSoil": self.z_soil,
+            "zScoreTilt": self.z_tilt,
+            # Fields for hybrid approach
+            "thresholdStatus": self.table.status_by_code[self.code],
+            "thresholds": self.table.config,
+            "rollingMean": {"rain": self.mean_rain, "soil": self.mean_soil, "tilt": self.mean_tilt}
+        }
+        # Optional fields must be omitted, not null
+        if payload["deviceId"] is None:
+            del payload["deviceId"]
+        if payload["location"] is None:
+            del payload["location"]
+        return payload
+
 
 class AnomalyDetector:
     """Hybrid anomaly detection for landslide monitoring (Z-score + Fixed Thresholds)"""
     
-    def __init__(self, window_size: int = 20):
+    def __init__(self, window_size: int = 20, thresholds: Optional[ThresholdTable] = None, z_boost: float = 3.0,
+                 windows: Optional[Dict[str, RollingWindow]] = None):
         self.window_size = window_size
-        # Store recent history for calculations
-        self.history = {
-            'rain': [],
-            'soil': [],
-            'tilt': []
+        # |z| of tilt or soil above which the statistical risk is forced to 100%
+        self.z_boost = z_boost
+        # Rolling window per sensor (O(1) mean/std per reading); `windows` supplies
+        # ones with other storage (e.g. ColumnarStore rows)
+        self.windows = windows or {
+            'rain': RollingWindow(window_size),
+            'soil': RollingWindow(window_size),
+            'tilt': RollingWindow(window_size)
         }
         
-        # Define fixed threshold values (engineering/geological limits)
-        self.thresholds = {
-            'tilt': {
-                'warning': 15.0,   # 15° = noticeable ground movement
-                'danger': 25.0,    # 25° = imminent failure risk
-                'unit': '°'
-            },
-            'soil': {
-                'warning': 70.0,   # 70% = soil saturation beginning
-                'danger': 85.0,    # 85% = pore pressure critical
-                'unit': '%'
-            },
-            'rain': {
-                'warning': 50.0,   # Moderate rainfall
-                'danger': 75.0,    # Heavy rainfall
-                'unit': ''
-            }
+        # Compiled threshold rules (shared between detectors with the same config)
+        self.threshold_table = thresholds or DEFAULT_THRESHOLD_TABLE
+        self.thresholds = self.threshold_table.config
+        # Threshold status of the last reading passed to score/update_and_score
+        self.last_threshold_status = self.threshold_table.status_by_code[0]
+
+    @property
+    def history(self) -> Dict[str, List[float]]:
+        """Recent readings per sensor, oldest first"""
+        return {key: window.values() for key, window in self.windows.items()}
+
+    @history.setter
+    def history(self, history: Dict[str, List[float]]) -> None:
+        for key, window in self.windows.items():
+            window.load(history.get(key, []))
+
+    def export_state(self, dtype: str = 'float32') -> Dict[str, Any]:
+        """
+        Compact, fixed-size rolling state: the window packed as a base64
+        little-endian (3, count) array of rain/soil/tilt, oldest first.
+        float32 halves the size at ~7 significant digits; float64 is exact.
+        """
+        values = np.array([self.windows[k].values() for k in ('rain', 'soil', 'tilt')],
+                          dtype=np.dtype(dtype).newbyteorder('<'))
+        return {
+            'windowSize': self.window_size,
+            'count': self.windows['rain'].count,
+            'dtype': np.dtype(dtype).name,
+            'values': base64.b64encode(values.tobytes()).decode('ascii')
         }
 
+    def load_state(self, state: Dict[str, Any]) -> None:
+        """Restore the window from export_state() output"""
+        dtype = np.dtype(state.get('dtype', 'float32'))
+        if dtype.name not in ('float32', 'float64'):
+            raise ValueError(f"Unsupported state dtype: {dtype.name}")
+        count = int(state.get('count', 0))
+        values = np.frombuffer(base64.b64decode(state.get('values', '')), dtype=dtype.newbyteorder('<'))
+        if values.size != 3 * count:
+            raise ValueError("State values do not match count")
+        values = values.reshape(3, count).astype(np.float64)
+        for row, key in enumerate(('rain', 'soil', 'tilt')):
+            self.windows[key].load(values[row].tolist())
+
     def check_threshold_status(self, sensor_type: str, value: float) -> Dict:
         """Check if value exceeds fixed thresholds"""
-        thresholds = self.thresholds.get(sensor_type, {})
-        warning = thresholds.get('warning', float('inf'))
-        danger = thresholds.get('danger', float('inf'))
-        unit = thresholds.get('unit', '')
-        
-        if value >= danger:
-            return {
-                'status': 'danger',
-                'level': 'High',
-                'message': f'Exceeds danger threshold ({danger}{unit})'
-            }
-        elif value >= warning:
-            return {
-                'status': 'warning',
-                'level': 'Moderate',
-                'message': f'Exceeds warning threshold ({warning}{unit})'
-            }
-        else:
-            return {
-                'status': 'normal',
-                'level': 'Low',
-                'message': 'Within normal range'
-            }
+        return self.threshold_status_for_level(sensor_type, self.threshold_table.level(sensor_type, value))
+
+    def threshold_status_for_level(self, sensor_type: str, level: int) -> Dict:
+        """Threshold status for a level (0 = normal, 1 = warning, 2 = danger); shared, read-only"""
+        statuses = self.threshold_table.statuses.get(sensor_type)
+        if statuses is None:
+            return self.threshold_table.statuses['rain'][0]  # Unknown sensors are always normal
+        return statuses[min(max(level, 0), 2)]
 
     def update_and_score(self, rain: float, soil: float, tilt: float) -> Tuple[float, str, Dict[str, float]]:
         """
@@ -66,103 +449,161 @@ class AnomalyDetector:
         Returns:
             Tuple of (risk_percentage, risk_state, z_scores_dict)
         """
-        # Add new data
-        self.history['rain'].append(rain)
-        self.history['soil'].append(soil)
-        self.history['tilt'].append(tilt)
+        result = self.score(rain, soil, tilt)
+        return result.risk_score, result.risk_state, result.z_scores
+
+    def score(self, rain: float, soil: float, tilt: float) -> ScoreResult:
+        """
+        Add a reading and score it: risk, z-scores, threshold levels and rolling
+        means in one pass, instead of update_and_score plus get_threshold_data,
+        get_thresholds and get_rolling_mean.
+        """
+        windows = self.windows
+        w_rain, w_soil, w_tilt = windows['rain'], windows['soil'], windows['tilt']
+
+        # Add new data (the oldest reading drops out once the window is full)
+        w_rain.push(rain)
+        w_soil.push(soil)
+        w_tilt.push(tilt)
 
-        # Keep only last N records
-        for key in self.history:
-            if len(self.history[key]) > self.window_size:
-                self.history[key].pop(0)
+        # One threshold classification, reused for the score, status and levels
+        table = self.threshold_table
+        code = table.classify(rain, soil, tilt)
+        self.last_threshold_status = table.status_by_code[code]
 
         # Need enough data to calculate std dev
-        if len(self.history['rain']) < 5:
-            return 0.0, "Initializing", {"rain": 0.0, "soil": 0.0, "tilt": 0.0}
+        if w_rain.count < 5:
+            return ScoreResult(0.0, "Initializing", 0.0, 0.0, 0.0,
+                               w_rain.mean, w_soil.mean, w_tilt.mean, code, table)
 
         # === METHOD 1: Statistical Z-Scores ===
-        z_rain = self._calculate_z(rain, self.history['rain'])
-        z_soil = self._calculate_z(soil, self.history['soil'])
-        z_tilt = self._calculate_z(tilt, self.history['tilt'])
+        z_rain = w_rain.zscore(rain)
+        z_soil = w_soil.zscore(soil)
+        z_tilt = w_tilt.zscore(tilt)
 
         # Calculate statistical risk (average of absolute Z-scores)
         avg_z = (abs(z_rain) + abs(z_soil) + abs(z_tilt)) / 3.0
         statistical_risk = (avg_z / 3.0) * 100.0  # Map Z=3 to 100%
         
-        # Boost statistical risk if ANY sensor exceeds 3 sigma
-        if abs(z_tilt) > 3 or abs(z_soil) > 3:
+        # Boost statistical risk if tilt or soil exceeds z_boost sigma (3 by default)
+        if abs(z_tilt) > self.z_boost or abs(z_soil) > self.z_boost:
             statistical_risk = 100.0
             
         statistical_risk = min(max(statistical_risk, 0), 100)
         
-        # Determine statistical risk state
+        # Determine statistical risk level (0 = Low, 1 = Moderate, 2 = High)
         if statistical_risk > 60:
-            statistical_state = "High"
+            statistical_level = 2
         elif statistical_risk > 30:
-            statistical_state = "Moderate"
+            statistical_level = 1
         else:
-            statistical_state = "Low"
+            statistical_level = 0
 
         # === METHOD 2: Fixed Threshold Checking ===
-        threshold_status = {
-            'rain': self.check_threshold_status('rain', rain),
-            'soil': self.check_threshold_status('soil', soil),
-            'tilt': self.check_threshold_status('tilt', tilt)
-        }
-        
-        # Count danger and warning flags
-        danger_count = sum(1 for s in threshold_status.values() if s['status'] == 'danger')
-        warning_count = sum(1 for s in threshold_status.values() if s['status'] == 'warning')
-        
-        # Determine threshold-based risk
-        if danger_count >= 1:  # ANY sensor in danger
-            threshold_state = "High"
-            threshold_risk = 100.0
-        elif warning_count >= 2:  # Two or more sensors warning
-            threshold_state = "High"
-            threshold_risk = 80.0
-        elif warning_count >= 1:  # One sensor warning
-            threshold_state = "Moderate"
-            threshold_risk = 50.0
-        else:
-            threshold_state = "Low"
-            threshold_risk = 0.0
+        # Any danger -> High (100), two or more warnings -> High (80), one warning -> Moderate (50)
+        threshold_risk = table.risk_by_code[code]
+        threshold_level = table.level_by_code[code]
 
         # === HYBRID COMBINATION: Take the WORSE of both methods ===
         # For life-safety systems, we want to be conservative
         final_risk = max(statistical_risk, threshold_risk)
-        
-        # Final state is the worse of the two
-        risk_states_priority = {"Low": 0, "Moderate": 1, "High": 2}
-        final_state_priority = max(
-            risk_states_priority[statistical_state],
-            risk_states_priority[threshold_state]
-        )
-        final_state = [k for k, v in risk_states_priority.items() if v == final_state_priority][0]
+        final_state = RISK_STATES[max(statistical_level, threshold_level)]
+
+        return ScoreResult(round(final_risk, 2), final_state,
+                           round(z_rain, 4), round(z_soil, 4), round(z_tilt, 4),
+                           w_rain.mean, w_soil.mean, w_tilt.mean, code, table)
+
+    def score_batch(self, rain, soil=None, tilt=None) -> Dict[str, Any]:
+        """
+        Vectorized equivalent of calling update_and_score once per reading, in order.
+
+        Accepts three equal-length arrays, or a single structured array with
+        'rain', 'soil' and 'tilt' fields. The detector's windows are advanced
+        past the batch, so sequential and batch calls can be mixed freely.
 
-        z_scores = {
-            "rain": round(z_rain, 4),
-            "soil": round(z_soil, 4),
-            "tilt": round(z_tilt, 4)
+        States and threshold levels match the sequential path exactly; scores
+        agree to their rounded precision (z-scores to 4dp, risk to 2dp).
+
+        Returns:
+            Dict with 'riskScore' (float array), 'riskState' (str array),
+            'thresholdCodes' (ThresholdTable codes, index `status_by_code`), and
+            per-sensor dicts 'zScores', 'thresholdLevels' (0 = normal,
+            1 = warning, 2 = danger) and 'rollingMean'
+        """
+        if soil is None and tilt is None:
+            readings = np.asarray(rain)
+            rain, soil, tilt = readings['rain'], readings['soil'], readings['tilt']
+        values = {
+            'rain': np.asarray(rain, dtype=np.float64).ravel(),
+            'soil': np.asarray(soil, dtype=np.float64).ravel(),
+            'tilt': np.asarray(tilt, dtype=np.float64).ravel()
         }
+        n = len(values['rain'])
+        if len(values['soil']) != n or len(values['tilt']) != n:
+            raise ValueError("rain, soil and tilt must have the same length")
 
-        return round(final_risk, 2), final_state, z_scores
+        table = self.threshold_table
+        levels, codes = table.classify_batch(values)
+        z_scores, rolling_mean, initializing = self.batch_zscores(values)
 
-    def _calculate_z(self, current: float, history: List[float]) -> float:
-        """Calculate Z-score for a single sensor"""
-        mean = np.mean(history)
-        std = np.std(history)
-        if std == 0: 
-            return 0.0  # Avoid division by zero
-        return (current - mean) / std
+        final_risk, final_state = hybrid_risk(z_scores['rain'], z_scores['soil'], z_scores['tilt'],
+                                              codes, table, initializing, self.z_boost)
 
-    def get_threshold_data(self, rain: float, soil: float, tilt: float) -> Dict:
-        """Get threshold status for all sensors"""
         return {
-            'rain': self.check_threshold_status('rain', rain),
-            'soil': self.check_threshold_status('soil', soil),
-            'tilt': self.check_threshold_status('tilt', tilt)
+            'riskScore': final_risk,
+            'riskState': final_state,
+            'zScores': {key: np.round(z, 4) for key, z in z_scores.items()},
+            'thresholdLevels': levels,
+            'thresholdCodes': codes,
+            'rollingMean': rolling_mean
         }
+
+    def batch_zscores(self, values: Dict[str, np.ndarray]) -> Tuple[Dict[str, np.ndarray], Dict[str, np.ndarray], np.ndarray]:
+        """
+        Unrounded z-scores and rolling means of each reading against the window
+        ending at it, advancing the windows past the batch. Temporary memory is
+        O(len(values) * window_size).
+
+        Returns:
+            (z-scores per sensor, rolling means per sensor, initializing mask)
+        """
+        n = len(values['rain'])
+        w = self.window_size
+        counts = np.minimum(self.windows['rain'].count + np.arange(1, n + 1), w)
+        initializing = counts < 5
+
+        z_scores: Dict[str, np.ndarray] = {}
+        rolling_mean: Dict[str, np.ndarray] = {}
+        for key in SENSORS:
+            current = values[key]
+            window = self.windows[key]
+            prior = np.asarray(window.values(), dtype=np.float64)
+
+            # Row i is the window ending at reading i (NaN-padded while filling)
+            padded = np.concatenate((np.full(w - 1, np.nan), prior, current))
+            rows = sliding_window_view(padded, w)[len(prior):]
+            # Only rows of a still-filling window hold padding; the rest skip nansum's copies
+            filling = int(np.searchsorted(counts, w))
+            mean = np.empty(n)
+            variance = np.empty(n)
+            mean[:filling] = np.nansum(rows[:filling], axis=1) / counts[:filling]
+            variance[:filling] = np.nansum((rows[:filling] - mean[:filling, None]) ** 2, axis=1) / counts[:filling]
+            mean[filling:] = rows[filling:].sum(axis=1) / w
+            variance[filling:] = ((rows[filling:] - mean[filling:, None]) ** 2).sum(axis=1) / w
+            variance[variance <= RollingWindow.VARIANCE_EPSILON * np.maximum(1.0, mean * mean)] = 0.0
+            std = np.sqrt(variance)
+            z = np.divide(current - mean, std, out=np.zeros(n), where=std != 0)
+            z[initializing] = 0.0
+
+            z_scores[key] = z
+            rolling_mean[key] = mean
+
+            window.load(np.concatenate((prior, current))[-w:].tolist())
+        return z_scores, rolling_mean, initializing
+
+    def get_threshold_data(self, rain: float, soil: float, tilt: float) -> Dict:
+        """Get threshold status for all sensors (shared, read-only; see last_threshold_status)"""
+        return self.threshold_table.status_by_code[self.threshold_table.classify(rain, soil, tilt)]
     
     def get_thresholds(self) -> Dict:
         """Get configured threshold values"""
@@ -170,8 +611,4 @@ class AnomalyDetector:
     
     def get_rolling_mean(self) -> Dict:
         """Get current rolling mean for all sensors"""
-        return {
-            'rain': float(np.mean(self.history['rain'])) if self.history['rain'] else 0.0,
-            'soil': float(np.mean(self.history['soil'])) if self.history['soil'] else 0.0,
-            'tilt': float(np.mean(self.history['tilt'])) if self.history['tilt'] else 0.0
-        }
+        return {key: window.mean if window.count else 0.0 for key, window in self.windows.items()}
@@ -1,78 +1,302 @@
-from http.server import BaseHTTPRequestHandler
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from collections import OrderedDict
+from contextlib import contextmanager
+import argparse
 import json
 import os
+import threading
 try:
-    from .anomaly_detector import AnomalyDetector
+    from .anomaly_detector import AnomalyDetector, DEFAULT_THRESHOLDS, compile_thresholds, merge_thresholds
+    from .profiling import PROFILER
 except ImportError:
-    from anomaly_detector import AnomalyDetector
+    from anomaly_detector import AnomalyDetector, DEFAULT_THRESHOLDS, compile_thresholds, merge_thresholds
+    from profiling import PROFILER
+
+# Largest window a caller may ask for through `state.windowSize`
+MAX_WINDOW_SIZE = 1000
+# Most readings accepted by one /calculate-risk/batch request
+MAX_BATCH_READINGS = int(os.getenv("MAX_BATCH_READINGS", "10000"))
+
+# Opt-in stage profiling (PROFILE=1 / SIGUSR1); serverless instances can only write to /tmp
+PROFILER.configure_from_env(default_dir="/tmp/profiles")
+
+
+def threshold_table(overrides):
+    """Compiled table for a request's `thresholds` overrides (cached), or None for the defaults"""
+    return compile_thresholds(merge_thresholds(DEFAULT_THRESHOLDS, overrides)) if overrides else None
+
+
+@contextmanager
+def thresholds_applied(detector, table):
+    """Score with a request's threshold `table` for this call only; the warm detector keeps its own rules"""
+    if not table:
+        yield
+        return
+    saved = detector.threshold_table, detector.thresholds
+    detector.threshold_table, detector.thresholds = table, table.config
+    try:
+        yield
+    finally:
+        detector.threshold_table, detector.thresholds = saved
+
+
+class DeviceDetectors:
+    """
+    Warm per-device detectors for the long-running server (LRU-bounded).
+
+    Each device has its own lock, so readings for one device are scored in
+    order while different devices are scored concurrently.
+    """
+
+    def __init__(self, window_size=20, max_devices=10000):
+        self.window_size = window_size
+        self.max_devices = max_devices
+        self._detectors = OrderedDict()  # deviceId -> (detector, lock)
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, device_id):
+        with self._lock:
+            entry = self._detectors.get(device_id)
+            if entry is None:
+                entry = self._detectors[device_id] = (AnomalyDetector(window_size=self.window_size),
+                                                      threading.Lock())
+                while len(self._detectors) > self.max_devices:
+                    self._detectors.popitem(last=False)
+                    self.evictions += 1
+            else:
+                self._detectors.move_to_end(device_id)
+            return entry
+
+    def stats(self):
+        return {"devices": len(self._detectors), "evictions": self.evictions}
+
 
 class handler(BaseHTTPRequestHandler):
-    """Vercel serverless function to calculate risk score"""
-    
+    """
+    Vercel serverless function to calculate risk score.
+
+    Rolling history can be sent either as `history` (full rain/soil/tilt
+    arrays) or as `state` (compact packed window from a previous response).
+    The response always carries the updated `state`; `history` is returned
+    too unless the caller sent `state`. An optional `thresholds` object
+    overrides the default rules, e.g. {"tilt": {"warning": 10, "danger": 20}}.
+
+    POST .../calculate-risk/batch scores `readings` (a list of single-reading
+    bodies with a `deviceId`) in one request, one vectorized pass per device,
+    seeded from optional per-device `states` and returning the updated ones.
+
+    Run as a script, this module is a long-lived threaded keep-alive server
+    (see serve()) that keeps each device's detector warm, so callers that send
+    a `deviceId` need not send `history` or `state` at all.
+    """
+
+    # Set by serve(): warm detectors per deviceId (None in serverless mode)
+    detectors = None
+
     def do_POST(self):
+        with PROFILER.stage("request"):
+            self._handle_post()
+
+    def _handle_post(self):
         try:
             # Read request body
-            content_length = int(self.headers['Content-Length'])
-            post_data = self.rfile.read(content_length)
-            data = json.loads(post_data.decode('utf-8'))
-            
-            # Extract sensor values
-            rain = float(data.get('rainValue', 0.0))
-            soil = float(data.get('soilMoisture', 0.0))
-            tilt = float(data.get('tiltValue', 0.0))
-            history = data.get('history', {})
-            
-            # Initialize detector with history if provided
-            detector = AnomalyDetector(window_size=20)
-            if history:
-                detector.history = history
-            
-            # Calculate risk
-            risk_score, risk_state, z_scores = detector.update_and_score(rain, soil, tilt)
-            
-            # Get threshold data and rolling means
-            threshold_status = detector.get_threshold_data(rain, soil, tilt)
-            thresholds = detector.get_thresholds()
-            rolling_mean = detector.get_rolling_mean()
-            
-            # Prepare response
-            response = {
-                "success": True,
-                "data": {
-                    "riskScore": risk_score,
-                    "riskState": risk_state,
-                    "zScores": z_scores,
-                    "history": detector.history,  # Return updated history
-                    # New fields for hybrid approach
-                    "thresholdStatus": threshold_status,
-                    "thresholds": thresholds,
-                    "rollingMean": rolling_mean
-                }
-            }
-            
-            # Send response
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            self.wfile.write(json.dumps(response).encode())
-            
+            with PROFILER.stage("network"):
+                content_length = int(self.headers['Content-Length'])
+                post_data = self.rfile.read(content_length)
+            with PROFILER.stage("json_decode"):
+                data = json.loads(post_data.decode('utf-8'))
+
+            if self.path.rstrip('/').split('?')[0].endswith('/batch'):
+                response = self._score_batch(data)
+            else:
+                response = self._score_one(data)
+
+            with PROFILER.stage("serialize"):
+                payload = json.dumps(response).encode()
+            self._send_json(200, payload)
+
         except Exception as e:
             # Error response
             error_response = {
                 "success": False,
                 "error": str(e)
             }
-            self.send_response(500)
+            self._send_json(500, json.dumps(error_response).encode())
+
+    def _score_one(self, data):
+        """One reading, from sent history/state or (server mode) the device's warm detector"""
+        # Extract sensor values
+        rain = float(data.get('rainValue', 0.0))
+        soil = float(data.get('soilMoisture', 0.0))
+        tilt = float(data.get('tiltValue', 0.0))
+        history = data.get('history', {})
+        state = data.get('state')
+        table = threshold_table(data.get('thresholds'))
+
+        device_id = data.get('deviceId')
+        if self.detectors is not None and device_id is not None and not state and not history:
+            detector, lock = self.detectors.get(device_id)
+            with lock, thresholds_applied(detector, table):
+                with PROFILER.stage("score"):
+                    result = detector.score(rain, soil, tilt)
+            return {"success": True, "data": self._result_data(result)}
+
+        # Initialize detector with compact state or history if provided
+        with PROFILER.stage("history_rebuild"):
+            detector = self._detector_for(state, table)
+            if not state and history:
+                detector.history = history
+
+        # Calculate risk, threshold status and rolling means in one pass
+        with PROFILER.stage("score"):
+            result = detector.score(rain, soil, tilt)
+
+        # Prepare response
+        response_data = self._result_data(result)
+        response_data["state"] = detector.export_state(state.get('dtype', 'float32') if state else 'float32')
+        if not state:
+            response_data["history"] = detector.history  # Return updated history
+        return {"success": True, "data": response_data}
+
+    def _score_batch(self, data):
+        """Many readings from many devices; results come back in input order"""
+        readings = data.get('readings') or []
+        if len(readings) > MAX_BATCH_READINGS:
+            raise ValueError(f"At most {MAX_BATCH_READINGS} readings per batch")
+        states = data.get('states') or {}
+        table = threshold_table(data.get('thresholds'))
+
+        by_device = OrderedDict()
+        for i, reading in enumerate(readings):
+            by_device.setdefault(reading.get('deviceId'), []).append(i)
+
+        results = [None] * len(readings)
+        new_states = {}
+        for device_id, indexes in by_device.items():
+            device_readings = [readings[i] for i in indexes]
+            rain = [float(r.get('rainValue', 0.0)) for r in device_readings]
+            soil = [float(r.get('soilMoisture', 0.0)) for r in device_readings]
+            tilt = [float(r.get('tiltValue', 0.0)) for r in device_readings]
+            state = states.get(device_id) if device_id is not None else None
+
+            if self.detectors is not None and device_id is not None and not state:
+                detector, lock = self.detectors.get(device_id)
+                with lock, thresholds_applied(detector, table):
+                    with PROFILER.stage("score_batch"):
+                        scores = detector.score_batch(rain, soil, tilt)
+            else:
+                with PROFILER.stage("history_rebuild"):
+                    detector = self._detector_for(state, table)
+                with PROFILER.stage("score_batch"):
+                    scores = detector.score_batch(rain, soil, tilt)
+                if device_id is not None:
+                    new_states[device_id] = detector.export_state(state.get('dtype', 'float32') if state else 'float32')
+
+            with PROFILER.stage("build_results"):
+                status_by_code = (table or detector.threshold_table).status_by_code
+                risk = scores['riskScore'].tolist()
+                risk_state = scores['riskState'].tolist()
+                z = {key: values.tolist() for key, values in scores['zScores'].items()}
+                mean = {key: values.tolist() for key, values in scores['rollingMean'].items()}
+                codes = scores['thresholdCodes'].tolist()
+                for j, i in enumerate(indexes):
+                    results[i] = {
+                        "deviceId": device_id,
+                        "riskScore": risk[j],
+                        "riskState": risk_state[j],
+                        "zScores": {"rain": z['rain'][j], "soil": z['soil'][j], "tilt": z['tilt'][j]},
+                        "thresholdStatus": status_by_code[codes[j]],
+                        "rollingMean": {"rain": mean['rain'][j], "soil": mean['soil'][j], "tilt": mean['tilt'][j]}
+                    }
+
+        response = {"success": True, "data": {"results": results}}
+        if new_states:
+            response["data"]["states"] = new_states
+        return response
+
+    @staticmethod
+    def _detector_for(state, table):
+        """Fresh detector, restored from a compact state if one was sent"""
+        window_size = 20
+        if state:
+            window_size = min(max(int(state.get('windowSize', 20)), 1), MAX_WINDOW_SIZE)
+        detector = AnomalyDetector(window_size=window_size, thresholds=table)
+        if state:
+            detector.load_state(state)
+        return detector
+
+    @staticmethod
+    def _result_data(result):
+        return {
+            "riskScore": result.risk_score,
+            "riskState": result.risk_state,
+            "zScores": result.z_scores,
+            # New fields for hybrid approach
+            "thresholdStatus": result.threshold_status,
+            "thresholds": result.thresholds,
+            "rollingMean": result.rolling_mean
+        }
+
+    def _send_json(self, status, payload):
+        """JSON response with CORS and an explicit length (required for keep-alive)"""
+        with PROFILER.stage("network"):
+            self.send_response(status)
             self.send_header('Content-type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
             self.send_header('Access-Control-Allow-Origin', '*')
             self.end_headers()
-            self.wfile.write(json.dumps(error_response).encode())
-    
+            self.wfile.write(payload)
+
     def do_OPTIONS(self):
         # Handle CORS preflight
         self.send_response(200)
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Access-Control-Allow-Methods', 'POST, OPTIONS')
         self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+        self.send_header('Content-Length', '0')
         self.end_headers()
+
+
+class _ServerHandler(handler):
+    """handler with HTTP/1.1 keep-alive and quiet logs, for the long-running server"""
+
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(host="127.0.0.1", port=8000, window_size=20, max_devices=10000):
+    """
+    Start the threaded keep-alive server in a background thread with warm
+    per-device detectors; returns (server, url, detectors)
+    """
+    detectors = DeviceDetectors(window_size=window_size, max_devices=max_devices)
+    server_handler = type("handler", (_ServerHandler,), {"detectors": detectors})
+    server = ThreadingHTTPServer((host, port), server_handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="calculate-risk", daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/api/calculate-risk", detectors
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Long-running calculate-risk server with warm per-device state")
+    parser.add_argument("--host", default="127.0.0.1", help="bind address; 0.0.0.0 serves other hosts too")
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument("--window-size", type=int, default=20, help="readings per warm device window")
+    parser.add_argument("--max-devices", type=int, default=10000, help="warm devices kept before LRU eviction")
+    args = parser.parse_args()
+
+    server, url, detectors = serve(args.host, args.port, args.window_size, args.max_devices)
+    print(f"calculate-risk server on {url} (batch: {url}/batch)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        print(f"\nShutting down... {detectors.stats()}")
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
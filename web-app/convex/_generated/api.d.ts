@@ -11,7 +11,9 @@
 import type * as anomalyDetection from "../anomalyDetection.js";
 import type * as anomalyResults from "../anomalyResults.js";
 import type * as http from "../http.js";
+import type * as leases from "../leases.js";
 import type * as reports from "../reports.js";
+import type * as rollups from "../rollups.js";
 import type * as sensorData from "../sensorData.js";
 
 import type {
@@ -24,7 +26,9 @@ declare const fullApi: ApiFromModules<{
   anomalyDetection: typeof anomalyDetection;
   anomalyResults: typeof anomalyResults;
   http: typeof http;
+  leases: typeof leases;
   reports: typeof reports;
+  rollups: typeof rollups;
   sensorData: typeof sensorData;
 }>;
 
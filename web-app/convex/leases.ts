@@ -0,0 +1,147 @@
+import { v } from "convex/values";
+import { mutation, query, MutationCtx, QueryCtx } from "./_generated/server";
+
+// Unprocessed sensorData is split into this many partitions by deviceId, so all of
+// a device's readings go to one backend poller and are scored in order.
+// backend/leases.py mirrors LEASE_PARTITIONS and partitionFor().
+export const LEASE_PARTITIONS = 16;
+
+// FNV-1a (32-bit) hash of the UTF-8 deviceId, modulo LEASE_PARTITIONS
+export function partitionFor(deviceId: string | undefined): number {
+  let hash = 0x811c9dc5;
+  for (const byte of new TextEncoder().encode(deviceId ?? "")) {
+    hash = Math.imul(hash ^ byte, 0x01000193) >>> 0;
+  }
+  return hash % LEASE_PARTITIONS;
+}
+
+// Whether `owner` holds an unexpired lease on `partition`
+export async function holdsLease(ctx: QueryCtx, partition: number, owner: string): Promise<boolean> {
+  const lease = await ctx.db
+    .query("deviceLeases")
+    .withIndex("by_partition", (q) => q.eq("partition", partition))
+    .first();
+  return lease !== null && lease.owner === owner && lease.expiresAt > Date.now();
+}
+
+// Record that `owner` is alive until `expiresAt` (so it counts toward the fair share even with no partitions yet)
+async function heartbeat(ctx: MutationCtx, owner: string, expiresAt: number) {
+  const existing = await ctx.db
+    .query("leaseOwners")
+    .withIndex("by_owner", (q) => q.eq("owner", owner))
+    .first();
+  if (existing) {
+    await ctx.db.patch(existing._id, { expiresAt });
+  } else {
+    await ctx.db.insert("leaseOwners", { owner, expiresAt });
+  }
+}
+
+// Claim (and renew) the caller's fair share of partitions.
+// Live pollers split the partitions evenly: the caller renews what it holds, takes
+// free or expired partitions up to its share, and gives back any above it, so a
+// new poller picks up partitions as the others shed them on their next claim.
+export const claimLeases = mutation({
+  args: {
+    owner: v.string(),
+    ttlMs: v.number(),
+  },
+  handler: async (ctx, args) => {
+    const now = Date.now();
+    const expiresAt = now + args.ttlMs;
+    await heartbeat(ctx, args.owner, expiresAt);
+    const leases = await ctx.db.query("deviceLeases").collect(); // At most LEASE_PARTITIONS rows
+
+    const owners = new Set<string>([args.owner]);
+    for (const poller of await ctx.db.query("leaseOwners").collect()) {
+      if (poller.expiresAt > now) {
+        owners.add(poller.owner);
+      } else {
+        await ctx.db.delete(poller._id); // Gone without releasing
+      }
+    }
+    const share = Math.ceil(LEASE_PARTITIONS / owners.size);
+
+    const byPartition = new Map(leases.map((l) => [l.partition, l]));
+    const held: number[] = [];
+    for (const lease of leases.filter((l) => l.owner === args.owner).sort((a, b) => a.partition - b.partition)) {
+      if (held.length < share) {
+        await ctx.db.patch(lease._id, { expiresAt });
+        held.push(lease.partition);
+      } else {
+        await ctx.db.delete(lease._id);
+      }
+    }
+    for (let partition = 0; partition < LEASE_PARTITIONS && held.length < share; partition++) {
+      const lease = byPartition.get(partition);
+      if (!lease) {
+        await ctx.db.insert("deviceLeases", { partition, owner: args.owner, expiresAt });
+      } else if (lease.owner !== args.owner && lease.expiresAt <= now) {
+        await ctx.db.patch(lease._id, { owner: args.owner, expiresAt });
+      } else {
+        continue;
+      }
+      held.push(partition);
+    }
+
+    held.sort((a, b) => a - b);
+    return { owner: args.owner, partitions: held, numPartitions: LEASE_PARTITIONS, expiresAt };
+  },
+});
+
+// Extend the caller's leases without claiming or releasing any (while a pass is running)
+export const renewLeases = mutation({
+  args: {
+    owner: v.string(),
+    ttlMs: v.number(),
+  },
+  handler: async (ctx, args) => {
+    const expiresAt = Date.now() + args.ttlMs;
+    await heartbeat(ctx, args.owner, expiresAt);
+    const leases = await ctx.db
+      .query("deviceLeases")
+      .withIndex("by_owner", (q) => q.eq("owner", args.owner))
+      .collect();
+
+    const held: number[] = [];
+    for (const lease of leases) {
+      await ctx.db.patch(lease._id, { expiresAt });
+      held.push(lease.partition);
+    }
+
+    held.sort((a, b) => a - b);
+    return { owner: args.owner, partitions: held, numPartitions: LEASE_PARTITIONS, expiresAt };
+  },
+});
+
+// Give up all of the caller's leases (on shutdown), so others need not wait for expiry
+export const releaseLeases = mutation({
+  args: {
+    owner: v.string(),
+  },
+  handler: async (ctx, args) => {
+    const leases = await ctx.db
+      .query("deviceLeases")
+      .withIndex("by_owner", (q) => q.eq("owner", args.owner))
+      .collect();
+    for (const lease of leases) {
+      await ctx.db.delete(lease._id);
+    }
+    const poller = await ctx.db
+      .query("leaseOwners")
+      .withIndex("by_owner", (q) => q.eq("owner", args.owner))
+      .first();
+    if (poller) {
+      await ctx.db.delete(poller._id);
+    }
+    return leases.length;
+  },
+});
+
+// Current leases (for monitoring)
+export const getLeases = query({
+  args: {},
+  handler: async (ctx) => {
+    return await ctx.db.query("deviceLeases").withIndex("by_partition").collect();
+  },
+});
@@ -0,0 +1,142 @@
+import { v } from "convex/values";
+import { mutation, query } from "./_generated/server";
+import { Doc } from "./_generated/dataModel";
+
+// Time-bucket rollups of anomalyResults, so history charts read a few hundred
+// pre-aggregated rows instead of every raw result. The Python backend
+// (backend/rollups.py) aggregates results as it saves them and sends partial
+// rows here every few seconds; mergeRollups folds them into the stored ones.
+
+const stat = v.object({ min: v.float64(), max: v.float64(), sum: v.float64(), last: v.float64() });
+const granularity = v.union(v.literal("minute"), v.literal("hour"), v.literal("day"));
+
+const rollupFields = {
+  deviceId: v.optional(v.string()),
+  granularity,
+  bucketStart: v.number(),
+  count: v.number(),
+  lastAt: v.optional(v.number()),
+  lastRiskState: v.optional(v.string()),
+  rain: v.optional(stat),
+  soil: v.optional(stat),
+  tilt: v.optional(stat),
+  risk: v.optional(stat),
+  stateSeconds: v.object({
+    Low: v.float64(),
+    Moderate: v.float64(),
+    High: v.float64(),
+    Initializing: v.float64(),
+  }),
+};
+
+const METRICS = ["rain", "soil", "tilt", "risk"] as const;
+
+type Stat = { min: number; max: number; sum: number; last: number };
+type RollupFields = Omit<Doc<"resultRollups">, "_id" | "_creationTime">;
+
+// Fold a partial row into the stored row of the same bucket (mirrors merge_rollup in backend/rollups.py)
+function mergeRollup(into: RollupFields, row: RollupFields): RollupFields {
+  const merged: RollupFields = {
+    ...into,
+    count: into.count + row.count,
+    stateSeconds: {
+      Low: into.stateSeconds.Low + row.stateSeconds.Low,
+      Moderate: into.stateSeconds.Moderate + row.stateSeconds.Moderate,
+      High: into.stateSeconds.High + row.stateSeconds.High,
+      Initializing: into.stateSeconds.Initializing + row.stateSeconds.Initializing,
+    },
+  };
+  if (row.count === 0 || row.lastAt === undefined) {
+    return merged;
+  }
+
+  const newer = into.lastAt === undefined || row.lastAt >= into.lastAt;
+  for (const metric of METRICS) {
+    const a: Stat | undefined = into[metric];
+    const b = row[metric] as Stat;
+    merged[metric] = a === undefined ? b : {
+      min: Math.min(a.min, b.min),
+      max: Math.max(a.max, b.max),
+      sum: a.sum + b.sum,
+      last: newer ? b.last : a.last,
+    };
+  }
+  if (newer) {
+    merged.lastAt = row.lastAt;
+    merged.lastRiskState = row.lastRiskState;
+  }
+  return merged;
+}
+
+// Merge partial rollup rows from the backend into the stored buckets (upsert per device/granularity/bucket)
+export const mergeRollups = mutation({
+  args: {
+    rollups: v.array(v.object(rollupFields)),
+  },
+  handler: async (ctx, args) => {
+    for (const row of args.rollups) {
+      const existing = await ctx.db
+        .query("resultRollups")
+        .withIndex("by_device_granularity_bucket", (q) =>
+          q.eq("deviceId", row.deviceId).eq("granularity", row.granularity).eq("bucketStart", row.bucketStart)
+        )
+        .first();
+      if (existing) {
+        const { _id, _creationTime, ...stored } = existing;
+        await ctx.db.patch(_id, mergeRollup(stored, row));
+      } else {
+        await ctx.db.insert("resultRollups", row);
+      }
+    }
+    return args.rollups.length;
+  },
+});
+
+// Rollup rows for charts, oldest first, with a `mean` added to each metric.
+// `from`/`to` (epoch ms, to exclusive) select buckets by start time; when there are
+// more than `limit`, the newest are returned. Without deviceId, rows of every device are returned.
+export const getRollups = query({
+  args: {
+    granularity,
+    deviceId: v.optional(v.string()),
+    from: v.optional(v.number()),
+    to: v.optional(v.number()),
+    limit: v.optional(v.number()),
+  },
+  handler: async (ctx, args) => {
+    const limit = args.limit ?? 500;
+    const from = args.from ?? 0;
+    const to = args.to ?? Number.MAX_SAFE_INTEGER;
+
+    let rows;
+    if (args.deviceId) {
+      rows = await ctx.db
+        .query("resultRollups")
+        .withIndex("by_device_granularity_bucket", (q) =>
+          q.eq("deviceId", args.deviceId).eq("granularity", args.granularity)
+            .gte("bucketStart", from).lt("bucketStart", to)
+        )
+        .order("desc")
+        .take(limit);
+    } else {
+      rows = await ctx.db
+        .query("resultRollups")
+        .withIndex("by_granularity_bucket", (q) =>
+          q.eq("granularity", args.granularity).gte("bucketStart", from).lt("bucketStart", to)
+        )
+        .order("desc")
+        .take(limit);
+    }
+
+    return rows.reverse().map((row) => {
+      const withMeans: Record<string, unknown> = { ...row };
+      for (const metric of METRICS) {
+        const s = row[metric];
+        if (s !== undefined) {
+          withMeans[metric] = { ...s, mean: s.sum / row.count };
+        }
+      }
+      return withMeans;
+    });
+  },
+});
@@ -11,10 +11,27 @@ export default defineSchema({
     soilMoisture: v.float64(),
     tiltValue: v.float64(),
     processed: v.boolean(), // Track if Python has processed this
+    partition: v.optional(v.number()), // Lease partition of deviceId (see leases.ts); unset on older rows
   }).index("by_timestamp", ["timestamp"])
     .index("by_processed", ["processed"])
+    .index("by_processed_timestamp", ["processed", "timestamp"])
+    .index("by_processed_partition_timestamp", ["processed", "partition", "timestamp"])
     .index("by_device", ["deviceId"]),
 
+  // Which backend poller currently owns each device partition (see leases.ts)
+  deviceLeases: defineTable({
+    partition: v.number(),
+    owner: v.string(),
+    expiresAt: v.number(), // Epoch milliseconds
+  }).index("by_partition", ["partition"])
+    .index("by_owner", ["owner"]),
+
+  // Live backend pollers, including those still waiting for a partition; they share partitions evenly
+  leaseOwners: defineTable({
+    owner: v.string(),
+    expiresAt: v.number(), // Epoch milliseconds
+  }).index("by_owner", ["owner"]),
+
 
   // Processed anomaly detection results
   anomalyResults: defineTable({
@@ -72,7 +89,31 @@ export default defineSchema({
     }))
   }).index("by_timestamp", ["timestamp"])
     .index("by_risk_state", ["riskState"])
-    .index("by_device", ["deviceId"]),
+    .index("by_device", ["deviceId"])
+    .index("by_sensor_data", ["sensorDataId"]),
+
+  // Per-device minute/hour/day aggregates of anomalyResults, maintained by the backend (see rollups.ts)
+  resultRollups: defineTable({
+    deviceId: v.optional(v.string()),
+    granularity: v.union(v.literal("minute"), v.literal("hour"), v.literal("day")),
+    bucketStart: v.number(), // Epoch milliseconds (UTC), a multiple of the bucket width
+    count: v.number(), // Readings in the bucket; 0 if it only holds time carried over from an earlier reading
+    // Absent while count is 0
+    lastAt: v.optional(v.number()), // Epoch milliseconds of the newest reading
+    lastRiskState: v.optional(v.string()),
+    rain: v.optional(v.object({ min: v.float64(), max: v.float64(), sum: v.float64(), last: v.float64() })),
+    soil: v.optional(v.object({ min: v.float64(), max: v.float64(), sum: v.float64(), last: v.float64() })),
+    tilt: v.optional(v.object({ min: v.float64(), max: v.float64(), sum: v.float64(), last: v.float64() })),
+    risk: v.optional(v.object({ min: v.float64(), max: v.float64(), sum: v.float64(), last: v.float64() })),
+    // Seconds spent in each riskState within the bucket (a reading's state lasts until the next reading)
+    stateSeconds: v.object({
+      Low: v.float64(),
+      Moderate: v.float64(),
+      High: v.float64(),
+      Initializing: v.float64()
+    })
+  }).index("by_device_granularity_bucket", ["deviceId", "granularity", "bucketStart"])
+    .index("by_granularity_bucket", ["granularity", "bucketStart"]),
 
   // Community reports
   reports: defineTable({
@@ -1,5 +1,8 @@
 import { v } from "convex/values";
-import { mutation, query } from "./_generated/server";
+import { paginationOptsValidator } from "convex/server";
+import { mutation, query, QueryCtx } from "./_generated/server";
+import { Id } from "./_generated/dataModel";
+import { holdsLease, partitionFor } from "./leases";
 
 // Add new sensor data from ESP32
 export const addSensorData = mutation({
@@ -21,6 +24,7 @@ export const addSensorData = mutation({
       soilMoisture: args.soilMoisture,
       tiltValue: args.tiltValue,
       processed: false,
+      partition: partitionFor(args.deviceId),
     });
 
     return id;
@@ -40,6 +44,38 @@ export const getUnprocessedData = query({
   },
 });
 
+// Get one page of unprocessed sensor data, oldest first (for Python backend).
+// Timestamp order keeps each device's readings in sequence across pages.
+export const getUnprocessedDataPage = query({
+  args: {
+    paginationOpts: paginationOptsValidator,
+  },
+  handler: async (ctx, args) => {
+    return await ctx.db
+      .query("sensorData")
+      .withIndex("by_processed_timestamp", (q) => q.eq("processed", false))
+      .order("asc")
+      .paginate(args.paginationOpts);
+  },
+});
+
+// Get one page of one partition's unprocessed sensor data, oldest first (for pollers
+// holding leases). Without `partition`, pages rows stored before partitions existed.
+export const getUnprocessedPartitionPage = query({
+  args: {
+    partition: v.optional(v.number()),
+    paginationOpts: paginationOptsValidator,
+  },
+  handler: async (ctx, args) => {
+    return await ctx.db
+      .query("sensorData")
+      .withIndex("by_processed_partition_timestamp", (q) =>
+        q.eq("processed", false).eq("partition", args.partition))
+      .order("asc")
+      .paginate(args.paginationOpts);
+  },
+});
+
 // Mark sensor data as processed
 export const markAsProcessed = mutation({
   args: {
@@ -50,63 +86,79 @@ export const markAsProcessed = mutation({
   },
 });
 
-// Add anomaly detection result
+// Fields of an anomaly detection result (shared by single and batch writes)
+const anomalyResultFields = {
+  sensorDataId: v.id("sensorData"),
+  timestamp: v.string(),
+  deviceId: v.optional(v.string()),
+  location: v.optional(v.string()),
+  rainValue: v.float64(),
+  soilMoisture: v.float64(),
+  tiltValue: v.float64(),
+  riskScore: v.float64(),
+  riskState: v.string(),
+  zScoreRain: v.float64(),
+  zScoreSoil: v.float64(),
+  zScoreTilt: v.float64(),
+  // New optional fields for hybrid approach
+  thresholdStatus: v.optional(v.object({
+    rain: v.object({
+      status: v.string(),
+      level: v.string(),
+      message: v.string()
+    }),
+    soil: v.object({
+      status: v.string(),
+      level: v.string(),
+      message: v.string()
+    }),
+    tilt: v.object({
+      status: v.string(),
+      level: v.string(),
+      message: v.string()
+    })
+  })),
+  thresholds: v.optional(v.object({
+    tilt: v.object({
+      warning: v.float64(),
+      danger: v.float64(),
+      unit: v.string()
+    }),
+    soil: v.object({
+      warning: v.float64(),
+      danger: v.float64(),
+      unit: v.string()
+    }),
+    rain: v.object({
+      warning: v.float64(),
+      danger: v.float64(),
+      unit: v.string()
+    })
+  })),
+  rollingMean: v.optional(v.object({
+    rain: v.float64(),
+    soil: v.float64(),
+    tilt: v.float64()
+  }))
+};
+
+// The result already stored for a sensorData record, if any (writes are idempotent per sensorDataId)
+async function existingResult(ctx: QueryCtx, sensorDataId: Id<"sensorData">) {
+  return await ctx.db
+    .query("anomalyResults")
+    .withIndex("by_sensor_data", (q) => q.eq("sensorDataId", sensorDataId))
+    .first();
+}
+
+// Add anomaly detection result (returns the existing result's id if the record already has one)
 export const addAnomalyResult = mutation({
-  args: {
-    sensorDataId: v.id("sensorData"),
-    timestamp: v.string(),
-    deviceId: v.optional(v.string()),
-    location: v.optional(v.string()),
-    rainValue: v.float64(),
-    soilMoisture: v.float64(),
-    tiltValue: v.float64(),
-    riskScore: v.float64(),
-    riskState: v.string(),
-    zScoreRain: v.float64(),
-    zScoreSoil: v.float64(),
-    zScoreTilt: v.float64(),
-    // New optional fields for hybrid approach
-    thresholdStatus: v.optional(v.object({
-      rain: v.object({
-        status: v.string(),
-        level: v.string(),
-        message: v.string()
-      }),
-      soil: v.object({
-        status: v.string(),
-        level: v.string(),
-        message: v.string()
-      }),
-      tilt: v.object({
-        status: v.string(),
-        level: v.string(),
-        message: v.string()
-      })
-    })),
-    thresholds: v.optional(v.object({
-      tilt: v.object({
-        warning: v.float64(),
-        danger: v.float64(),
-        unit: v.string()
-      }),
-      soil: v.object({
-        warning: v.float64(),
-        danger: v.float64(),
-        unit: v.string()
-      }),
-      rain: v.object({
-        warning: v.float64(),
-        danger: v.float64(),
-        unit: v.string()
-      })
-    })),
-    rollingMean: v.optional(v.object({
-      rain: v.float64(),
-      soil: v.float64(),
-      tilt: v.float64()
-    }))
-  },
+  args: anomalyResultFields,
   handler: async (ctx, args) => {
+    const existing = await existingResult(ctx, args.sensorDataId);
+    if (existing) {
+      return existing._id;
+    }
+
     const id = await ctx.db.insert("anomalyResults", {
       sensorDataId: args.sensorDataId,
       timestamp: args.timestamp,
@@ -129,6 +181,80 @@ export const addAnomalyResult = mutation({
   },
 });
 
+// Add many anomaly results (and mark their sensor data as processed) in one call.
+// Each record is reported separately so one bad record does not fail the batch.
+// With `leaseOwner`, records whose partition lease the caller no longer holds are
+// rejected, so a poller that lost a partition cannot write over its new owner.
+// A record that already has a result is not written twice: it is only marked
+// processed and reported with `duplicate: true` and the existing id.
+export const addAnomalyResultsBatch = mutation({
+  args: {
+    results: v.array(v.object(anomalyResultFields)),
+    markProcessed: v.optional(v.boolean()),
+    leaseOwner: v.optional(v.string()),
+  },
+  handler: async (ctx, args) => {
+    const markProcessed = args.markProcessed ?? true;
+    const statuses = [];
+    const leaseHeld = new Map<number, boolean>();
+
+    for (const result of args.results) {
+      try {
+        const source = await ctx.db.get(result.sensorDataId);
+        if (!source) {
+          statuses.push({ sensorDataId: result.sensorDataId, ok: false, error: "sensorData not found" });
+          continue;
+        }
+        if (args.leaseOwner !== undefined) {
+          const partition = source.partition ?? 0; // Older rows are served with partition 0
+          if (!leaseHeld.has(partition)) {
+            leaseHeld.set(partition, await holdsLease(ctx, partition, args.leaseOwner));
+          }
+          if (!leaseHeld.get(partition)) {
+            statuses.push({ sensorDataId: result.sensorDataId, ok: false, error: "lease lost" });
+            continue;
+          }
+        }
+
+        const existing = await existingResult(ctx, result.sensorDataId);
+        const id = existing ? existing._id : await ctx.db.insert("anomalyResults", result);
+        if (markProcessed && !source.processed) {
+          await ctx.db.patch(result.sensorDataId, { processed: true });
+        }
+        statuses.push(existing
+          ? { sensorDataId: result.sensorDataId, ok: true, id, duplicate: true }
+          : { sensorDataId: result.sensorDataId, ok: true, id });
+      } catch (error) {
+        statuses.push({ sensorDataId: result.sensorDataId, ok: false, error: String(error) });
+      }
+    }
+
+    return statuses;
+  },
+});
+
+// Mark many sensor data records as processed in one call
+export const markManyAsProcessed = mutation({
+  args: {
+    ids: v.array(v.id("sensorData")),
+  },
+  handler: async (ctx, args) => {
+    const statuses = [];
+
+    for (const id of args.ids) {
+      const source = await ctx.db.get(id);
+      if (!source) {
+        statuses.push({ id, ok: false, error: "sensorData not found" });
+        continue;
+      }
+      await ctx.db.patch(id, { processed: true });
+      statuses.push({ id, ok: true });
+    }
+
+    return statuses;
+  },
+});
+
 // Get latest anomaly results for dashboard
 export const getLatestResults = query({
   args: {